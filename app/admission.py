@@ -0,0 +1,284 @@
+"""
+Admission control and request deadlines for the reply endpoints.
+
+/reply and /reply/stream are admitted per request. /reply/batch admits each
+item it generates, and job workers admit each job they run, under the key of
+the client that sent it.
+
+Without a bound, every request under overload queues LLM work until upstream
+timeouts fire, and latency collapses for everyone. Instead:
+
+- At most ADMISSION_MAX_IN_FLIGHT requests run at once. Up to
+  ADMISSION_MAX_QUEUE more wait for a slot in arrival order, each for at most
+  ADMISSION_QUEUE_TIMEOUT seconds or its remaining deadline. Requests beyond
+  that are shed right away with 503 and a Retry-After estimated from recent
+  service times.
+- Each client may have at most CLIENT_MAX_IN_FLIGHT requests admitted or
+  queued; CLIENT_QUOTAS overrides the limit per key. A client over its quota
+  gets 429, so one busy client cannot take every slot. A client is identified
+  by its X-API-Key only when that key is listed in API_KEYS or CLIENT_QUOTAS,
+  and by its address otherwise. Unknown keys are ignored, so sending a new key
+  with each request does not get around the quota. The keys identify clients;
+  they do not authenticate them.
+- Every request has a deadline: REQUEST_DEADLINE seconds after arrival, or
+  sooner if the client sends X-Request-Timeout. It is kept in a context
+  variable, so the rate limiter and every LLM call below the endpoint see it.
+  Work shared by identical requests runs until the latest of their deadlines.
+  Calls get at most the remaining time as their timeout, and work that cannot
+  finish in time is rejected before it starts rather than timing out.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import Context, ContextVar, copy_context
+from typing import Any, Callable, Deque, Dict, Iterator, Mapping, Optional, Tuple
+
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "64"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "256"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "10"))
+# Off by default: without API keys every client behind a proxy shares one address
+CLIENT_MAX_IN_FLIGHT = int(os.getenv("CLIENT_MAX_IN_FLIGHT", "0"))
+# Per-key overrides, e.g. "partner-key=32,trial-key=2"
+CLIENT_QUOTAS = {
+    key.strip(): int(limit)
+    for key, _, limit in (item.partition("=") for item in os.getenv("CLIENT_QUOTAS", "").split(","))
+    if key.strip() and limit.strip()
+}
+# Keys accepted in X-API-Key besides those in CLIENT_QUOTAS, e.g. "app-key,batch-key"
+API_KEYS = {key.strip() for key in os.getenv("API_KEYS", "").split(",") if key.strip()}
+REQUEST_DEADLINE = float(os.getenv("REQUEST_DEADLINE", "60"))
+
+API_KEY_HEADER = "x-api-key"
+REQUEST_TIMEOUT_HEADER = "x-request-timeout"
+
+class Deadline:
+    """An absolute time.monotonic() by which work must finish, never later than its parent's.
+
+    `at` is None for no limit of its own.
+    """
+
+    def __init__(self, at: Optional[float], parent: Optional["Deadline"] = None):
+        self.at = at
+        self.parent = parent
+
+    def expires_at(self) -> Optional[float]:
+        parent = self.parent.expires_at() if self.parent is not None else None
+        if self.at is None or parent is None:
+            return parent if self.at is None else self.at
+        return min(self.at, parent)
+
+    def extend(self, at: Optional[float]):
+        """Give the work until `at` as well; None lifts the limit."""
+        if self.at is not None:
+            self.at = None if at is None else max(self.at, at)
+
+# Deadline of the current request
+_deadline: ContextVar[Optional[Deadline]] = ContextVar("deadline", default=None)
+
+class Overloaded(Exception):
+    """Raised when a request is shed: 429 for a client over its quota, 503 when the server is full."""
+
+    def __init__(self, message: str, retry_after: float, status_code: int = 503):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.status_code = status_code
+
+class DeadlineExceeded(Exception):
+    """Raised when the request's deadline leaves no time for the next piece of work."""
+
+    def __init__(self, message: str, retry_after: float = 1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+@contextmanager
+def deadline_scope(seconds: float) -> Iterator[None]:
+    """Give the work inside the block `seconds` to finish, or keep an earlier deadline."""
+    token = _deadline.set(Deadline(time.monotonic() + seconds, _deadline.get()))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+def current_deadline() -> Optional[float]:
+    """The time.monotonic() the current request must be answered by, or None without a deadline."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline.expires_at()
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current request's deadline, or None without one."""
+    deadline = current_deadline()
+    return None if deadline is None else deadline - time.monotonic()
+
+def shared_deadline() -> Tuple[Context, Deadline]:
+    """A context for work shared by several requests, and the deadline it runs under.
+
+    The deadline starts as the current request's. Extend it with the deadline
+    of every request that joins, so the work stops once the last one gives up.
+    """
+    deadline = Deadline(current_deadline())
+    context = copy_context()
+    context.run(_deadline.set, deadline)
+    return context, deadline
+
+def call_timeout(limit: float, what: str = "call") -> float:
+    """A call's timeout: its own limit, cut to the time the request has left."""
+    budget = remaining_time()
+    if budget is None:
+        return limit
+    if budget <= 0:
+        raise DeadlineExceeded(f"Request deadline expired before the {what}")
+    return min(limit, budget)
+
+def request_deadline(headers: Mapping[str, str]) -> float:
+    """REQUEST_DEADLINE, or the shorter X-Request-Timeout the client asked for."""
+    try:
+        requested = float(headers.get(REQUEST_TIMEOUT_HEADER, ""))
+    except ValueError:
+        return REQUEST_DEADLINE
+    return min(REQUEST_DEADLINE, requested) if requested > 0 else REQUEST_DEADLINE
+
+def client_key(headers: Mapping[str, str], address: Optional[str]) -> str:
+    """The configured API key a request was sent with, or the client's address otherwise."""
+    key = headers.get(API_KEY_HEADER)
+    if key and (key in API_KEYS or key in CLIENT_QUOTAS):
+        return key
+    return address or "unknown"
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT,
+        client_limit: int = CLIENT_MAX_IN_FLIGHT,
+        client_limits: Optional[Dict[str, int]] = None
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.client_limit = client_limit
+        self.client_limits = CLIENT_QUOTAS if client_limits is None else client_limits
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._clients: Dict[str, int] = {}
+        # Moving average of how long an admitted request holds its slot
+        self.service_time = 1.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {"client_quota": 0, "queue_full": 0, "queue_timeout": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_in_flight > 0
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    def retry_after(self) -> float:
+        """Roughly how long until the requests ahead of a new one have been served."""
+        slots = max(self.max_in_flight, 1)
+        return max(1.0, self.service_time * (self.waiting + slots) / slots)
+
+    def client_quota(self, client: str) -> int:
+        """Most requests the client may have admitted or queued at once; 0 for no limit."""
+        return self.client_limits.get(client, self.client_limit)
+
+    async def _acquire_slot(self):
+        if not self.enabled:
+            return
+        if self.in_flight < self.max_in_flight and not self.waiting:
+            self.in_flight += 1
+            return
+        if self.waiting >= self.max_queue:
+            self.rejected["queue_full"] += 1
+            raise Overloaded("Server is overloaded, try again later", self.retry_after())
+        budget = remaining_time()
+        timeout = self.queue_timeout if budget is None else min(self.queue_timeout, budget)
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            # The slot is handed over by _release_slot, so in_flight already counts it
+            await asyncio.wait_for(waiter, max(timeout, 0))
+        except asyncio.TimeoutError:
+            self.rejected["queue_timeout"] += 1
+            raise Overloaded("Server is overloaded, no capacity freed up in time", self.retry_after())
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            raise
+
+    def _release_slot(self):
+        if not self.enabled:
+            return
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def _release_client(self, client: str):
+        self._clients[client] -= 1
+        if not self._clients[client]:
+            del self._clients[client]
+
+    async def acquire(self, client: str) -> Callable[[], None]:
+        """Take one of the client's and one of the server's slots; the returned function gives them back."""
+        limit = self.client_quota(client)
+        active = self._clients.get(client, 0)
+        if limit > 0 and active >= limit:
+            self.rejected["client_quota"] += 1
+            raise Overloaded(
+                f"Too many concurrent requests: at most {limit} per client", max(1.0, self.service_time), status_code=429
+            )
+        self._clients[client] = active + 1
+        try:
+            await self._acquire_slot()
+        except BaseException:
+            self._release_client(client)
+            raise
+        self.admitted += 1
+        start = time.monotonic()
+        released = False
+
+        def release():
+            nonlocal released
+            if released:
+                return
+            released = True
+            self.service_time += 0.1 * (time.monotonic() - start - self.service_time)
+            self._release_slot()
+            self._release_client(client)
+
+        return release
+
+    @asynccontextmanager
+    async def admit(self, client: str):
+        """Hold one of the client's and one of the server's slots for the duration of the block."""
+        release = await self.acquire(client)
+        try:
+            yield
+        finally:
+            release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "clients": len(self._clients),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": dict(self.rejected),
+            "service_time": self.service_time,
+        }
+
+# Create a singleton instance
+admission = AdmissionController()
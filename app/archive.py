@@ -0,0 +1,157 @@
+"""
+Archival of aged replies to Parquet, and migration to the compact format.
+
+`archive` moves replies older than a cutoff out of Mongo, oldest first, one
+chunk at a time. Each chunk becomes its own compressed Parquet file, named
+after the time range it covers, and is deleted from Mongo only once the file
+is complete, so a crash at worst archives a chunk twice. With the compact
+format, post bodies no longer referenced by any reply are removed as well.
+Run it regularly with an age below REPLY_TTL_DAYS, so replies are archived
+before Mongo expires them.
+
+`compact` rewrites replies stored in the full format into the compact format,
+keeping their ids. Run it once after switching REPLY_STORAGE_FORMAT to
+compact; until then, older replies are missing from GET /replies.
+
+Usage:
+    python -m app.archive archive --older-than-days 30 --output archive/
+    python -m app.archive compact
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+import pandas as pd
+from pymongo import ASCENDING, ReplaceOne
+from . import database
+from .database import (
+    compact_reply_doc, expand_reply_doc, find_post_texts, posts_collection, replies_collection, upsert_posts
+)
+
+ARCHIVE_CHUNK_SIZE = int(os.getenv("ARCHIVE_CHUNK_SIZE", "10000"))
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+
+ARCHIVE_COLUMNS = ["id", "platform", "post_text", "generated_reply", "timestamp", "post_hash", "variants"]
+
+def to_frame(docs: List[Dict[str, Any]]) -> pd.DataFrame:
+    """Reply documents in the full format as an archive table."""
+    rows = [{
+        "id": str(doc["_id"]),
+        "platform": doc.get("platform"),
+        "post_text": doc.get("post_text"),
+        "generated_reply": doc.get("generated_reply"),
+        "timestamp": doc.get("timestamp"),
+        "post_hash": doc.get("post_hash"),
+        # JSON keeps the column type the same whether or not a chunk has variants
+        "variants": json.dumps(doc["variants"]) if doc.get("variants") else None,
+    } for doc in docs]
+    frame = pd.DataFrame(rows, columns=ARCHIVE_COLUMNS)
+    # isoformat() drops the microseconds when they are zero, so precision varies by row
+    frame["timestamp"] = pd.to_datetime(frame["timestamp"], format="ISO8601")
+    return frame
+
+def write_parquet(frame: pd.DataFrame, path: str, compression: str):
+    """Write the file atomically so a crash never leaves a partial archive."""
+    tmp_path = f"{path}.tmp"
+    frame.to_parquet(tmp_path, index=False, compression=compression)
+    os.replace(tmp_path, path)
+
+async def _prune_posts(hashes: List[bytes]):
+    """Delete the post bodies no reply refers to any more."""
+    referenced = set(await replies_collection.distinct("h", {"h": {"$in": hashes}}))
+    orphans = [digest for digest in hashes if digest not in referenced]
+    if orphans:
+        await posts_collection.delete_many({"_id": {"$in": orphans}})
+
+async def archive_replies(
+    output_dir: str,
+    older_than: timedelta,
+    chunk_size: int = ARCHIVE_CHUNK_SIZE,
+    compression: str = ARCHIVE_COMPRESSION
+) -> Dict[str, int]:
+    """Move replies older than `older_than` into Parquet files under `output_dir`."""
+    compact = database.REPLY_STORAGE_FORMAT == "compact"
+    cutoff = datetime.utcnow() - older_than
+    timestamp = "t" if compact else "timestamp"
+    query = {timestamp: {"$lt": cutoff if compact else cutoff.isoformat()}}
+    os.makedirs(output_dir, exist_ok=True)
+
+    stats = {"replies": 0, "files": 0}
+    while True:
+        docs = await replies_collection.find(query).sort(
+            [(timestamp, ASCENDING), ("_id", ASCENDING)]
+        ).limit(chunk_size).to_list(length=chunk_size)
+        if not docs:
+            return stats
+        stored = docs
+        if compact:
+            texts = await find_post_texts(doc["h"] for doc in docs)
+            docs = [expand_reply_doc(doc, texts) for doc in docs]
+
+        frame = to_frame(docs)
+        first, last = frame["timestamp"].min(), frame["timestamp"].max()
+        name = f"replies-{first:%Y%m%dT%H%M%S}-{last:%Y%m%dT%H%M%S}-{docs[0]['_id']}.parquet"
+        await asyncio.to_thread(write_parquet, frame, os.path.join(output_dir, name), compression)
+
+        await replies_collection.delete_many({"_id": {"$in": [doc["_id"] for doc in stored]}})
+        if compact:
+            await _prune_posts(list({doc["h"] for doc in stored}))
+        stats["replies"] += len(docs)
+        stats["files"] += 1
+        print(f"Archived {stats['replies']} replies to {stats['files']} files")
+
+async def compact_replies(chunk_size: int = ARCHIVE_CHUNK_SIZE) -> int:
+    """Rewrite full-format replies into the compact format, in _id order."""
+    converted = 0
+    query: Dict[str, Any] = {"post_text": {"$exists": True}}
+    while True:
+        docs = await replies_collection.find(query).sort("_id", ASCENDING).limit(chunk_size).to_list(length=chunk_size)
+        if not docs:
+            return converted
+        replies, posts = zip(*(compact_reply_doc(doc) for doc in docs))
+        # Posts first, so a converted reply never points at a missing body
+        await upsert_posts(posts_collection, list(posts))
+        await replies_collection.bulk_write(
+            [ReplaceOne({"_id": reply["_id"]}, reply) for reply in replies], ordered=False
+        )
+        converted += len(docs)
+        query["_id"] = {"$gt": docs[-1]["_id"]}
+        print(f"Converted {converted} replies")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Archive aged replies or convert them to the compact format")
+    commands = parser.add_subparsers(dest="command", required=True)
+    archive = commands.add_parser("archive", help="Move aged replies to Parquet files")
+    archive.add_argument("--older-than-days", type=float, required=True, help="Archive replies older than this")
+    archive.add_argument("--output", default="archive", help="Directory the Parquet files are written to")
+    archive.add_argument("--chunk-size", type=int, default=ARCHIVE_CHUNK_SIZE, help="Replies per Parquet file")
+    archive.add_argument("--compression", default=ARCHIVE_COMPRESSION, help="Parquet codec: zstd, snappy, gzip or none")
+    compact = commands.add_parser("compact", help="Convert full-format replies to the compact format")
+    compact.add_argument("--chunk-size", type=int, default=ARCHIVE_CHUNK_SIZE, help="Replies converted per bulk write")
+    args = parser.parse_args(argv)
+
+    async def run():
+        try:
+            if args.command == "archive":
+                stats = await archive_replies(
+                    args.output,
+                    timedelta(days=args.older_than_days),
+                    chunk_size=args.chunk_size,
+                    compression=None if args.compression == "none" else args.compression
+                )
+                print(f"Done: archived {stats['replies']} replies to {stats['files']} files")
+            else:
+                converted = await compact_replies(chunk_size=args.chunk_size)
+                print(f"Done: converted {converted} replies")
+        finally:
+            database.close_client()
+
+    asyncio.run(run())
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+"""
+Cross-process coordination for multi-worker deployments.
+
+Under gunicorn every worker process has its own singletons: rate limiters,
+caches and metrics. Left alone, N workers would each spend the whole provider
+quota and expose only their own counters. The coordinator shares that state
+through a small Mongo collection that all workers (and standalone job
+workers) already reach:
+
+- Every worker upserts a heartbeat document every COORDINATION_INTERVAL
+  seconds. Documents expire after COORDINATION_TTL, so dead workers drop out.
+- Each worker sets its rate limiters to 1/N of the quota, where N is the
+  number of live workers. A pause after a provider 429 is published in the
+  heartbeat and adopted by every other worker on its next beat.
+- The heartbeat also carries the worker's metrics exposition. /metrics merges
+  the expositions of all live workers, so any worker can answer a scrape.
+
+The reply cache is shared through its Mongo tier, which multi-worker mode
+turns on by default (REPLY_CACHE_SHARED).
+"""
+
+import asyncio
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+from .database import coordination_collection
+from .metrics import merge_expositions, sample_lines
+
+# gunicorn.conf.py exports WEB_CONCURRENCY so workers know they are not alone
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+MULTI_WORKER = WEB_CONCURRENCY > 1
+
+def coordination_enabled(default: bool) -> bool:
+    """WORKER_COORDINATION when it is set, `default` otherwise."""
+    return os.getenv("WORKER_COORDINATION", "true" if default else "false").lower() == "true"
+
+# API processes coordinate when gunicorn runs several of them
+WORKER_COORDINATION = coordination_enabled(MULTI_WORKER)
+COORDINATION_INTERVAL = float(os.getenv("COORDINATION_INTERVAL", "2"))
+COORDINATION_TTL = float(os.getenv("COORDINATION_TTL", "10"))
+
+class WorkerCoordinator:
+    def __init__(self, collection: Any, interval: float = COORDINATION_INTERVAL, ttl: float = COORDINATION_TTL):
+        self.collection = collection
+        self.interval = interval
+        self.ttl = ttl
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.limiters: List[Any] = []
+        self.render_metrics: Optional[Callable[[], str]] = None
+        self.workers = 1
+        self.beats = 0
+        self.errors = 0
+        self._task: Optional[asyncio.Task] = None
+        self._index_ready = False
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def _pauses(self) -> List[float]:
+        """Each limiter's pause as wall-clock time, since monotonic clocks differ between processes."""
+        now = time.time()
+        return [now + max(0.0, limiter.paused_until - limiter.clock()) for limiter in self.limiters]
+
+    async def beat(self):
+        """Publish this worker's state and adopt the cluster's."""
+        if not self._index_ready:
+            await self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._index_ready = True
+        now = datetime.utcnow()
+        await self.collection.update_one(
+            {"_id": self.worker_id},
+            {"$set": {
+                "heartbeat": now,
+                "expires_at": now + timedelta(seconds=self.ttl),
+                "paused_until": self._pauses(),
+                "metrics": self.render_metrics() if self.render_metrics else "",
+            }},
+            upsert=True
+        )
+        live = await self.collection.find(
+            {"heartbeat": {"$gt": now - timedelta(seconds=self.ttl)}}, {"paused_until": 1}
+        ).to_list(length=None)
+        self.workers = max(1, len(live))
+        wall = time.time()
+        for index, limiter in enumerate(self.limiters):
+            limiter.set_share(1 / self.workers)
+            pauses = [doc["paused_until"][index] for doc in live if len(doc.get("paused_until") or []) > index]
+            until = max(pauses, default=0.0)
+            if until > wall:
+                limiter.pause(until - wall)
+        self.beats += 1
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.beat()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep serving with the last known share; the next beat retries
+                self.errors += 1
+                print(f"Warning: worker coordination failed: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self, limiters: List[Any], render_metrics: Optional[Callable[[], str]] = None):
+        """Join the cluster and keep the limiters' share up to date."""
+        if self._task is not None:
+            return
+        self.limiters = limiters
+        self.render_metrics = render_metrics
+        try:
+            await self.beat()
+        except Exception as e:
+            self.errors += 1
+            print(f"Warning: worker coordination failed: {str(e)}")
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        """Leave the cluster so the remaining workers take over its share on their next beat."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self.collection.delete_one({"_id": self.worker_id})
+        except Exception:
+            pass
+
+    async def cluster_metrics(self, local: str) -> str:
+        """Merge this worker's fresh exposition with the last published one of every other live worker."""
+        since = datetime.utcnow() - timedelta(seconds=self.ttl)
+        docs = await self.collection.find(
+            {"_id": {"$ne": self.worker_id}, "heartbeat": {"$gt": since}}, {"metrics": 1}
+        ).to_list(length=None)
+        merged = merge_expositions([local] + [doc.get("metrics") or "" for doc in docs])
+        return merged + "\n".join(sample_lines(
+            "socialpilot_cluster_workers", "Worker processes in the cluster, including this one", {(): len(docs) + 1}
+        )) + "\n"
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.running,
+            "worker_id": self.worker_id,
+            "workers": self.workers,
+            "share": 1 / self.workers,
+            "beats": self.beats,
+            "errors": self.errors,
+        }
+
+# Create a singleton instance
+coordinator = WorkerCoordinator(coordination_collection)
@@ -1,31 +1,444 @@
 from motor.motor_asyncio import AsyncIOMotorClient # type: ignore
-from pymongo import MongoClient
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import base64
+import json
 import os
+import time
+from bson import ObjectId
+from bson.errors import InvalidId
 from dotenv import load_dotenv
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from .write_buffer import WriteBehindBuffer, raise_unless_duplicates
+from .metrics import stage_timer
+from .text import post_hash
 
 load_dotenv()
 
 MONGODB_URI = os.getenv("MONGODB_URI", "mongodb://localhost:27017")
 DATABASE_NAME = "social_reply_generator"
 
-# Async client for FastAPI endpoints
-async_client = AsyncIOMotorClient(MONGODB_URI)
-async_db = async_client[DATABASE_NAME]
+# Connection pool of the Mongo client, created on first use
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "60000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "5000"))
 
-# Sync client for background tasks
-sync_client = MongoClient(MONGODB_URI)
-sync_db = sync_client[DATABASE_NAME]
+# Write-behind buffering of reply inserts
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "true").lower() == "true"
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "100"))
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", "0.5"))
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "10000"))
+# Each process spills to its own file next to these, e.g. spill/replies.<pid>.jsonl
+WRITE_SPILL_PATH = os.getenv("WRITE_SPILL_PATH", "spill/replies.jsonl")
+WRITE_POSTS_SPILL_PATH = os.getenv("WRITE_POSTS_SPILL_PATH", "spill/posts.jsonl")
+
+# Layout of stored replies. "full" keeps every field under its API name, with
+# the post text in each reply and the timestamp as an ISO string. "compact"
+# stores each post body once in the posts collection, keyed by the binary hash
+# of its normalized text, and keeps replies small: short field names, a binary
+# post hash and a native date, which also allows a TTL index.
+REPLY_STORAGE_FORMATS = ("full", "compact")
+REPLY_STORAGE_FORMAT = os.getenv("REPLY_STORAGE_FORMAT", "full")
+if REPLY_STORAGE_FORMAT not in REPLY_STORAGE_FORMATS:
+    raise ValueError(
+        f"Unknown REPLY_STORAGE_FORMAT '{REPLY_STORAGE_FORMAT}', expected one of {', '.join(REPLY_STORAGE_FORMATS)}"
+    )
+# Days Mongo keeps compact replies before deleting them (0 keeps them forever).
+# Post bodies expire STORED_POSTS_TTL seconds after the newest reply to them.
+# Archive older replies with python -m app.archive before they expire.
+REPLY_TTL_DAYS = float(os.getenv("REPLY_TTL_DAYS", "0"))
+# Seconds a post body is known to be stored, so replies to hot posts do not resend it
+STORED_POSTS_TTL = float(os.getenv("STORED_POSTS_TTL", "3600"))
+STORED_POSTS_MAX = int(os.getenv("STORED_POSTS_MAX", "10000"))
+
+# Stored names of reply fields in the compact format; post_text lives in posts
+COMPACT_FIELDS = {"platform": "p", "post_hash": "h", "generated_reply": "r", "timestamp": "t", "variants": "v"}
+
+# Page size limits for reading replies back
+REPLIES_PAGE_SIZE = int(os.getenv("REPLIES_PAGE_SIZE", "50"))
+REPLIES_MAX_PAGE_SIZE = int(os.getenv("REPLIES_MAX_PAGE_SIZE", "500"))
+
+# Fields that can be requested from GET /replies
+REPLY_FIELDS = ("platform", "post_text", "generated_reply", "timestamp", "post_hash", "variants")
+
+# The async client is created on first use rather than at import time, so
+# importing the app (tests, CLI tools, pre-fork servers) opens no sockets and
+# starts no monitor threads. The app lifespan closes it on shutdown.
+_client: Optional[AsyncIOMotorClient] = None
+
+def get_client() -> AsyncIOMotorClient:
+    """Return the shared Mongo client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(
+            MONGODB_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS
+        )
+    return _client
+
+def set_client(client: Any):
+    """Use a prebuilt client (e.g. an in-memory stand-in) instead of connecting to MONGODB_URI."""
+    global _client
+    _client = client
+
+def close_client():
+    """Close the shared Mongo client; the next use creates a new one."""
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
+
+async def ping() -> None:
+    """Round-trip to Mongo, raising if it cannot be reached."""
+    await get_client().admin.command("ping")
+
+class LazyCollection:
+    """Collection handle that resolves the shared client only when used."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(get_client()[DATABASE_NAME][self.name], attr)
 
 # Collection for storing replies
-replies_collection = async_db.replies
+replies_collection = LazyCollection("replies")
 
-async def store_reply(platform: str, post_text: str, generated_reply: str, timestamp: str):
-    """Store a generated reply in the database."""
-    reply_doc = {
+# Post bodies of compact replies, keyed by the hash of the normalized text
+posts_collection = LazyCollection("posts")
+
+# Collection backing the shared reply cache tier
+reply_cache_collection = LazyCollection("reply_cache")
+
+# Collection holding queued reply jobs and their status
+jobs_collection = LazyCollection("jobs")
+
+# Heartbeats and shared state of the worker processes in a multi-worker deployment
+coordination_collection = LazyCollection("coordination")
+
+# Background writer for replies; started and flushed by the app lifespan
+reply_writer = WriteBehindBuffer(
+    replies_collection,
+    batch_size=WRITE_BATCH_SIZE,
+    flush_interval=WRITE_FLUSH_INTERVAL,
+    max_queue=WRITE_QUEUE_SIZE,
+    spill_path=WRITE_SPILL_PATH
+)
+
+async def upsert_posts(collection: Any, post_docs: List[Dict[str, Any]]):
+    """Insert post bodies; a post already stored keeps its text and takes the newer `t`.
+
+    `t` follows the newest reply written with the post, so the TTL index on
+    posts only expires bodies that no live reply refers to.
+    """
+    newest: Dict[bytes, Dict[str, Any]] = {}
+    for doc in post_docs:
+        if doc["_id"] not in newest or doc["t"] > newest[doc["_id"]]["t"]:
+            newest[doc["_id"]] = doc
+    try:
+        await collection.bulk_write([
+            UpdateOne({"_id": doc["_id"]}, {"$setOnInsert": {"x": doc["x"]}, "$max": {"t": doc["t"]}}, upsert=True)
+            for doc in newest.values()
+        ], ordered=False)
+    except BulkWriteError as e:
+        # Concurrent upserts of a new post: one of them inserted it
+        raise_unless_duplicates(e)
+
+# Background writer for the post bodies of compact replies
+post_writer = WriteBehindBuffer(
+    posts_collection,
+    batch_size=WRITE_BATCH_SIZE,
+    flush_interval=WRITE_FLUSH_INTERVAL,
+    max_queue=WRITE_QUEUE_SIZE,
+    spill_path=WRITE_POSTS_SPILL_PATH,
+    write=upsert_posts
+)
+
+# Post hash -> monotonic time its body was last written
+_stored_posts: "OrderedDict[bytes, float]" = OrderedDict()
+
+def _compact() -> bool:
+    return REPLY_STORAGE_FORMAT == "compact"
+
+def _stored(field: str) -> str:
+    """Name of a reply field in the configured storage format."""
+    return COMPACT_FIELDS.get(field, field) if _compact() else field
+
+def build_reply_doc(
+    platform: str, post_text: str, generated_reply: str, timestamp: str,
+    variants: Optional[List[Dict[str, Any]]] = None
+) -> Dict[str, Any]:
+    """Build the document stored for a generated reply.
+
+    Ranked candidates, when several were requested, are kept in the same document.
+    """
+    doc = {
         "platform": platform,
         "post_text": post_text,
         "generated_reply": generated_reply,
-        "timestamp": timestamp
+        "timestamp": timestamp,
+        "post_hash": post_hash(post_text)
     }
-    await replies_collection.insert_one(reply_doc)
-    return reply_doc 
\ No newline at end of file
+    if variants:
+        doc["variants"] = variants
+    return doc
+
+def compact_reply_doc(doc: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """Split a full reply document into its compact reply and post documents."""
+    digest = bytes.fromhex(doc.get("post_hash") or post_hash(doc["post_text"]))
+    timestamp = doc["timestamp"]
+    timestamp = _utc_naive(timestamp if isinstance(timestamp, datetime) else datetime.fromisoformat(timestamp))
+    reply = {"p": doc["platform"], "h": digest, "r": doc["generated_reply"], "t": timestamp}
+    if "_id" in doc:
+        reply["_id"] = doc["_id"]
+    if doc.get("variants"):
+        reply["v"] = [{"r": variant["reply"], "s": variant["score"]} for variant in doc["variants"]]
+    return reply, {"_id": digest, "x": doc["post_text"], "t": timestamp}
+
+def expand_reply_doc(doc: Dict[str, Any], post_texts: Dict[bytes, str]) -> Dict[str, Any]:
+    """A compact reply document under the full format's field names."""
+    expanded = {field: doc[short] for field, short in COMPACT_FIELDS.items() if short in doc}
+    expanded["_id"] = doc.get("_id")
+    if "h" in doc:
+        expanded["post_hash"] = doc["h"].hex()
+        expanded["post_text"] = post_texts.get(doc["h"])
+    if "t" in doc:
+        expanded["timestamp"] = doc["t"].isoformat()
+    if "v" in doc:
+        expanded["variants"] = [{"reply": variant["r"], "score": variant["s"]} for variant in doc["v"]]
+    return expanded
+
+async def find_post_texts(hashes: Iterable[bytes]) -> Dict[bytes, str]:
+    """The post bodies stored under the given hashes."""
+    unique = list(set(hashes))
+    if not unique:
+        return {}
+    docs = await posts_collection.find({"_id": {"$in": unique}}, {"x": 1}).to_list(length=len(unique))
+    return {doc["_id"]: doc["x"] for doc in docs}
+
+async def _store_posts(post_docs: List[Dict[str, Any]]):
+    """Write the post bodies that were not written in the last STORED_POSTS_TTL seconds."""
+    now = time.monotonic()
+    new: Dict[bytes, Dict[str, Any]] = {}
+    for doc in post_docs:
+        written = _stored_posts.get(doc["_id"])
+        if written is None or now - written >= STORED_POSTS_TTL:
+            new.setdefault(doc["_id"], doc)
+    if not new:
+        return
+    if post_writer.running:
+        await post_writer.put_many(list(new.values()))
+    else:
+        await upsert_posts(posts_collection, list(new.values()))
+    for digest in new:
+        _stored_posts.pop(digest, None)
+        _stored_posts[digest] = now
+    while len(_stored_posts) > STORED_POSTS_MAX:
+        _stored_posts.popitem(last=False)
+
+async def ensure_reply_indexes():
+    """Create the indexes backing reply queries; a no-op when they already exist.
+
+    Every index ends in (timestamp, _id) descending so filtered scans are
+    returned in keyset order without an in-memory sort.
+    """
+    timestamp = _stored("timestamp")
+    await replies_collection.create_index(
+        [(timestamp, DESCENDING), ("_id", DESCENDING)], name="timestamp_id"
+    )
+    await replies_collection.create_index(
+        [(_stored("platform"), ASCENDING), (timestamp, DESCENDING), ("_id", DESCENDING)], name="platform_timestamp_id"
+    )
+    await replies_collection.create_index(
+        [(_stored("post_hash"), ASCENDING), (timestamp, DESCENDING), ("_id", DESCENDING)], name="post_hash_timestamp_id"
+    )
+    if _compact():
+        await _ensure_ttl_indexes()
+
+async def _ensure_ttl_indexes():
+    """Expire compact replies after REPLY_TTL_DAYS, and post bodies once no reply can refer to them."""
+    seconds = int(REPLY_TTL_DAYS * 86400) if REPLY_TTL_DAYS > 0 else 0
+    await _ensure_ttl_index(replies_collection, "reply_ttl", seconds)
+    # A post's t trails its newest reply by at most STORED_POSTS_TTL, see _store_posts
+    await _ensure_ttl_index(posts_collection, "post_ttl", seconds + int(STORED_POSTS_TTL) if seconds else 0)
+
+async def _ensure_ttl_index(collection: Any, name: str, seconds: int):
+    """A TTL index on `t`, following changes to its expiry; dropped when `seconds` is 0."""
+    if seconds <= 0:
+        try:
+            await collection.drop_index(name)
+        except OperationFailure:
+            pass
+        return
+    try:
+        await collection.create_index("t", name=name, expireAfterSeconds=seconds)
+    except OperationFailure:
+        # The index exists with another expiry; change it in place
+        await get_client()[DATABASE_NAME].command(
+            "collMod", collection.name, index={"name": name, "expireAfterSeconds": seconds}
+        )
+
+def _utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _utc_isoformat(value: datetime) -> str:
+    return _utc_naive(value).isoformat()
+
+def encode_cursor(doc: Dict[str, Any]) -> str:
+    """Opaque cursor pointing just after the stored `doc` in (timestamp, _id) descending order."""
+    timestamp = doc[_stored("timestamp")]
+    if isinstance(timestamp, datetime):
+        timestamp = timestamp.isoformat()
+    payload = json.dumps({"t": timestamp, "id": str(doc["_id"])})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        timestamp = datetime.fromisoformat(payload["t"]) if _compact() else payload["t"]
+        return {"timestamp": timestamp, "_id": ObjectId(payload["id"])}
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise ValueError("Invalid cursor")
+
+async def find_replies(
+    platform: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    post_text: Optional[str] = None,
+    fields: Optional[List[str]] = None,
+    limit: int = REPLIES_PAGE_SIZE,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """Read stored replies newest first, one keyset-paginated page at a time.
+
+    Pages continue from the (timestamp, _id) of the previous page's last reply
+    rather than skipping over earlier ones, so every page costs the same no
+    matter how deep the scan goes.
+    """
+    compact = _compact()
+    fields = fields or list(REPLY_FIELDS)
+    timestamp = _stored("timestamp")
+    query: Dict[str, Any] = {}
+    if platform:
+        query[_stored("platform")] = platform
+    if post_text:
+        digest = post_hash(post_text)
+        query[_stored("post_hash")] = bytes.fromhex(digest) if compact else digest
+    # Full-format timestamps are naive UTC ISO strings, which sort like the datetimes they encode
+    if since or until:
+        bound = _utc_naive if compact else _utc_isoformat
+        query[timestamp] = {}
+        if since:
+            query[timestamp]["$gte"] = bound(since)
+        if until:
+            query[timestamp]["$lt"] = bound(until)
+    if cursor:
+        after = decode_cursor(cursor)
+        query["$or"] = [
+            {timestamp: {"$lt": after["timestamp"]}},
+            {timestamp: after["timestamp"], "_id": {"$lt": after["_id"]}}
+        ]
+
+    # Always fetch the sort keys so the next cursor can be built
+    projection = {_stored(field): 1 for field in fields}
+    projection[timestamp] = 1
+    if compact and "post_text" in fields:
+        # Post bodies live in the posts collection, found by hash
+        del projection["post_text"]
+        projection["h"] = 1
+    limit = max(1, min(limit, REPLIES_MAX_PAGE_SIZE))
+
+    with stage_timer("mongo"):
+        docs = await replies_collection.find(query, projection).sort(
+            [(timestamp, DESCENDING), ("_id", DESCENDING)]
+        ).limit(limit + 1).to_list(length=limit + 1)
+        next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+        docs = docs[:limit]
+        if compact:
+            # One lookup per page for the post bodies
+            texts = await find_post_texts(doc["h"] for doc in docs) if "post_text" in fields else {}
+            docs = [expand_reply_doc(doc, texts) for doc in docs]
+
+    items = []
+    for doc in docs:
+        item = {"id": str(doc["_id"])}
+        item.update({field: doc.get(field) for field in fields})
+        items.append(item)
+    return {"items": items, "next_cursor": next_cursor}
+
+async def find_recent_replies(limit: int) -> List[Dict[str, Any]]:
+    """The newest stored replies, newest first, with the fields needed to match posts."""
+    fields = ("platform", "post_text", "generated_reply")
+    timestamp = _stored("timestamp")
+    with stage_timer("mongo"):
+        docs = await replies_collection.find(
+            {}, {_stored(field): 1 for field in fields}
+        ).sort([(timestamp, DESCENDING), ("_id", DESCENDING)]).limit(limit).to_list(length=limit)
+        if _compact():
+            texts = await find_post_texts(doc["h"] for doc in docs)
+            docs = [expand_reply_doc(doc, texts) for doc in docs]
+    return docs
+
+async def store_reply(
+    platform: str, post_text: str, generated_reply: str, timestamp: str,
+    variants: Optional[List[Dict[str, Any]]] = None
+):
+    """Store a generated reply in the database."""
+    reply_doc = build_reply_doc(platform, post_text, generated_reply, timestamp, variants)
+    stored = reply_doc
+    with stage_timer("mongo"):
+        if _compact():
+            stored, post_doc = compact_reply_doc(reply_doc)
+            await _store_posts([post_doc])
+        if reply_writer.running:
+            # Hand off to the write-behind buffer instead of waiting on Mongo
+            await reply_writer.put(stored)
+        else:
+            await replies_collection.insert_one(stored)
+    reply_doc["_id"] = stored["_id"]
+    return reply_doc
+
+async def store_replies(reply_docs: List[Dict[str, Any]]):
+    """Store many generated replies with a single bulk write."""
+    stored = reply_docs
+    with stage_timer("mongo"):
+        if _compact() and reply_docs:
+            stored, post_docs = zip(*(compact_reply_doc(doc) for doc in reply_docs))
+            stored = list(stored)
+            await _store_posts(list(post_docs))
+        if reply_writer.running:
+            await reply_writer.put_many(stored)
+        elif stored:
+            await replies_collection.insert_many(stored, ordered=False)
+    for doc, stored_doc in zip(reply_docs, stored):
+        doc["_id"] = stored_doc["_id"]
+    return reply_docs
+
+async def ensure_reply_cache_index():
+    """Let Mongo expire shared cache entries once their TTL has passed."""
+    await reply_cache_collection.create_index("expires_at", expireAfterSeconds=0)
+
+async def get_cached_reply(key: str) -> Optional[str]:
+    """Fetch a cached reply from the shared tier if it has not expired."""
+    doc = await reply_cache_collection.find_one(
+        {"_id": key, "expires_at": {"$gt": datetime.utcnow()}}
+    )
+    return doc["reply"] if doc else None
+
+async def store_cached_reply(key: str, reply: str, ttl_seconds: float):
+    """Store or refresh a reply in the shared cache tier."""
+    await reply_cache_collection.update_one(
+        {"_id": key},
+        {"$set": {"reply": reply, "expires_at": datetime.utcnow() + timedelta(seconds=ttl_seconds)}},
+        upsert=True
+    )
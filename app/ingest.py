@@ -0,0 +1,182 @@
+"""
+Bulk reply generation for a whole CSV or Excel dataset.
+
+The input file is streamed in chunks, so memory stays flat regardless of file
+size. Each chunk is sent through ReplyService.generate_and_store_replies, which
+generates replies with a bounded pool of concurrent workers and stores the whole
+chunk in Mongo with one bulk write. Results are appended to an output CSV with
+the original columns plus reply, error and timestamp columns.
+
+After every chunk a checkpoint records how many input rows are done and how long
+the output file was at that point. A crashed run started again with the same
+arguments truncates any partially written output and resumes from the next
+unprocessed row.
+
+Usage:
+    python -m app.ingest "datasets/posts - Sheet1.csv" --output results/replies.csv
+    python -m app.ingest posts.xlsx --output replies.csv --chunk-size 200 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+from typing import Any, Dict, Iterator, List, Optional
+import pandas as pd
+from openpyxl import load_workbook
+from pydantic import ValidationError
+from .models import ReplyRequest
+from .services.llm_service import llm_service
+from .services.reply_service import reply_service
+
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "100"))
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "8"))
+
+OUTPUT_COLUMNS = ["reply", "error", "timestamp"]
+
+def iter_chunks(path: str, chunk_size: int, skip_rows: int = 0) -> Iterator[List[Dict[str, Any]]]:
+    """Yield the rows of a CSV or XLSX file in chunks, skipping rows already processed."""
+    if path.lower().endswith((".xlsx", ".xlsm")):
+        yield from _iter_xlsx_chunks(path, chunk_size, skip_rows)
+        return
+    reader = pd.read_csv(
+        path,
+        chunksize=chunk_size,
+        dtype=str,
+        keep_default_na=False,
+        skiprows=range(1, skip_rows + 1)
+    )
+    for chunk in reader:
+        yield chunk.to_dict("records")
+
+def _iter_xlsx_chunks(path: str, chunk_size: int, skip_rows: int) -> Iterator[List[Dict[str, Any]]]:
+    workbook = load_workbook(path, read_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(name) for name in next(rows)]
+        chunk = []
+        for index, values in enumerate(rows):
+            if index < skip_rows:
+                continue
+            chunk.append({name: ("" if value is None else str(value)) for name, value in zip(header, values)})
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    finally:
+        workbook.close()
+
+def load_checkpoint(path: str) -> Dict[str, Any]:
+    if not os.path.exists(path):
+        return {"rows_done": 0, "output_bytes": 0}
+    with open(path) as f:
+        return json.load(f)
+
+def save_checkpoint(path: str, checkpoint: Dict[str, Any]):
+    """Write the checkpoint atomically so a crash never leaves it half written."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+async def process_chunk(
+    rows: List[Dict[str, Any]], platform_column: str, text_column: str, concurrency: int
+) -> List[Dict[str, Any]]:
+    """Generate and store replies for one chunk, returning output rows in input order."""
+    output = [dict(row, reply="", error="", timestamp="") for row in rows]
+    items: List[ReplyRequest] = []
+    positions: List[int] = []
+    for position, row in enumerate(rows):
+        try:
+            items.append(ReplyRequest(platform=row.get(platform_column, ""), post_text=row.get(text_column, "")))
+            positions.append(position)
+        except ValidationError as e:
+            output[position]["error"] = f"Invalid row: {e.errors()[0]['msg']}"
+
+    if items:
+        results = await reply_service.generate_and_store_replies(items, concurrency=concurrency)
+        for position, result in zip(positions, results):
+            if result.get("error"):
+                output[position]["error"] = result["error"]
+            else:
+                output[position]["reply"] = result["result"]["reply"]
+                output[position]["timestamp"] = result["result"]["timestamp"]
+    return output
+
+async def run_ingestion(
+    input_path: str,
+    output_path: str,
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    concurrency: int = INGEST_CONCURRENCY,
+    platform_column: str = "platform",
+    text_column: str = "post_text",
+    checkpoint_path: Optional[str] = None
+) -> Dict[str, int]:
+    """Generate replies for every row of a dataset, resuming from the last checkpoint."""
+    checkpoint_path = checkpoint_path or f"{output_path}.checkpoint.json"
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint.get("input") not in (None, os.path.abspath(input_path)):
+        raise Exception(f"Checkpoint {checkpoint_path} belongs to a different input file")
+
+    # Drop output written after the last checkpoint, then append from there
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    with open(output_path, "a+b") as f:
+        f.truncate(checkpoint["output_bytes"])
+
+    stats = {"rows": checkpoint["rows_done"], "succeeded": 0, "failed": 0}
+    for rows in iter_chunks(input_path, chunk_size, skip_rows=checkpoint["rows_done"]):
+        output = await process_chunk(rows, platform_column, text_column, concurrency)
+        with open(output_path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()) + OUTPUT_COLUMNS, extrasaction="ignore")
+            if f.tell() == 0:
+                writer.writeheader()
+            writer.writerows(output)
+            f.flush()
+            output_bytes = f.tell()
+
+        stats["rows"] += len(rows)
+        stats["failed"] += sum(1 for row in output if row["error"])
+        stats["succeeded"] += sum(1 for row in output if not row["error"])
+        save_checkpoint(checkpoint_path, {
+            "input": os.path.abspath(input_path),
+            "rows_done": stats["rows"],
+            "output_bytes": output_bytes
+        })
+        print(f"Processed {stats['rows']} rows ({stats['failed']} failed in this run)")
+    return stats
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate replies for every post in a CSV or XLSX file")
+    parser.add_argument("input", help="CSV or XLSX file with platform and post text columns")
+    parser.add_argument("--output", required=True, help="CSV file the results are appended to")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE, help="Rows read and stored per chunk")
+    parser.add_argument("--concurrency", type=int, default=INGEST_CONCURRENCY, help="Replies generated at the same time")
+    parser.add_argument("--platform-column", default="platform")
+    parser.add_argument("--text-column", default="post_text")
+    parser.add_argument("--checkpoint", help="Checkpoint file (defaults to <output>.checkpoint.json)")
+    args = parser.parse_args(argv)
+
+    async def run():
+        try:
+            return await run_ingestion(
+                args.input,
+                args.output,
+                chunk_size=args.chunk_size,
+                concurrency=args.concurrency,
+                platform_column=args.platform_column,
+                text_column=args.text_column,
+                checkpoint_path=args.checkpoint
+            )
+        finally:
+            if llm_service is not None:
+                await llm_service.aclose()
+
+    stats = asyncio.run(run())
+    print(f"Done: {stats['rows']} rows, {stats['succeeded']} succeeded, {stats['failed']} failed in this run")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,82 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import json
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Literal, Optional
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from .models import ReplyRequest, ReplyResponse, ErrorResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from .models import (
+    ReplyRequest, ReplyResponse, ErrorResponse,
+    BatchReplyRequest, BatchReplyItem, BatchReplyResponse,
+    JobRequest, JobResponse, RepliesPage
+)
+from .services.llm_service import llm_limiters, llm_service
 from .services.reply_service import reply_service
+from .services.cache_service import reply_cache
+from .services.rate_limiter import RateLimitExceeded, rate_limiter
+from .services.near_duplicates import near_duplicate_index
+from .services.job_service import JOB_WORKERS, JobQueueFull, job_queue, job_view
+from .database import (
+    REPLIES_MAX_PAGE_SIZE, REPLIES_PAGE_SIZE, REPLY_FIELDS, WRITE_BEHIND_ENABLED,
+    close_client, ensure_reply_indexes, find_replies, ping as mongo_ping, post_writer, reply_writer
+)
+from .metrics import MetricsMiddleware, registry, sample_lines, stage_timer
+from .coordination import WORKER_COORDINATION, coordinator
+from .admission import (
+    DeadlineExceeded, Overloaded, admission, client_key, deadline_scope, request_deadline
+)
+
+# Largest batch accepted by /reply/batch
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+# Readiness probes: per-dependency timeout, and how long a result is reused so
+# frequent probes do not hammer Mongo or the LLM API
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2"))
+HEALTH_CACHE_TTL = float(os.getenv("HEALTH_CACHE_TTL", "5"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    try:
+        await ensure_reply_indexes()
+    except Exception as e:
+        # Serve requests anyway; the indexes are created on the next start
+        print(f"Warning: could not create reply indexes: {str(e)}")
+    try:
+        await near_duplicate_index.load()
+    except Exception as e:
+        # Start with an empty index; it fills as replies are stored
+        print(f"Warning: could not load the near-duplicate index: {str(e)}")
+    # Share the provider quota and metrics with the other worker processes
+    if WORKER_COORDINATION:
+        await coordinator.start(llm_limiters(), registry.render)
+    if WRITE_BEHIND_ENABLED:
+        await post_writer.start()
+        await reply_writer.start()
+    # Workers can also run in separate processes with python -m app.worker
+    if JOB_WORKERS > 0:
+        await job_queue.start()
+    yield
+    # Finish running jobs before the write buffer is flushed
+    await job_queue.stop()
+    await coordinator.stop()
+    # Flush buffered replies before the process exits
+    await reply_writer.stop()
+    await post_writer.stop()
+    # Release pooled LLM and Mongo connections on shutdown
+    if llm_service is not None:
+        await llm_service.aclose()
+    close_client()
 
 app = FastAPI(
     title="Social Media Reply Generator",
     description="API for generating human-like social media replies using Groq LLM",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware
@@ -18,30 +88,392 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Record latency, status codes and in-flight requests for every endpoint
+app.add_middleware(MetricsMiddleware)
+
+def _component_metrics():
+    """Expose cache, strategy and write-buffer counters at scrape time."""
+    cache = reply_cache.stats()
+    lines = sample_lines(
+        "socialpilot_reply_cache_total", "Reply cache lookups and evictions by result",
+        {
+            **{(result,): cache[result] for result in ("hits", "misses", "shared_hits", "shared_errors")},
+            ("evictions",): cache["local"]["evictions"]
+        },
+        ("result",), type="counter"
+    )
+    lines += sample_lines("socialpilot_reply_cache_size", "Entries in the in-process reply cache", {(): cache["local"]["size"]})
+    if llm_service is not None:
+        stages = llm_service.stage_cache_stats()
+        lines += sample_lines(
+            "socialpilot_stage_cache_total", "Stage memoization lookups and evictions by stage and result",
+            {(stage, result): stats[result] for stage, stats in stages.items() for result in ("hits", "misses", "evictions")},
+            ("stage", "result"), type="counter"
+        )
+        lines += sample_lines(
+            "socialpilot_fused_fallbacks_total", "Fused completions that fell back to the chain",
+            {(): llm_service.fused_fallbacks}, type="counter"
+        )
+        lines += sample_lines(
+            "socialpilot_prompt_truncations_total", "Posts (stage=post) and stage prompts cut to their token budget",
+            {(stage,): count for stage, count in llm_service.prompt_truncations.items()},
+            ("stage",), type="counter"
+        )
+        lines += sample_lines(
+            "socialpilot_analysis_total", "Chain analyses by source (llm or local)",
+            {(source,): count for source, count in llm_service.analysis_sources.items()},
+            ("source",), type="counter"
+        )
+        router = llm_service.router.stats()
+        lines += sample_lines(
+            "socialpilot_llm_router_events_total", "Calls failed over to another backend, hedged, and won by the hedge",
+            {("failover",): router["failovers"], ("hedge",): router["hedges"], ("hedge_win",): router["hedge_wins"]},
+            ("event",), type="counter"
+        )
+        lines += sample_lines(
+            "socialpilot_llm_backend_latency_seconds", "Rolling latency of successful calls by backend and stage",
+            {
+                (row["backend"], row["stage"], quantile): row[key]
+                for row in router["backends"] for key, quantile in (("p50", "0.5"), ("p95", "0.95"))
+                if row[key] is not None
+            },
+            ("backend", "stage", "quantile")
+        )
+        lines += sample_lines(
+            "socialpilot_llm_backend_error_rate", "Rolling error rate by backend and stage",
+            {(row["backend"], row["stage"]): row["error_rate"] for row in router["backends"]},
+            ("backend", "stage")
+        )
+    limiter = rate_limiter.stats()
+    lines += sample_lines("socialpilot_rate_limit_waiting", "LLM calls waiting for rate-limit budget", {(): limiter["waiting"]})
+    lines += sample_lines(
+        "socialpilot_rate_limit_share", "Fraction of the provider quota used by each worker process",
+        {(): rate_limiter.share}
+    )
+    lines += sample_lines(
+        "socialpilot_rate_limit_events_total", "Rate limiter throttling, retries, provider 429s and calls shed at the deadline",
+        {(event,): limiter[event] for event in ("throttled", "retries", "rate_limited", "exhausted", "shed")},
+        ("event",), type="counter"
+    )
+    admitted = admission.stats()
+    lines += sample_lines("socialpilot_admission_in_flight", "Reply requests holding an admission slot", {(): admitted["in_flight"]})
+    lines += sample_lines("socialpilot_admission_waiting", "Reply requests queued for an admission slot", {(): admitted["waiting"]})
+    lines += sample_lines(
+        "socialpilot_admission_total", "Reply requests admitted, queued first, or shed by reason",
+        {
+            ("admitted",): admitted["admitted"], ("queued",): admitted["queued"],
+            **{(reason,): count for reason, count in admitted["rejected"].items()}
+        },
+        ("result",), type="counter"
+    )
+    near = near_duplicate_index.stats()
+    lines += sample_lines("socialpilot_near_duplicate_index_size", "Posts in the near-duplicate index", {(): near["size"]})
+    lines += sample_lines(
+        "socialpilot_near_duplicate_lookups_total", "Near-duplicate lookups by result (adapted hits also count as hit)",
+        {("hit",): near["hits"], ("miss",): near["misses"], ("adapted",): near["adapted"]},
+        ("result",), type="counter"
+    )
+    flights = reply_service.flights.stats() if reply_service.flights is not None else None
+    if flights is not None:
+        lines += sample_lines("socialpilot_single_flight_in_flight", "Coalesced generations currently running", {(): flights["in_flight"]})
+        lines += sample_lines(
+            "socialpilot_single_flight_requests_total", "Generations started (leader) or joined while in flight (joined)",
+            {("leader",): flights["leaders"], ("joined",): flights["joined"]},
+            ("role",), type="counter"
+        )
+    jobs = job_queue.stats()
+    lines += sample_lines("socialpilot_job_queue_depth", "Jobs waiting when the queue was last checked", {(): jobs["depth"]})
+    lines += sample_lines("socialpilot_job_workers", "Job workers in this process by state", {
+        ("busy",): jobs["busy"], ("idle",): jobs["workers"] - jobs["busy"]
+    }, ("state",))
+    lines += sample_lines(
+        "socialpilot_jobs_total", "Jobs handled by this process by outcome",
+        {(outcome,): jobs[outcome] for outcome in ("submitted", "succeeded", "failed", "retried", "deferred", "rejected")},
+        ("outcome",), type="counter"
+    )
+    writer = reply_writer.stats()
+    lines += sample_lines("socialpilot_write_buffer_queued", "Replies waiting in the write-behind buffer", {(): writer["queued"]})
+    lines += sample_lines(
+        "socialpilot_write_buffer_documents_total", "Replies handled by the write-behind buffer by outcome",
+        {(outcome,): writer[outcome] for outcome in ("written", "spilled", "replayed")},
+        ("outcome",), type="counter"
+    )
+    return lines
+
+registry.register_collector(_component_metrics)
+
 @app.post(
     "/reply",
     response_model=ReplyResponse,
     responses={
         400: {"model": ErrorResponse},
-        500: {"model": ErrorResponse}
+        429: {"model": ErrorResponse},
+        500: {"model": ErrorResponse},
+        503: {"model": ErrorResponse}
     },
     summary="Generate a reply to a social media post",
     description="Generates a human-like reply for the given social media post using Groq LLM"
 )
-async def generate_reply(request: ReplyRequest):
+async def generate_reply(request: ReplyRequest, http_request: Request):
     try:
-        result = await reply_service.generate_and_store_reply(
-            platform=request.platform,
-            post_text=request.post_text
+        # The deadline starts before admission, so time spent queued counts against it
+        with deadline_scope(request_deadline(http_request.headers)):
+            async with admission.admit(_client(http_request)):
+                result = await reply_service.generate_and_store_reply(
+                    platform=request.platform,
+                    post_text=request.post_text,
+                    bypass_cache=request.bypass_cache,
+                    strategy=request.strategy,
+                    variants=request.variants
+                )
+        with stage_timer("response_validation"):
+            return ReplyResponse(**result)
+    except (Overloaded, DeadlineExceeded) as e:
+        raise _shed(e)
+    except RateLimitExceeded as e:
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
         )
-        return ReplyResponse(**result)
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=str(e)
         )
 
+def _client(http_request: Request) -> str:
+    return client_key(http_request.headers, http_request.client.host if http_request.client else None)
+
+def _shed(e: Exception) -> HTTPException:
+    """429 for a client over its quota, 503 when the server is full or the deadline cannot be met."""
+    return HTTPException(
+        status_code=getattr(e, "status_code", 503),
+        detail=str(e),
+        headers={"Retry-After": str(math.ceil(e.retry_after))}
+    )
+
+def _format_sse(event: str, data: dict) -> str:
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _stream_reply_response(
+    http_request: Request, platform: str, post_text: str, bypass_cache: bool, strategy: Optional[str]
+) -> StreamingResponse:
+    deadline = time.monotonic() + request_deadline(http_request.headers)
+    # Admit before the response starts, so a shed stream still gets a 429 or 503 status
+    try:
+        with deadline_scope(deadline - time.monotonic()):
+            release = await admission.acquire(_client(http_request))
+    except Overloaded as e:
+        raise _shed(e)
+
+    async def events():
+        try:
+            with deadline_scope(deadline - time.monotonic()):
+                # Send a first event right away so clients get bytes before the first LLM call returns
+                yield _format_sse("start", {"platform": platform})
+                async for event, data in reply_service.stream_and_store_reply(platform, post_text, bypass_cache, strategy):
+                    yield _format_sse(event, data)
+        finally:
+            release()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also release the slot if the client disconnects before the stream starts
+        background=BackgroundTask(release)
+    )
+
+@app.post(
+    "/reply/stream",
+    summary="Stream a reply to a social media post",
+    description="Streams analysis, persona and reply tokens as Server-Sent Events, ending with a done or error event"
+)
+async def stream_reply(request: ReplyRequest, http_request: Request):
+    if request.variants > 1:
+        raise HTTPException(status_code=400, detail="variants is not supported when streaming; use POST /reply")
+    return await _stream_reply_response(
+        http_request, request.platform, request.post_text, request.bypass_cache, request.strategy
+    )
+
+@app.get(
+    "/reply/stream",
+    summary="Stream a reply to a social media post",
+    description="Query-string variant of POST /reply/stream for EventSource clients"
+)
+async def stream_reply_get(
+    http_request: Request,
+    platform: Literal["twitter", "linkedin", "instagram"],
+    post_text: str,
+    bypass_cache: bool = False,
+    strategy: Optional[Literal["chain", "direct", "fused"]] = None
+):
+    return await _stream_reply_response(http_request, platform, post_text, bypass_cache, strategy)
+
+@app.post(
+    "/reply/batch",
+    response_model=BatchReplyResponse,
+    responses={
+        400: {"model": ErrorResponse}
+    },
+    summary="Generate replies for a batch of social media posts",
+    description="Generates replies concurrently with bounded parallelism, deduplicating identical posts and storing all replies in one bulk write"
+)
+async def generate_reply_batch(request: BatchReplyRequest, http_request: Request):
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch size {len(request.items)} exceeds the limit of {BATCH_MAX_ITEMS} items"
+        )
+    # Each generation takes an admission slot; items that are shed fail with their own error
+    results = await reply_service.generate_and_store_replies(
+        request.items,
+        concurrency=request.concurrency,
+        client=_client(http_request)
+    )
+    items = [BatchReplyItem(**result) for result in results]
+    failed = sum(1 for item in items if item.error is not None)
+    return BatchReplyResponse(results=items, succeeded=len(items) - failed, failed=failed)
+
+@app.get(
+    "/replies",
+    response_model=RepliesPage,
+    responses={
+        400: {"model": ErrorResponse},
+        500: {"model": ErrorResponse}
+    },
+    summary="List stored replies",
+    description="Pages through stored replies newest first using an opaque keyset cursor"
+)
+async def list_replies(
+    platform: Optional[Literal["twitter", "linkedin", "instagram"]] = None,
+    since: Optional[datetime] = Query(None, description="Only replies generated at or after this UTC time"),
+    until: Optional[datetime] = Query(None, description="Only replies generated before this UTC time"),
+    post_text: Optional[str] = Query(None, description="Only replies to this post (matched on the normalized text)"),
+    fields: Optional[str] = Query(None, description=f"Comma-separated fields to return: {', '.join(REPLY_FIELDS)}"),
+    limit: int = Query(REPLIES_PAGE_SIZE, ge=1, le=REPLIES_MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
+    selected = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    unknown = sorted(set(selected or []) - set(REPLY_FIELDS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    try:
+        page = await find_replies(
+            platform=platform,
+            since=since,
+            until=until,
+            post_text=post_text,
+            fields=selected,
+            limit=limit,
+            cursor=cursor
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error reading replies: {str(e)}")
+    return RepliesPage(**page)
+
+@app.post(
+    "/jobs",
+    response_model=JobResponse,
+    status_code=202,
+    responses={
+        500: {"model": ErrorResponse},
+        503: {"model": ErrorResponse}
+    },
+    summary="Queue a reply job",
+    description="Queues reply generation and returns a job id immediately; poll GET /jobs/{job_id} or pass a callback_url"
+)
+async def submit_job(request: JobRequest, http_request: Request):
+    try:
+        job = await job_queue.submit(
+            ReplyRequest(**request.model_dump(include={"platform", "post_text", "bypass_cache", "strategy", "variants"})),
+            priority=request.priority,
+            callback_url=str(request.callback_url) if request.callback_url else None,
+            client=_client(http_request)
+        )
+    except JobQueueFull as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(math.ceil(e.retry_after))}
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error queueing job: {str(e)}")
+    return JobResponse(**job_view(job))
+
+@app.get(
+    "/jobs/{job_id}",
+    response_model=JobResponse,
+    responses={
+        404: {"model": ErrorResponse}
+    },
+    summary="Get the status of a reply job"
+)
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return JobResponse(**job_view(job))
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Reply and stage cache hit/miss counters."""
+    stats = reply_cache.stats()
+    stats["stages"] = llm_service.stage_cache_stats() if llm_service is not None else {}
+    stats["single_flight"] = reply_service.flights.stats() if reply_service.flights is not None else None
+    stats["near_duplicates"] = near_duplicate_index.stats()
+    stats["coordination"] = coordinator.stats()
+    return stats
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics in the text exposition format."""
+    exposition = registry.render()
+    if coordinator.running:
+        try:
+            exposition = await coordinator.cluster_metrics(exposition)
+        except Exception as e:
+            # Fall back to this worker's own metrics rather than failing the scrape
+            print(f"Warning: could not merge worker metrics: {str(e)}")
+    return PlainTextResponse(exposition, media_type="text/plain; version=0.0.4")
+
+_health_results: Dict[str, tuple] = {}
+
+async def _check(name: str, probe: Callable[[], Awaitable[None]]) -> Dict[str, Any]:
+    """Run a readiness probe with a timeout, reusing a recent result."""
+    now = time.monotonic()
+    cached = _health_results.get(name)
+    if cached is not None and cached[0] > now:
+        return cached[1]
+    start = time.perf_counter()
+    try:
+        await asyncio.wait_for(probe(), HEALTH_CHECK_TIMEOUT)
+        result = {"ok": True, "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+    except Exception as e:
+        result = {"ok": False, "error": str(e) or type(e).__name__}
+    _health_results[name] = (now + HEALTH_CACHE_TTL, result)
+    return result
+
+async def _llm_ping():
+    if llm_service is None:
+        raise Exception("LLM service is not initialized. Please check your GROQ_API_KEY environment variable.")
+    await llm_service.ping()
+
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    return {"status": "healthy"} 
\ No newline at end of file
+    """Readiness: 200 when Mongo and the LLM backend are reachable, otherwise 503."""
+    mongo, llm = await asyncio.gather(_check("mongo", mongo_ping), _check("llm", _llm_ping))
+    healthy = mongo["ok"] and llm["ok"]
+    return JSONResponse(
+        status_code=200 if healthy else 503,
+        content={"status": "healthy" if healthy else "unhealthy", "checks": {"mongo": mongo, "llm": llm}}
+    )
+
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "alive"} 
\ No newline at end of file
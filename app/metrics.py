@@ -0,0 +1,309 @@
+"""
+Lightweight hot-path instrumentation exported in the Prometheus text format.
+
+Tracks per-stage latency (LLM calls, Mongo writes, response validation), token
+usage reported by each completion, error counters and in-flight request gauges.
+Cache and write-buffer statistics are read from their owners at scrape time
+through registered collectors.
+
+Per-request stage timings are also collected in a context variable so they can
+be returned as Server-Timing debug headers.
+"""
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Always attach Server-Timing headers, not only when the client asks with X-Debug-Timing
+METRICS_DEBUG_HEADERS = os.getenv("METRICS_DEBUG_HEADERS", "false").lower() == "true"
+
+# Histogram buckets in seconds, from a fast cache hit to a slow LLM chain
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Callers sharing one coalesced generation
+FAN_IN_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{_format_labels(self.label_names, key)} {value}"
+            for key, value in sorted(self.values.items())
+        ]
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        self.values[self._key(labels)] = value
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        self.counts: Dict[LabelValues, List[int]] = {}
+        self.sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        counts = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-1] += 1
+        self.sums[key] = self.sums.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for key, counts in sorted(self.counts.items()):
+            for bound, count in zip(self.buckets, counts):
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {counts[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {self.sums[key]}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {counts[-1]}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable[[], List[str]]] = []
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help, labels))
+
+    def histogram(
+        self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, help, labels, buckets))
+
+    def _register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[str]]):
+        """Register a callable producing extra exposition lines at scrape time."""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+def sample_lines(
+    name: str, help: str, samples: Dict[LabelValues, float], labels: Tuple[str, ...] = (), type: str = "gauge"
+) -> List[str]:
+    """Render samples read from another component's own counters."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {type}"]
+    lines += [f"{name}{_format_labels(labels, key)} {value}" for key, value in samples.items()]
+    return lines
+
+# Families describing a shared state rather than a per-process quantity; when
+# expositions from several workers are merged these take the maximum, not the sum
+MAX_MERGED_METRICS = {
+    "socialpilot_llm_backend_latency_seconds",
+    "socialpilot_llm_backend_error_rate",
+    "socialpilot_job_queue_depth",
+}
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+def merge_expositions(texts: List[str]) -> str:
+    """Merge the expositions of several worker processes into one.
+
+    Samples of the same series are summed (counters, histogram buckets and
+    additive gauges) or, for MAX_MERGED_METRICS, reduced to their maximum.
+    """
+    headers: Dict[str, List[str]] = {}
+    samples: Dict[str, Dict[str, float]] = {}
+    family = ""
+    for text in texts:
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            if line.startswith("#"):
+                parts = line.split(" ", 3)
+                family = parts[2] if len(parts) > 2 else family
+                if family not in headers:
+                    headers[family] = []
+                    samples[family] = {}
+                if line not in headers[family]:
+                    headers[family].append(line)
+                continue
+            series, _, value = line.rpartition(" ")
+            try:
+                number = float(value)
+            except ValueError:
+                continue
+            merged = samples.setdefault(family, {})
+            headers.setdefault(family, [])
+            if series in merged:
+                merged[series] = max(merged[series], number) if family in MAX_MERGED_METRICS else merged[series] + number
+            else:
+                merged[series] = number
+    lines: List[str] = []
+    for name, header in headers.items():
+        lines.extend(header)
+        lines.extend(f"{series} {_format_value(value)}" for series, value in samples[name].items())
+    return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+stage_seconds = registry.histogram(
+    "socialpilot_stage_seconds", "Time spent in each stage of reply handling", ("stage",)
+)
+stage_errors = registry.counter(
+    "socialpilot_stage_errors_total", "Errors raised by each stage", ("stage",)
+)
+llm_tokens = registry.counter(
+    "socialpilot_llm_tokens_total", "Tokens reported by LLM completions", ("stage", "kind")
+)
+request_seconds = registry.histogram(
+    "socialpilot_request_seconds", "End-to-end HTTP request latency", ("path",)
+)
+requests_total = registry.counter(
+    "socialpilot_requests_total", "HTTP requests by path and status code", ("path", "status")
+)
+requests_in_flight = registry.gauge(
+    "socialpilot_requests_in_flight", "HTTP requests currently being handled"
+)
+llm_calls_in_flight = registry.gauge(
+    "socialpilot_llm_calls_in_flight", "LLM completions currently awaiting a response", ("stage",)
+)
+single_flight_fan_in = registry.histogram(
+    "socialpilot_single_flight_fan_in", "Callers that shared each coalesced generation", ("flight",), FAN_IN_BUCKETS
+)
+
+# Stage timings and token counts of the current request, for debug headers
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+@contextmanager
+def stage_timer(stage: str) -> Iterator[None]:
+    """Time a stage, recording it globally and on the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        stage_errors.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0) + elapsed
+
+def record_token_usage(stage: str, usage) -> None:
+    """Count prompt and completion tokens from a completion's usage block."""
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or 0
+    completion_tokens = getattr(usage, "completion_tokens", None) or 0
+    llm_tokens.inc(prompt_tokens, stage=stage, kind="prompt")
+    llm_tokens.inc(completion_tokens, stage=stage, kind="completion")
+    timings = _request_timings.get()
+    if timings is not None:
+        timings["_prompt_tokens"] = timings.get("_prompt_tokens", 0) + prompt_tokens
+        timings["_completion_tokens"] = timings.get("_completion_tokens", 0) + completion_tokens
+
+def _server_timing(timings: Dict[str, float], total: float) -> str:
+    entries = [f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in timings.items() if not stage.startswith("_")]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency, status and in-flight gauges.
+
+    When METRICS_DEBUG_HEADERS is set, or the client sends X-Debug-Timing, the
+    per-stage timings are returned in a Server-Timing header along with an
+    X-LLM-Tokens header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        debug = METRICS_DEBUG_HEADERS or any(
+            name == b"x-debug-timing" and value not in (b"", b"0", b"false")
+            for name, value in scope.get("headers", [])
+        )
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        status = "500"
+        start = time.perf_counter()
+        requests_in_flight.inc()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                if debug:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(timings, time.perf_counter() - start).encode()))
+                    headers.append((b"x-llm-tokens", (
+                        f"prompt={int(timings.get('_prompt_tokens', 0))};"
+                        f"completion={int(timings.get('_completion_tokens', 0))}"
+                    ).encode()))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Label by route template so path parameters do not explode cardinality
+            route = scope.get("route")
+            label = getattr(route, "path", None) or "unmatched"
+            requests_in_flight.dec()
+            request_seconds.observe(time.perf_counter() - start, path=label)
+            requests_total.inc(path=label, status=status)
+            _request_timings.reset(token)
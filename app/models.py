@@ -1,5 +1,5 @@
-from pydantic import BaseModel, Field
-from typing import Literal
+from pydantic import BaseModel, Field, HttpUrl
+from typing import List, Literal, Optional
 from datetime import datetime
 
 class ReplyRequest(BaseModel):
@@ -7,12 +7,78 @@ class ReplyRequest(BaseModel):
         ..., description="The social media platform"
     )
     post_text: str = Field(..., description="The text of the post to reply to")
+    bypass_cache: bool = Field(
+        False, description="Skip the reply cache and always generate a fresh reply"
+    )
+    strategy: Optional[Literal["chain", "direct", "fused"]] = Field(
+        None, description="Generation strategy; defaults to the deployment's LLM_STRATEGY"
+    )
+    variants: int = Field(
+        1, ge=1, le=10, description="Number of candidate replies to generate in one completion and rank"
+    )
+
+class ReplyVariant(BaseModel):
+    reply: str = Field(..., description="A candidate reply")
+    score: float = Field(..., description="Local ranking score between 0 and 1")
 
 class ReplyResponse(BaseModel):
     reply: str = Field(..., description="The generated reply")
     platform: str = Field(..., description="The social media platform")
     post_text: str = Field(..., description="The original post text")
     timestamp: datetime = Field(default_factory=datetime.utcnow)
+    cached: bool = Field(False, description="Whether the reply was served from the cache")
+    variants: Optional[List[ReplyVariant]] = Field(
+        None, description="All candidates best first when variants > 1; reply is the first one"
+    )
 
 class ErrorResponse(BaseModel):
-    detail: str = Field(..., description="Error message") 
\ No newline at end of file
+    detail: str = Field(..., description="Error message")
+
+class BatchReplyRequest(BaseModel):
+    items: List[ReplyRequest] = Field(..., min_length=1, description="The posts to reply to")
+    concurrency: Optional[int] = Field(
+        None, ge=1, description="Maximum number of replies generated at the same time"
+    )
+
+class BatchReplyItem(BaseModel):
+    index: int = Field(..., description="Position of the item in the request")
+    result: Optional[ReplyResponse] = Field(None, description="The generated reply, if successful")
+    error: Optional[str] = Field(None, description="Error message, if generation failed")
+
+class BatchReplyResponse(BaseModel):
+    results: List[BatchReplyItem] = Field(..., description="Per-item results in request order")
+    succeeded: int = Field(..., description="Number of items with a generated reply")
+    failed: int = Field(..., description="Number of items that failed")
+
+class JobRequest(ReplyRequest):
+    priority: Literal["high", "normal", "low"] = Field(
+        "normal", description="Jobs with higher priority are processed first"
+    )
+    callback_url: Optional[HttpUrl] = Field(
+        None, description="URL the final job status is POSTed to when the job finishes"
+    )
+
+class JobResponse(BaseModel):
+    job_id: str = Field(..., description="Identifier to poll with GET /jobs/{job_id}")
+    status: Literal["queued", "running", "succeeded", "failed"] = Field(..., description="Current job status")
+    priority: str = Field(..., description="Job priority")
+    attempts: int = Field(0, description="Number of times a worker has started the job")
+    created_at: datetime = Field(..., description="When the job was submitted")
+    updated_at: datetime = Field(..., description="When the job status last changed")
+    result: Optional[ReplyResponse] = Field(None, description="The generated reply once the job has succeeded")
+    error: Optional[str] = Field(None, description="The last error, if an attempt failed")
+    callback_url: Optional[str] = Field(None, description="Callback URL registered for the job")
+    callback_status: Optional[str] = Field(None, description="Outcome of the callback delivery")
+
+class StoredReply(BaseModel):
+    id: str = Field(..., description="Identifier of the stored reply")
+    platform: Optional[str] = Field(None, description="The social media platform")
+    post_text: Optional[str] = Field(None, description="The original post text")
+    generated_reply: Optional[str] = Field(None, description="The generated reply")
+    timestamp: Optional[str] = Field(None, description="When the reply was generated (UTC, ISO 8601)")
+    post_hash: Optional[str] = Field(None, description="Hash of the normalized post text")
+    variants: Optional[List[ReplyVariant]] = Field(None, description="Ranked candidates, if several were requested")
+
+class RepliesPage(BaseModel):
+    items: List[StoredReply] = Field(..., description="Replies on this page, newest first")
+    next_cursor: Optional[str] = Field(None, description="Pass as cursor to fetch the next page; null on the last page")
@@ -0,0 +1,159 @@
+"""
+Caching for generated replies.
+
+Replies are content-addressed: the cache key is a hash of the platform, the
+normalized post text, the model and the generation parameters, so the same
+post arriving again for the same platform skips the prompt chain entirely.
+
+Two tiers are supported:
+- An in-process LRU cache with per-entry TTL (always on when caching is enabled)
+- An optional shared Mongo-backed tier so several instances can reuse replies
+
+The same LRU+TTL cache also memoizes the analysis and persona stages inside
+LLMService, so a post answered on several platforms is analyzed only once.
+"""
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from ..database import ensure_reply_cache_index, get_cached_reply, store_cached_reply
+from ..text import normalize_text
+from ..coordination import MULTI_WORKER
+
+REPLY_CACHE_ENABLED = os.getenv("REPLY_CACHE_ENABLED", "true").lower() == "true"
+REPLY_CACHE_MAX_SIZE = int(os.getenv("REPLY_CACHE_MAX_SIZE", "10000"))
+REPLY_CACHE_TTL = float(os.getenv("REPLY_CACHE_TTL", "3600"))
+# Shared by default when several worker processes serve the API, so they do not fragment the hit rate
+REPLY_CACHE_SHARED = os.getenv("REPLY_CACHE_SHARED", "true" if MULTI_WORKER else "false").lower() == "true"
+
+# Memoization of the analysis and persona stages of the prompt chain
+STAGE_CACHE_ENABLED = os.getenv("STAGE_CACHE_ENABLED", "true").lower() == "true"
+STAGE_CACHE_MAX_SIZE = int(os.getenv("STAGE_CACHE_MAX_SIZE", "5000"))
+STAGE_CACHE_TTL = float(os.getenv("STAGE_CACHE_TTL", "3600"))
+
+def make_cache_key(*parts: Any) -> str:
+    """Hash arbitrary JSON-serializable parts into a stable cache key."""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class TTLCache:
+    """Bounded LRU cache whose entries also expire after a fixed TTL."""
+
+    def __init__(self, max_size: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, value = entry
+        if expires_at <= self.clock():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        self._entries[key] = (self.clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+class ReplyCache:
+    """Two-tier reply cache: in-process LRU+TTL in front of an optional Mongo tier."""
+
+    def __init__(self, enabled: bool = True, max_size: int = 10000, ttl: float = 3600, shared: bool = False):
+        self.enabled = enabled
+        self.shared = shared
+        self.local = TTLCache(max_size, ttl)
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self.shared_errors = 0
+        self._index_ready = False
+
+    def key(self, platform: str, post_text: str, generation_config: Dict[str, Any]) -> str:
+        return make_cache_key(platform, normalize_text(post_text), generation_config)
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        reply = self.local.get(key)
+        if reply is None and self.shared:
+            try:
+                reply = await get_cached_reply(key)
+            except Exception:
+                # The shared tier is an optimization; never fail a request over it
+                self.shared_errors += 1
+            if reply is not None:
+                self.shared_hits += 1
+                self.local.set(key, reply)
+        if reply is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return reply
+
+    async def set(self, key: str, reply: str):
+        if not self.enabled:
+            return
+        self.local.set(key, reply)
+        if self.shared:
+            try:
+                if not self._index_ready:
+                    await ensure_reply_cache_index()
+                    self._index_ready = True
+                await store_cached_reply(key, reply, self.local.ttl)
+            except Exception:
+                self.shared_errors += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "shared": self.shared,
+            "hits": self.hits,
+            "misses": self.misses,
+            "shared_hits": self.shared_hits,
+            "shared_errors": self.shared_errors,
+            "local": self.local.stats(),
+        }
+
+# Create a singleton instance
+reply_cache = ReplyCache(
+    enabled=REPLY_CACHE_ENABLED,
+    max_size=REPLY_CACHE_MAX_SIZE,
+    ttl=REPLY_CACHE_TTL,
+    shared=REPLY_CACHE_SHARED
+)
@@ -0,0 +1,337 @@
+"""
+Asynchronous reply jobs.
+
+POST /jobs stores a job document in Mongo and returns its id straight away, so
+a long prompt chain no longer depends on an HTTP connection staying open.
+Workers claim jobs atomically with find_one_and_update, highest priority and
+oldest first, and run them through ReplyService. Workers can run inside the
+API process (JOB_WORKERS) or in separate processes (python -m app.worker); they
+coordinate only through the jobs collection.
+
+A claimed job carries a lease. If its worker dies, the lease expires and
+another worker picks the job up again. Failed jobs are retried with
+exponential backoff (or after the provider's Retry-After on rate limits) up to
+JOB_MAX_ATTEMPTS. When a job finishes, its final status is POSTed to the
+callback URL if one was given, and can always be polled with GET /jobs/{id}.
+
+The queue is bounded by JOB_QUEUE_MAX: when that many jobs are waiting, new
+submissions are refused with JobQueueFull rather than dropped silently.
+"""
+
+import asyncio
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+import httpx
+from pymongo import ReturnDocument
+from ..admission import Overloaded, admission
+from ..database import jobs_collection
+from ..models import ReplyRequest
+from ..services.rate_limiter import RateLimitExceeded
+from ..services.reply_service import reply_service
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "10000"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "2"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "300"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "30"))
+JOB_CALLBACK_TIMEOUT = float(os.getenv("JOB_CALLBACK_TIMEOUT", "10"))
+JOB_CALLBACK_RETRIES = int(os.getenv("JOB_CALLBACK_RETRIES", "3"))
+
+# Lower ranks are claimed first
+JOB_PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+
+class JobQueueFull(Exception):
+    """Raised when JOB_QUEUE_MAX jobs are already waiting."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def job_view(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """The public representation of a job document."""
+    return {
+        "job_id": doc["_id"],
+        "status": doc["status"],
+        "priority": doc["priority"],
+        "attempts": doc.get("attempts", 0),
+        "created_at": doc["created_at"].isoformat(),
+        "updated_at": doc["updated_at"].isoformat(),
+        "result": doc.get("result"),
+        "error": doc.get("error"),
+        "callback_url": doc.get("callback_url"),
+        "callback_status": doc.get("callback_status"),
+    }
+
+class JobQueue:
+    def __init__(
+        self,
+        collection: Any,
+        workers: int = 4,
+        max_queued: int = 10000,
+        max_attempts: int = 3,
+        retry_delay: float = 2,
+        lease_seconds: float = 300,
+        poll_interval: float = 1,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
+        self.collection = collection
+        self.workers = workers
+        self.max_queued = max_queued
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.http_client = http_client
+        self.running = False
+        self.depth = 0
+        self.busy = 0
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._indexes_ready = False
+        self.submitted = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.retried = 0
+        self.deferred = 0
+        self.rejected = 0
+        self.callbacks_delivered = 0
+        self.callbacks_failed = 0
+
+    async def ensure_indexes(self):
+        if self._indexes_ready:
+            return
+        await self.collection.create_index([("status", 1), ("priority_rank", 1), ("created_at", 1)])
+        await self.collection.create_index([("status", 1), ("lease_expires_at", 1)])
+        self._indexes_ready = True
+
+    async def submit(
+        self, request: ReplyRequest, priority: str = "normal", callback_url: Optional[str] = None,
+        client: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Queue a reply job and return its document; it is admitted as `client` when it runs."""
+        await self.ensure_indexes()
+        self.depth = await self.collection.count_documents({"status": "queued"})
+        if self.depth >= self.max_queued:
+            self.rejected += 1
+            raise JobQueueFull(f"Job queue is full ({self.depth} jobs waiting)", self.poll_interval * 5)
+
+        now = datetime.utcnow()
+        doc = {
+            "_id": uuid.uuid4().hex,
+            "status": "queued",
+            "priority": priority,
+            "priority_rank": JOB_PRIORITIES[priority],
+            "request": request.model_dump(),
+            "callback_url": callback_url,
+            "client": client,
+            "attempts": 0,
+            "available_at": now,
+            "created_at": now,
+            "updated_at": now
+        }
+        await self.collection.insert_one(doc)
+        self.submitted += 1
+        self.depth += 1
+        if self._wakeup is not None:
+            self._wakeup.set()
+        return doc
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({"_id": job_id})
+
+    async def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """Atomically take the next runnable job, including jobs whose lease expired."""
+        now = datetime.utcnow()
+        return await self.collection.find_one_and_update(
+            {"$or": [
+                {"status": "queued", "available_at": {"$lte": now}},
+                {"status": "running", "lease_expires_at": {"$lt": now}}
+            ]},
+            {
+                "$set": {
+                    "status": "running",
+                    "worker": worker_id,
+                    "lease_expires_at": now + timedelta(seconds=self.lease_seconds),
+                    "updated_at": now
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("priority_rank", 1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _finish(
+        self, job: Dict[str, Any], update: Dict[str, Any], inc: Optional[Dict[str, int]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Update a job this worker still holds the lease for."""
+        update["updated_at"] = datetime.utcnow()
+        change: Dict[str, Any] = {"$set": update, "$unset": {"lease_expires_at": ""}}
+        if inc:
+            change["$inc"] = inc
+        return await self.collection.find_one_and_update(
+            {"_id": job["_id"], "worker": job["worker"], "status": "running"},
+            change,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _defer(self, job: Dict[str, Any], error: Overloaded) -> Optional[Dict[str, Any]]:
+        """Put back a job admission control shed; it never ran, so it keeps its attempt."""
+        self.deferred += 1
+        return await self._finish(job, {
+            "status": "queued",
+            "error": str(error),
+            "available_at": datetime.utcnow() + timedelta(seconds=error.retry_after)
+        }, inc={"attempts": -1})
+
+    async def _retry_or_fail(self, job: Dict[str, Any], error: str, delay: float) -> Optional[Dict[str, Any]]:
+        if job["attempts"] >= self.max_attempts:
+            self.failed += 1
+            return await self._finish(job, {"status": "failed", "error": error})
+        self.retried += 1
+        return await self._finish(job, {
+            "status": "queued",
+            "error": error,
+            "available_at": datetime.utcnow() + timedelta(seconds=delay)
+        })
+
+    async def process(self, job: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Run one claimed job through ReplyService and record the outcome."""
+        if job["attempts"] > self.max_attempts:
+            # Its previous workers died mid-job too many times
+            self.failed += 1
+            finished = await self._finish(job, {"status": "failed", "error": "Job exceeded its maximum attempts"})
+        else:
+            request = job["request"]
+            try:
+                # Jobs share the admission slots with /reply, under the submitting client's quota
+                async with admission.admit(job.get("client") or "jobs"):
+                    result = await reply_service.generate_and_store_reply(
+                        platform=request["platform"],
+                        post_text=request["post_text"],
+                        bypass_cache=request.get("bypass_cache", False),
+                        strategy=request.get("strategy"),
+                        variants=request.get("variants", 1)
+                    )
+            except Overloaded as e:
+                return await self._defer(job, e)
+            except RateLimitExceeded as e:
+                return await self._retry_or_fail(job, str(e), e.retry_after)
+            except Exception as e:
+                return await self._retry_or_fail(job, str(e), self.retry_delay * 2 ** (job["attempts"] - 1))
+            self.succeeded += 1
+            finished = await self._finish(job, {"status": "succeeded", "result": result, "error": None})
+
+        if finished is not None and finished.get("callback_url"):
+            await self.deliver_callback(finished)
+        return finished
+
+    async def deliver_callback(self, job: Dict[str, Any]):
+        """POST the final job status to its callback URL, retrying transient failures."""
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(timeout=JOB_CALLBACK_TIMEOUT)
+        error = None
+        for attempt in range(JOB_CALLBACK_RETRIES):
+            try:
+                response = await self.http_client.post(job["callback_url"], json=job_view(job))
+                if response.status_code < 500:
+                    response.raise_for_status()
+                    self.callbacks_delivered += 1
+                    await self.collection.update_one({"_id": job["_id"]}, {"$set": {"callback_status": "delivered"}})
+                    return
+                error = f"HTTP {response.status_code}"
+            except httpx.HTTPStatusError as e:
+                # The receiver rejected the callback; retrying will not help
+                error = f"HTTP {e.response.status_code}"
+                break
+            except httpx.HTTPError as e:
+                error = str(e) or type(e).__name__
+            await asyncio.sleep(self.retry_delay * 2 ** attempt)
+        self.callbacks_failed += 1
+        await self.collection.update_one(
+            {"_id": job["_id"]}, {"$set": {"callback_status": f"failed: {error}"}}
+        )
+
+    async def _worker(self, worker_id: str):
+        while self.running:
+            try:
+                # Created here rather than in start(), so the app starts without Mongo
+                await self.ensure_indexes()
+                job = await self.claim(worker_id)
+            except Exception:
+                # Mongo is unreachable; try again after the poll interval
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.busy += 1
+            try:
+                await self.process(job)
+            except Exception:
+                # Leave the job to be recovered once its lease expires
+                pass
+            finally:
+                self.busy -= 1
+
+    async def start(self, workers: Optional[int] = None):
+        """Start the worker pool in this process."""
+        if self.running:
+            return
+        self.workers = self.workers if workers is None else workers
+        self.running = True
+        self._wakeup = asyncio.Event()
+        prefix = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._tasks = [asyncio.create_task(self._worker(f"{prefix}-{n}")) for n in range(self.workers)]
+
+    async def stop(self, timeout: float = JOB_SHUTDOWN_TIMEOUT):
+        """Let running jobs finish, then stop the workers.
+
+        Jobs still running after `timeout` are cancelled; their leases expire
+        and another worker runs them again.
+        """
+        if not self.running:
+            return
+        self.running = False
+        self._wakeup.set()
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "workers": len(self._tasks),
+            "busy": self.busy,
+            "depth": self.depth,
+            "submitted": self.submitted,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "retried": self.retried,
+            "deferred": self.deferred,
+            "rejected": self.rejected,
+            "callbacks_delivered": self.callbacks_delivered,
+            "callbacks_failed": self.callbacks_failed,
+        }
+
+# Create a singleton instance
+job_queue = JobQueue(
+    jobs_collection,
+    workers=JOB_WORKERS,
+    max_queued=JOB_QUEUE_MAX,
+    max_attempts=JOB_MAX_ATTEMPTS,
+    retry_delay=JOB_RETRY_DELAY,
+    lease_seconds=JOB_LEASE_SECONDS,
+    poll_interval=JOB_POLL_INTERVAL
+)
@@ -0,0 +1,310 @@
+"""
+Pluggable chat-completion backends.
+
+Every backend exposes the same small interface: complete() for a whole
+completion, open_stream() for a streamed one, ping() for readiness and
+aclose(). Each call is a single attempt. Retries, rate limiting and the
+choice of backend belong to the router, which drives every backend through
+its own RateLimiter because quotas are per provider.
+
+Backends:
+- groq: the Groq API through the official SDK (GROQ_API_KEY, GROQ_MODEL)
+- openai: any OpenAI-compatible /chat/completions endpoint over plain HTTP
+  (LLM_OPENAI_BASE_URL, LLM_OPENAI_API_KEY, LLM_OPENAI_MODEL), e.g. vLLM,
+  Ollama, Together or OpenAI itself
+- stub: a local canned-response backend for development and offline tests
+
+LLM_BACKENDS lists the backends to enable, e.g. "groq,openai".
+"""
+
+import asyncio
+import json
+import os
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Dict, List, Optional
+import httpx
+from groq import AsyncGroq
+from .rate_limiter import RateLimiter, rate_limiter
+
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "groq")
+
+# Connection pool settings shared by the HTTP clients of every backend
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+GROQ_MODEL = os.getenv("GROQ_MODEL", "meta-llama/llama-4-scout-17b-16e-instruct")
+
+LLM_OPENAI_BASE_URL = os.getenv("LLM_OPENAI_BASE_URL", "https://api.openai.com/v1")
+LLM_OPENAI_API_KEY = os.getenv("LLM_OPENAI_API_KEY", "")
+LLM_OPENAI_MODEL = os.getenv("LLM_OPENAI_MODEL", "gpt-4o-mini")
+LLM_OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("LLM_OPENAI_REQUESTS_PER_MINUTE", "0"))
+LLM_OPENAI_TOKENS_PER_MINUTE = float(os.getenv("LLM_OPENAI_TOKENS_PER_MINUTE", "0"))
+
+LLM_STUB_LATENCY = float(os.getenv("LLM_STUB_LATENCY", "0.05"))
+
+def create_http_client() -> httpx.AsyncClient:
+    """Create a pooled async HTTP client for an LLM backend."""
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+    )
+
+class Usage:
+    def __init__(self, prompt_tokens: int = 0, completion_tokens: int = 0, total_tokens: Optional[int] = None):
+        self.prompt_tokens = prompt_tokens
+        self.completion_tokens = completion_tokens
+        self.total_tokens = prompt_tokens + completion_tokens if total_tokens is None else total_tokens
+
+class Completion:
+    """A finished completion and the response headers the rate limiter adapts to."""
+
+    def __init__(self, content: str, usage: Optional[Usage], headers: Any = None):
+        self.content = content
+        self.usage = usage
+        self.headers = headers or {}
+
+class CompletionStream:
+    """An open streamed completion yielding content deltas."""
+
+    def __init__(self, deltas: AsyncIterator[str], headers: Any, close):
+        self.deltas = deltas
+        self.headers = headers or {}
+        self._close = close
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self.deltas
+
+    async def aclose(self):
+        await self._close()
+
+class LLMBackend(ABC):
+    """Interface implemented by every backend."""
+
+    name = "backend"
+
+    def __init__(self, model: str, limiter: RateLimiter):
+        self.model = model
+        self.limiter = limiter
+
+    @abstractmethod
+    async def complete(self, messages: List[Dict[str, str]], timeout: float, **params) -> Completion:
+        """One chat completion."""
+
+    @abstractmethod
+    async def open_stream(self, messages: List[Dict[str, str]], timeout: float, **params) -> CompletionStream:
+        """A streamed chat completion, open once the response has started."""
+
+    async def ping(self) -> None:
+        """Raise if the backend cannot serve completions."""
+
+    async def aclose(self):
+        """Release connections; the next call opens new ones."""
+
+class GroqBackend(LLMBackend):
+    name = "groq"
+
+    def __init__(
+        self,
+        api_key: str,
+        model: str = GROQ_MODEL,
+        limiter: Optional[RateLimiter] = None,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
+        super().__init__(model, limiter or rate_limiter)
+        self.api_key = api_key
+        # The API client and its connection pool are created on first use
+        self._http_client = http_client
+        self._client: Optional[AsyncGroq] = None
+
+    @property
+    def client(self) -> AsyncGroq:
+        if self._client is None:
+            # Retries are handled by the router's rate limiter, not by the SDK
+            self._client = AsyncGroq(
+                api_key=self.api_key,
+                http_client=self._http_client or create_http_client(),
+                max_retries=0
+            )
+        return self._client
+
+    async def complete(self, messages: List[Dict[str, str]], timeout: float, **params) -> Completion:
+        raw = await self.client.chat.completions.with_raw_response.create(
+            model=self.model, messages=messages, timeout=timeout, **params
+        )
+        response = await raw.parse()
+        usage = None
+        if response.usage:
+            usage = Usage(response.usage.prompt_tokens, response.usage.completion_tokens, response.usage.total_tokens)
+        return Completion(response.choices[0].message.content, usage, raw.headers)
+
+    async def open_stream(self, messages: List[Dict[str, str]], timeout: float, **params) -> CompletionStream:
+        raw = await self.client.chat.completions.with_raw_response.create(
+            model=self.model, messages=messages, stream=True, timeout=timeout, **params
+        )
+        stream = await raw.parse()
+
+        async def deltas():
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+        return CompletionStream(deltas(), raw.headers, stream.response.aclose)
+
+    async def ping(self) -> None:
+        await self.client.models.list(timeout=LLM_CONNECT_TIMEOUT)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._http_client = None
+
+class OpenAICompatibleBackend(LLMBackend):
+    """Any endpoint implementing the OpenAI /chat/completions API."""
+
+    name = "openai"
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        model: str,
+        limiter: Optional[RateLimiter] = None,
+        http_client: Optional[httpx.AsyncClient] = None
+    ):
+        super().__init__(model, limiter or RateLimiter(LLM_OPENAI_REQUESTS_PER_MINUTE, LLM_OPENAI_TOKENS_PER_MINUTE))
+        self.base_url = base_url.rstrip("/")
+        self.api_key = api_key
+        self._http_client = http_client
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        if self._http_client is None:
+            self._http_client = create_http_client()
+        return self._http_client
+
+    def _headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
+    async def complete(self, messages: List[Dict[str, str]], timeout: float, **params) -> Completion:
+        response = await self.http_client.post(
+            f"{self.base_url}/chat/completions",
+            json={"model": self.model, "messages": messages, **params},
+            headers=self._headers(),
+            timeout=timeout
+        )
+        response.raise_for_status()
+        body = response.json()
+        usage = body.get("usage")
+        return Completion(
+            body["choices"][0]["message"]["content"],
+            Usage(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), usage.get("total_tokens")) if usage else None,
+            response.headers
+        )
+
+    async def open_stream(self, messages: List[Dict[str, str]], timeout: float, **params) -> CompletionStream:
+        request = self.http_client.build_request(
+            "POST",
+            f"{self.base_url}/chat/completions",
+            json={"model": self.model, "messages": messages, "stream": True, **params},
+            headers=self._headers(),
+            timeout=timeout
+        )
+        response = await self.http_client.send(request, stream=True)
+        if response.is_error:
+            await response.aread()
+            await response.aclose()
+            response.raise_for_status()
+
+        async def deltas():
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                content = choices[0].get("delta", {}).get("content") if choices else None
+                if content:
+                    yield content
+
+        return CompletionStream(deltas(), response.headers, response.aclose)
+
+    async def ping(self) -> None:
+        response = await self.http_client.get(
+            f"{self.base_url}/models", headers=self._headers(), timeout=LLM_CONNECT_TIMEOUT
+        )
+        response.raise_for_status()
+
+    async def aclose(self):
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+class StubBackend(LLMBackend):
+    """Local backend returning canned completions after a fixed latency."""
+
+    name = "stub"
+
+    def __init__(self, latency: float = LLM_STUB_LATENCY, content: str = "Thanks for sharing this, really interesting take!"):
+        super().__init__("stub", RateLimiter(requests_per_minute=0, tokens_per_minute=0))
+        self.latency = latency
+        self.content = content
+
+    def _content(self, params: Dict[str, Any]) -> str:
+        if params.get("response_format", {}).get("type") == "json_object":
+            return json.dumps({"analysis": "Neutral, conversational post.", "persona": "A friendly peer.", "reply": self.content})
+        return self.content
+
+    async def complete(self, messages: List[Dict[str, str]], timeout: float, **params) -> Completion:
+        # Like a real provider call, give up at the timeout
+        await asyncio.wait_for(asyncio.sleep(self.latency), timeout)
+        content = self._content(params)
+        prompt_tokens = sum(len(message["content"].split()) for message in messages)
+        return Completion(content, Usage(prompt_tokens, len(content.split())))
+
+    async def open_stream(self, messages: List[Dict[str, str]], timeout: float, **params) -> CompletionStream:
+        await asyncio.wait_for(asyncio.sleep(self.latency), timeout)
+        words = self._content(params).split(" ")
+
+        async def deltas():
+            for i, word in enumerate(words):
+                yield word if i == len(words) - 1 else word + " "
+
+        async def close():
+            pass
+
+        return CompletionStream(deltas(), {}, close)
+
+def create_backends(
+    names: str = LLM_BACKENDS,
+    http_client: Optional[httpx.AsyncClient] = None,
+    limiter: Optional[RateLimiter] = None
+) -> List[LLMBackend]:
+    """Build the backends listed in `names` from their environment settings.
+
+    `http_client` and `limiter` apply to the Groq backend, mainly for tests.
+    """
+    backends: List[LLMBackend] = []
+    for name in [name.strip() for name in names.split(",") if name.strip()]:
+        if name == "groq":
+            api_key = os.getenv("GROQ_API_KEY")
+            if not api_key:
+                raise ValueError("GROQ_API_KEY environment variable is not set")
+            backends.append(GroqBackend(api_key, os.getenv("GROQ_MODEL", GROQ_MODEL), limiter, http_client))
+        elif name == "openai":
+            backends.append(OpenAICompatibleBackend(LLM_OPENAI_BASE_URL, LLM_OPENAI_API_KEY, LLM_OPENAI_MODEL))
+        elif name == "stub":
+            backends.append(StubBackend())
+        else:
+            raise ValueError(f"Unknown LLM backend '{name}', expected groq, openai or stub")
+    if not backends:
+        raise ValueError("LLM_BACKENDS does not name any backend")
+    return backends
@@ -0,0 +1,254 @@
+"""
+Latency-aware routing of LLM calls across backends.
+
+The router keeps a rolling window of latencies and outcomes for every
+(backend, stage) pair. Each call goes to the healthy backend with the lowest
+median latency for its stage. A backend is unhealthy when its error rate is
+above LLM_ROUTER_MAX_ERROR_RATE. Backends with no recent samples rank first,
+so new backends are tried, and backends that failed are re-probed once their
+old samples age out of the window. If the chosen backend fails after its own
+rate-limit retries, the call fails over to the next one.
+
+With LLM_HEDGE_ENABLED, a completion that has not finished within the primary
+backend's p95 latency for that stage gets a second, hedged request. It goes to
+the next-ranked backend, or to the same one when only one is configured. The
+first successful response wins and the other request is cancelled. Hedging
+trades some extra tokens for a shorter tail. Streams are never hedged.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from ..admission import DeadlineExceeded
+from .llm_backends import Completion, LLMBackend
+
+LLM_ROUTER_WINDOW = int(os.getenv("LLM_ROUTER_WINDOW", "100"))
+LLM_ROUTER_WINDOW_SECONDS = float(os.getenv("LLM_ROUTER_WINDOW_SECONDS", "300"))
+LLM_ROUTER_MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "5"))
+LLM_ROUTER_MAX_ERROR_RATE = float(os.getenv("LLM_ROUTER_MAX_ERROR_RATE", "0.5"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "false").lower() == "true"
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.2"))
+
+class BackendStats:
+    """Rolling latency and error window for one backend and stage."""
+
+    def __init__(self, window: int, window_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.samples: deque = deque(maxlen=window)
+
+    def record(self, latency: float, ok: bool):
+        self.samples.append((self.clock(), latency, ok))
+
+    def _recent(self) -> List[Tuple[float, float, bool]]:
+        cutoff = self.clock() - self.window_seconds
+        while self.samples and self.samples[0][0] < cutoff:
+            self.samples.popleft()
+        return list(self.samples)
+
+    @property
+    def count(self) -> int:
+        return len(self._recent())
+
+    @property
+    def error_rate(self) -> float:
+        samples = self._recent()
+        return sum(1 for _, _, ok in samples if not ok) / len(samples) if samples else 0.0
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Latency quantile of successful calls, or None without any."""
+        latencies = sorted(latency for _, latency, ok in self._recent() if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))]
+
+class LLMRouter:
+    def __init__(
+        self,
+        backends: List[LLMBackend],
+        hedge: bool = LLM_HEDGE_ENABLED,
+        window: int = LLM_ROUTER_WINDOW,
+        window_seconds: float = LLM_ROUTER_WINDOW_SECONDS,
+        min_samples: int = LLM_ROUTER_MIN_SAMPLES,
+        max_error_rate: float = LLM_ROUTER_MAX_ERROR_RATE,
+        hedge_quantile: float = LLM_HEDGE_QUANTILE,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY
+    ):
+        self.backends = backends
+        self.hedge = hedge
+        self.window = window
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self._stats: Dict[Tuple[str, str], BackendStats] = {}
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def stats_for(self, backend: LLMBackend, stage: str) -> BackendStats:
+        key = (backend.name, stage)
+        if key not in self._stats:
+            self._stats[key] = BackendStats(self.window, self.window_seconds)
+        return self._stats[key]
+
+    def healthy(self, backend: LLMBackend, stage: str) -> bool:
+        stats = self.stats_for(backend, stage)
+        return stats.count < self.min_samples or stats.error_rate <= self.max_error_rate
+
+    def rank(self, stage: str) -> List[LLMBackend]:
+        """Backends for a stage: healthy before unhealthy, then fastest median first."""
+        def key(backend: LLMBackend):
+            median = self.stats_for(backend, stage).quantile(0.5)
+            return (not self.healthy(backend, stage), median if median is not None else 0.0)
+        # sorted() is stable, so ties keep the configured order
+        return sorted(self.backends, key=key)
+
+    def hedge_delay(self, backend: LLMBackend, stage: str) -> Optional[float]:
+        """How long to wait for the primary before hedging, once its latency is known."""
+        stats = self.stats_for(backend, stage)
+        if stats.count < self.min_samples:
+            return None
+        deadline = stats.quantile(self.hedge_quantile)
+        return None if deadline is None else max(deadline, self.hedge_min_delay)
+
+    async def _attempt(
+        self, backend: LLMBackend, stage: str, messages: List[Dict[str, str]],
+        tokens: float, priority: int, timeout: float, params: Dict[str, Any]
+    ) -> Completion:
+        start = time.perf_counter()
+        try:
+            completion = await backend.limiter.run(
+                lambda: backend.complete(messages, timeout, **params), tokens, priority
+            )
+        except (asyncio.CancelledError, DeadlineExceeded):
+            # A call shed for the request's deadline says nothing about the backend
+            raise
+        except Exception:
+            self.stats_for(backend, stage).record(time.perf_counter() - start, False)
+            raise
+        self.stats_for(backend, stage).record(time.perf_counter() - start, True)
+        backend.limiter.settle(tokens, completion.usage.total_tokens if completion.usage else None)
+        return completion
+
+    async def _failover(self, ranked: List[LLMBackend], stage: str, *args) -> Completion:
+        error: Optional[Exception] = None
+        for backend in ranked:
+            if error is not None:
+                self.failovers += 1
+            try:
+                return await self._attempt(backend, stage, *args)
+            except DeadlineExceeded:
+                # Another backend cannot beat the same deadline
+                raise
+            except Exception as e:
+                error = e
+        raise error
+
+    async def complete(
+        self, stage: str, messages: List[Dict[str, str]], tokens: float, priority: int, timeout: float, **params
+    ) -> Completion:
+        """Run a completion on the best backend for the stage, hedging and failing over as configured."""
+        ranked = self.rank(stage)
+        args = (messages, tokens, priority, timeout, params)
+        delay = self.hedge_delay(ranked[0], stage) if self.hedge else None
+        if delay is None:
+            return await self._failover(ranked, stage, *args)
+
+        primary = asyncio.ensure_future(self._attempt(ranked[0], stage, *args))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if primary in done:
+                if primary.exception() is None:
+                    return primary.result()
+                if len(ranked) == 1 or isinstance(primary.exception(), DeadlineExceeded):
+                    raise primary.exception()
+                self.failovers += 1
+                return await self._failover(ranked[1:], stage, *args)
+
+            self.hedges += 1
+            hedge_backend = ranked[1] if len(ranked) > 1 else ranked[0]
+            hedge = asyncio.ensure_future(self._attempt(hedge_backend, stage, *args))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        return task.result()
+            raise primary.exception()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(
+        self, stage: str, messages: List[Dict[str, str]], tokens: float, priority: int, timeout: float, **params
+    ) -> AsyncIterator[str]:
+        """Stream a completion from the best backend, failing over only before the first token."""
+        error: Optional[Exception] = None
+        for backend in self.rank(stage):
+            if error is not None:
+                self.failovers += 1
+            start = time.perf_counter()
+            try:
+                stream = await backend.limiter.run(
+                    lambda: backend.open_stream(messages, timeout, **params), tokens, priority
+                )
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                self.stats_for(backend, stage).record(time.perf_counter() - start, False)
+                error = e
+                continue
+            break
+        else:
+            raise error
+
+        finished = False
+        try:
+            async for delta in stream:
+                yield delta
+            finished = True
+        except Exception:
+            self.stats_for(backend, stage).record(time.perf_counter() - start, False)
+            raise
+        finally:
+            # Release the connection even if the consumer stops early
+            await stream.aclose()
+        if finished:
+            self.stats_for(backend, stage).record(time.perf_counter() - start, True)
+
+    async def ping(self) -> None:
+        """Succeed if at least one backend is reachable."""
+        results = await asyncio.gather(*(backend.ping() for backend in self.backends), return_exceptions=True)
+        errors = [result for result in results if isinstance(result, Exception)]
+        if len(errors) == len(results):
+            raise errors[0]
+
+    async def aclose(self):
+        for backend in self.backends:
+            await backend.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "failovers": self.failovers,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "backends": [
+                {
+                    "backend": name,
+                    "stage": stage,
+                    "samples": stats.count,
+                    "error_rate": stats.error_rate,
+                    "p50": stats.quantile(0.5),
+                    "p95": stats.quantile(0.95),
+                }
+                for (name, stage), stats in self._stats.items()
+            ],
+        }
@@ -8,7 +8,8 @@ responses by breaking down the reply generation process into distinct steps:
 2. Persona Creation: Generates a contextually appropriate responder persona
 3. Reply Generation: Creates the final reply using the analysis and persona
 
-The agent uses the Groq LLM API with the Llama 4 model for all operations.
+The agent calls the configured LLM backends (Groq with the Llama 4 model by default) through
+a latency-aware router; see llm_backends.py and llm_router.py.
 """
 
 # import os
@@ -112,103 +113,381 @@ This approach ensures responses are:
 - Contextually relevant
 - Naturally varied
 - Authentically human-like
+
+The generation strategy is selectable per deployment (LLM_STRATEGY) and per request:
+- chain: the three-call prompt chain described above (default)
+- direct: a single-step generation with platform-specific prompting and no
+  intermediate analysis; fewer API calls and lower latency, but less nuanced
+- fused: one call that returns analysis, persona and reply as a JSON object;
+  single-call latency while keeping the analysis fields. Output that fails
+  validation falls back to the chain.
+
+Prompts come from the precompiled registry in prompts.py. A post longer than
+LLM_POST_MAX_TOKENS is truncated (or summarized) once before the first stage,
+and the shortened text is reused by every stage. Each call also has a hard
+input token cap of its own.
 """
 
 import os
-from groq import Groq
+from pydantic import BaseModel, ValidationError, field_validator
 from dotenv import load_dotenv
-from typing import Dict, Any, List
+from typing import Dict, Any, AsyncIterator, Awaitable, Callable, List, Optional, Tuple
 import httpx
+from ..admission import DeadlineExceeded, call_timeout, remaining_time
+from ..metrics import llm_calls_in_flight, record_token_usage, stage_timer
+from .rate_limiter import PRIORITY_IN_FLIGHT, PRIORITY_NEW, RateLimiter, RateLimitExceeded, rate_limiter
+from .llm_backends import LLMBackend, create_backends
+from .llm_router import LLMRouter
+from .local_analysis import LocalAnalyzer, format_analysis, local_analyzer
+from .ranking import rank_replies
+from .cache_service import (
+    STAGE_CACHE_ENABLED, STAGE_CACHE_MAX_SIZE, STAGE_CACHE_TTL,
+    TTLCache, make_cache_key, normalize_text
+)
+from .prompts import (
+    ADAPT_SYSTEM, ADAPT_USER, ANALYSIS_SYSTEM, ANALYSIS_USER, CONDENSE_SYSTEM, CONDENSE_USER, DIRECT_SYSTEM, FUSED_SYSTEM,
+    PERSONA_SYSTEM, PERSONA_USER, PLATFORM_PROMPTS, PROMPT_VERSION, REPLY_SYSTEM, REPLY_USER, VARIANTS_FORMAT,
+    count_message_tokens, count_tokens, fit_messages, truncate_to_tokens
+)
 
 load_dotenv()
 
-my_client = httpx.Client(timeout=60.0)
+# Per-call timeout (seconds) for each stage
+STAGE_TIMEOUTS = {
+    "analysis": float(os.getenv("LLM_ANALYSIS_TIMEOUT", "20")),
+    "persona": float(os.getenv("LLM_PERSONA_TIMEOUT", "20")),
+    "reply": float(os.getenv("LLM_REPLY_TIMEOUT", "30")),
+    "direct": float(os.getenv("LLM_REPLY_TIMEOUT", "30")),
+    "fused": float(os.getenv("LLM_FUSED_TIMEOUT", "45")),
+    "condense": float(os.getenv("LLM_CONDENSE_TIMEOUT", "20")),
+    "adapt": float(os.getenv("LLM_ADAPT_TIMEOUT", "20")),
+    "variants": float(os.getenv("LLM_VARIANTS_TIMEOUT", "45")),
+}
+
+# Token budget: over-long posts are cut (or summarized) once to this size and
+# the result is reused by every stage
+LLM_POST_MAX_TOKENS = int(os.getenv("LLM_POST_MAX_TOKENS", "400"))
+LONG_POST_MODES = ("truncate", "summarize")
+LLM_LONG_POST_MODE = os.getenv("LLM_LONG_POST_MODE", "truncate")
+
+# Where the chain's analysis comes from: llm, local (lexicon scoring in a
+# process pool, no LLM call) or hybrid (local when it is confident, else llm)
+ANALYSIS_MODES = ("llm", "local", "hybrid")
+LLM_ANALYSIS_MODE = os.getenv("LLM_ANALYSIS_MODE", "llm")
+LOCAL_ANALYSIS_MIN_CONFIDENCE = float(os.getenv("LOCAL_ANALYSIS_MIN_CONFIDENCE", "0.6"))
+
+# Hard cap on the input tokens of each call; the longest message is trimmed to fit
+STAGE_INPUT_TOKEN_CAPS = {
+    "analysis": int(os.getenv("LLM_ANALYSIS_MAX_INPUT_TOKENS", "800")),
+    "persona": int(os.getenv("LLM_PERSONA_MAX_INPUT_TOKENS", "800")),
+    "reply": int(os.getenv("LLM_REPLY_MAX_INPUT_TOKENS", "1500")),
+    "direct": int(os.getenv("LLM_DIRECT_MAX_INPUT_TOKENS", "1000")),
+    "fused": int(os.getenv("LLM_FUSED_MAX_INPUT_TOKENS", "1200")),
+    "condense": int(os.getenv("LLM_CONDENSE_MAX_INPUT_TOKENS", "2500")),
+    "adapt": int(os.getenv("LLM_ADAPT_MAX_INPUT_TOKENS", "1200")),
+    "variants": int(os.getenv("LLM_VARIANTS_MAX_INPUT_TOKENS", "1500")),
+}
+
+# Scheduling priority of each stage: calls that continue a chain already in
+# flight are admitted before calls that start a new one
+STAGE_PRIORITIES = {
+    "analysis": PRIORITY_NEW,
+    "direct": PRIORITY_NEW,
+    "fused": PRIORITY_NEW,
+    "condense": PRIORITY_NEW,
+    "adapt": PRIORITY_NEW,
+    "persona": PRIORITY_IN_FLIGHT,
+    "reply": PRIORITY_IN_FLIGHT,
+    "variants": PRIORITY_IN_FLIGHT,
+}
+
+# Default generation strategy: chain, direct or fused
+STRATEGIES = ("chain", "direct", "fused")
+LLM_STRATEGY = os.getenv("LLM_STRATEGY", "chain")
+
+# Generation parameters for each stage of the prompt chain
+ANALYSIS_PARAMS = {"temperature": 0.3, "max_tokens": 200}
+PERSONA_PARAMS = {"temperature": 0.5, "max_tokens": 200}
+REPLY_PARAMS = {
+    "temperature": 0.7,
+    "max_tokens": 150,
+    "top_p": 0.9,
+    "frequency_penalty": 0.5,
+    "presence_penalty": 0.5,
+}
+DIRECT_PARAMS = REPLY_PARAMS
+FUSED_PARAMS = {
+    "temperature": 0.6,
+    "max_tokens": 600,
+    "response_format": {"type": "json_object"},
+}
+CONDENSE_PARAMS = {"temperature": 0.2, "max_tokens": LLM_POST_MAX_TOKENS}
+ADAPT_PARAMS = {"temperature": 0.4, "max_tokens": REPLY_PARAMS["max_tokens"]}
+# Several replies in one JSON completion; max_tokens grows with the count
+VARIANTS_PARAMS = {
+    "temperature": 0.9,
+    "top_p": 0.95,
+    "response_format": {"type": "json_object"},
+}
+
+class FusedOutput(BaseModel):
+    """Structured output expected from the fused strategy."""
+    analysis: str
+    persona: str
+    reply: str
+
+    @field_validator("analysis", "persona", "reply")
+    @classmethod
+    def not_empty(cls, value: str) -> str:
+        value = value.strip()
+        if not value:
+            raise ValueError("must not be empty")
+        return value
+
+class VariantsOutput(BaseModel):
+    """Structured output expected from a multi-variant completion."""
+    replies: List[str]
+
+class FusedOutputError(Exception):
+    """Raised when a fused completion is not valid structured output."""
+
+def _past_deadline(stage: str, error: Exception) -> Exception:
+    """`error`, or DeadlineExceeded when the call was cut short by the request deadline."""
+    budget = remaining_time()
+    if budget is None or budget > 0 or isinstance(error, (DeadlineExceeded, RateLimitExceeded)):
+        return error
+    exceeded = DeadlineExceeded(f"Request deadline expired during the {stage} call")
+    exceeded.__cause__ = error
+    return exceeded
 
 class LLMService:
-    def __init__(self):
-        api_key = os.getenv("GROQ_API_KEY")
-        if not api_key:
-            raise ValueError("GROQ_API_KEY environment variable is not set")
-        self.client = Groq(api_key=api_key, http_client=my_client)
-        self.model = "meta-llama/llama-4-scout-17b-16e-instruct"
+    def __init__(
+        self,
+        http_client: Optional[httpx.AsyncClient] = None,
+        strategy: str = LLM_STRATEGY,
+        limiter: Optional[RateLimiter] = None,
+        long_post_mode: str = LLM_LONG_POST_MODE,
+        backends: Optional[List[LLMBackend]] = None,
+        hedge: Optional[bool] = None,
+        analysis_mode: str = LLM_ANALYSIS_MODE,
+        analyzer: Optional[LocalAnalyzer] = None
+    ):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown LLM_STRATEGY '{strategy}', expected one of {', '.join(STRATEGIES)}")
+        if long_post_mode not in LONG_POST_MODES:
+            raise ValueError(f"Unknown LLM_LONG_POST_MODE '{long_post_mode}', expected one of {', '.join(LONG_POST_MODES)}")
+        if analysis_mode not in ANALYSIS_MODES:
+            raise ValueError(f"Unknown LLM_ANALYSIS_MODE '{analysis_mode}', expected one of {', '.join(ANALYSIS_MODES)}")
+        self.strategy = strategy
+        self.long_post_mode = long_post_mode
+        self.analysis_mode = analysis_mode
+        self.analyzer = analyzer or local_analyzer
+        # Analyses served by the LLM and by the local analyzer
+        self.analysis_sources: Dict[str, int] = {"llm": 0, "local": 0}
+        # Posts and stage prompts cut down to their token budget, by stage
+        self.prompt_truncations: Dict[str, int] = {}
+        # Fused completions that failed validation and were regenerated with the chain
+        self.fused_fallbacks = 0
+        # Backends from LLM_BACKENDS unless given; http_client and limiter apply to Groq
+        backends = backends or create_backends(http_client=http_client, limiter=limiter)
+        self.router = LLMRouter(backends) if hedge is None else LLMRouter(backends, hedge=hedge)
+        # Every backend that may answer, since any of them can produce a given reply
+        self.model = ",".join(f"{backend.name}:{backend.model}" for backend in backends)
+        # Memoized analysis and persona results, shared across platforms and regenerations
+        self.stage_caches: Dict[str, TTLCache] = {}
+        if STAGE_CACHE_ENABLED:
+            self.stage_caches = {
+                "analysis": TTLCache(STAGE_CACHE_MAX_SIZE, STAGE_CACHE_TTL),
+                "persona": TTLCache(STAGE_CACHE_MAX_SIZE, STAGE_CACHE_TTL),
+                "condense": TTLCache(STAGE_CACHE_MAX_SIZE, STAGE_CACHE_TTL),
+            }
+
+    def generation_config(self, strategy: Optional[str] = None, variants: int = 1) -> Dict[str, Any]:
+        """Describe the model, strategy and parameters that determine a generated reply."""
+        strategy = strategy or self.strategy
+        config = {
+            "model": self.model,
+            "strategy": strategy,
+            "prompts": PROMPT_VERSION,
+            "post_budget": [LLM_POST_MAX_TOKENS, self.long_post_mode],
+        }
+        if strategy == "direct":
+            config["direct"] = DIRECT_PARAMS
+        elif strategy == "fused":
+            config["fused"] = FUSED_PARAMS
+        if strategy != "direct":
+            config.update(analysis=ANALYSIS_PARAMS, persona=PERSONA_PARAMS, reply=REPLY_PARAMS)
+            if self.analysis_mode != "llm":
+                config["analysis_mode"] = [self.analysis_mode, LOCAL_ANALYSIS_MIN_CONFIDENCE]
+        if variants > 1:
+            config["variants"] = [variants, VARIANTS_PARAMS]
+        return config
+
+    async def aclose(self):
+        """Close every backend's connection pool and the analysis pool; the next call opens new ones."""
+        await self.router.aclose()
+        self.analyzer.close()
+
+    async def ping(self) -> None:
+        """Check that at least one LLM backend is reachable and accepts our credentials."""
+        await self.router.ping()
+
+    def _estimate_tokens(self, messages: List[Dict[str, str]], params: Dict[str, Any]) -> int:
+        """Token cost of a call: the counted prompt plus the output cap."""
+        return count_message_tokens(messages) + params.get("max_tokens", 0)
+
+    def _fit(self, stage: str, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Enforce the stage's hard input token cap."""
+        messages, truncated = fit_messages(messages, STAGE_INPUT_TOKEN_CAPS[stage])
+        if truncated:
+            self.prompt_truncations[stage] = self.prompt_truncations.get(stage, 0) + 1
+        return messages
+
+    async def _complete(self, stage: str, messages: List[Dict[str, str]], **params) -> str:
+        """Run a single chat completion for the given stage without blocking the event loop."""
+        messages = self._fit(stage, messages)
+        estimated = self._estimate_tokens(messages, params)
+        # Never wait on the provider past the request's deadline
+        timeout = call_timeout(STAGE_TIMEOUTS[stage], f"{stage} call")
+        with stage_timer(stage):
+            llm_calls_in_flight.inc(stage=stage)
+            try:
+                completion = await self.router.complete(
+                    stage, messages, estimated, STAGE_PRIORITIES[stage], timeout, **params
+                )
+            except Exception as e:
+                raise _past_deadline(stage, e)
+            finally:
+                llm_calls_in_flight.dec(stage=stage)
+        record_token_usage(stage, completion.usage)
+        return completion.content.strip()
+
+    async def _stream_complete(self, stage: str, messages: List[Dict[str, str]], **params) -> AsyncIterator[str]:
+        """Run a streaming chat completion for the given stage, yielding content deltas."""
+        messages = self._fit(stage, messages)
+        timeout = call_timeout(STAGE_TIMEOUTS[stage], f"{stage} call")
+        with stage_timer(stage):
+            llm_calls_in_flight.inc(stage=stage)
+            try:
+                async for delta in self.router.stream(
+                    stage, messages, self._estimate_tokens(messages, params),
+                    STAGE_PRIORITIES[stage], timeout, **params
+                ):
+                    yield delta
+            except Exception as e:
+                raise _past_deadline(stage, e)
+            finally:
+                llm_calls_in_flight.dec(stage=stage)
+
+    async def _memoized(self, stage: str, key_parts: tuple, compute: Callable[[], Awaitable[str]]) -> str:
+        """Return the cached output of a stage, computing and caching it on a miss."""
+        cache = self.stage_caches.get(stage)
+        if cache is None:
+            return await compute()
+        key = make_cache_key(stage, self.model, *key_parts)
+        value = cache.get(key)
+        if value is None:
+            value = await compute()
+            cache.set(key, value)
+        return value
+
+    def stage_cache_stats(self) -> Dict[str, Any]:
+        """Hit/miss/eviction counters for each memoized stage."""
+        return {stage: cache.stats() for stage, cache in self.stage_caches.items()}
 
     def _get_platform_prompt(self, platform: str) -> str:
         """Get platform-specific prompt instructions."""
-        prompts = {
-            "twitter": """You are a Twitter user. Your replies should be:
-            - Concise (under 280 characters)
-            - Casual and conversational
-            - Use emojis naturally
-            - Include hashtags when relevant
-            - Match the tone of the original post""",
-            
-            "linkedin": """You are a LinkedIn professional. Your replies should be:
-            - Professional and insightful
-            - Focus on value and expertise
-            - Use industry-specific terminology
-            - Maintain a business-appropriate tone
-            - Include relevant professional context""",
-            
-            "instagram": """You are an Instagram user. Your replies should be:
-            - Friendly and engaging
-            - Use emojis liberally
-            - Include relevant hashtags
-            - Match the visual/creative nature of Instagram
-            - Be authentic and personal"""
-        }
-        return prompts.get(platform, prompts["twitter"])
+        return PLATFORM_PROMPTS.get(platform, PLATFORM_PROMPTS["twitter"])
+
+    async def _prepare_post(self, post_text: str) -> str:
+        """Fit the post into its token budget once, so every stage reuses the same text."""
+        if count_tokens(post_text) <= LLM_POST_MAX_TOKENS:
+            return post_text
+        self.prompt_truncations["post"] = self.prompt_truncations.get("post", 0) + 1
+        if self.long_post_mode == "summarize":
+            return await self._condense_post(post_text)
+        return truncate_to_tokens(post_text, LLM_POST_MAX_TOKENS)
+
+    async def _condense_post(self, post_text: str) -> str:
+        """Summarize an over-long post down to the post token budget."""
+        messages = [
+            {"role": "system", "content": CONDENSE_SYSTEM},
+            {"role": "user", "content": CONDENSE_USER.render(
+                max_words=LLM_POST_MAX_TOKENS * 3 // 4, post_text=post_text
+            )}
+        ]
+        condensed = await self._memoized(
+            "condense",
+            (CONDENSE_PARAMS, PROMPT_VERSION, normalize_text(post_text)),
+            lambda: self._complete("condense", messages, **CONDENSE_PARAMS)
+        )
+        # The model may overshoot the requested length
+        return truncate_to_tokens(condensed, LLM_POST_MAX_TOKENS)
 
     async def _analyze_post(self, post_text: str) -> Dict[str, Any]:
         """Analyze the post's sentiment, tone, and key topics."""
-        analysis_prompt = f"""Analyze this social media post and provide:
-        1. Sentiment (positive/negative/neutral)
-        2. Tone (formal/casual/professional/friendly)
-        3. Key topics or themes
-        4. Any specific emotions expressed
-        
-        Post: {post_text}
-        
-        Provide the analysis in a structured format."""
+        if self.analysis_mode != "llm":
+            local = await self.analyzer.analyze(post_text)
+            if self.analysis_mode == "local" or local["confidence"] >= LOCAL_ANALYSIS_MIN_CONFIDENCE:
+                self.analysis_sources["local"] += 1
+                return {"analysis": format_analysis(local)}
 
+        self.analysis_sources["llm"] += 1
         messages = [
-            {"role": "system", "content": "You are an expert at analyzing social media content."},
-            {"role": "user", "content": analysis_prompt}
+            {"role": "system", "content": ANALYSIS_SYSTEM},
+            {"role": "user", "content": ANALYSIS_USER.render(post_text=post_text)}
         ]
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=0.3,
-            max_tokens=200
+        # The analysis depends only on the post, so every platform can reuse it
+        analysis = await self._memoized(
+            "analysis",
+            (ANALYSIS_PARAMS, PROMPT_VERSION, normalize_text(post_text)),
+            lambda: self._complete("analysis", messages, **ANALYSIS_PARAMS)
         )
-        return {"analysis": response.choices[0].message.content.strip()}
+        return {"analysis": analysis}
 
     async def _generate_persona(self, platform: str, analysis: Dict[str, Any]) -> str:
         """Generate a persona based on platform and post analysis."""
-        persona_prompt = f"""Based on the following analysis and platform, create a detailed persona:
-        Platform: {platform}
-        Analysis: {analysis['analysis']}
-        
-        Include:
-        1. Personality traits
-        2. Communication style
-        3. Typical interests
-        4. Response patterns"""
-
         messages = [
-            {"role": "system", "content": "You are an expert at creating authentic social media personas."},
-            {"role": "user", "content": persona_prompt}
+            {"role": "system", "content": PERSONA_SYSTEM},
+            {"role": "user", "content": PERSONA_USER.render(platform=platform, analysis=analysis['analysis'])}
         ]
 
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=0.5,
-            max_tokens=200
+        return await self._memoized(
+            "persona",
+            (PERSONA_PARAMS, PROMPT_VERSION, platform, analysis['analysis']),
+            lambda: self._complete("persona", messages, **PERSONA_PARAMS)
         )
-        return response.choices[0].message.content.strip()
 
-    async def generate_reply(self, platform: str, post_text: str) -> str:
+    def _build_reply_messages(
+        self, platform: str, post_text: str, analysis: Dict[str, Any], persona: str
+    ) -> List[Dict[str, str]]:
+        """Build the final reply prompt from the analysis and persona."""
+        system_prompt = REPLY_SYSTEM.render(
+            platform_prompt=self._get_platform_prompt(platform),
+            persona=persona,
+            analysis=analysis['analysis']
+        )
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": REPLY_USER.render(platform=platform, post_text=post_text)}
+        ]
+
+    def _build_direct_messages(self, platform: str, post_text: str) -> List[Dict[str, str]]:
+        """Build the single-step prompt used by the direct strategy."""
+        return [
+            {"role": "system", "content": DIRECT_SYSTEM.get(platform, DIRECT_SYSTEM["twitter"])},
+            {"role": "user", "content": REPLY_USER.render(platform=platform, post_text=post_text)}
+        ]
+
+    def _build_fused_messages(self, platform: str, post_text: str) -> List[Dict[str, str]]:
+        """Build the single-call prompt that returns analysis, persona and reply as JSON."""
+        return [
+            {"role": "system", "content": FUSED_SYSTEM.get(platform, FUSED_SYSTEM["twitter"])},
+            {"role": "user", "content": REPLY_USER.render(platform=platform, post_text=post_text)}
+        ]
+
+    async def _generate_chain(self, platform: str, post_text: str) -> Dict[str, Any]:
         """Generate a human-like reply using a multi-step approach."""
         # Step 1: Analyze the post
         analysis = await self._analyze_post(post_text)
@@ -217,46 +496,154 @@ class LLMService:
         persona = await self._generate_persona(platform, analysis)
         
         # Step 3: Generate the reply
-        platform_prompt = self._get_platform_prompt(platform)
-        
-        system_prompt = f"""You are an expert at generating human-like social media replies.
-        {platform_prompt}
-        
-        Use this persona to guide your response:
-        {persona}
-        
-        Post analysis:
-        {analysis['analysis']}
-        
-        Follow these steps:
-        1. Ensure the reply matches the analyzed sentiment and tone
-        2. Incorporate relevant topics from the analysis
-        3. Maintain the persona's characteristics
-        4. Generate a reply that feels natural and authentic
-        
-        Avoid:
-        - Generic or overly formal language
-        - Repetitive patterns
-        - AI-like responses
-        - Excessive punctuation or emojis
+        messages = self._build_reply_messages(platform, post_text, analysis, persona)
+        reply = await self._complete("reply", messages, **REPLY_PARAMS)
+        return {"reply": reply, "analysis": analysis["analysis"], "persona": persona}
+
+    async def _generate_direct(self, platform: str, post_text: str) -> Dict[str, Any]:
+        """Generate a reply in a single step without intermediate analysis."""
+        messages = self._build_direct_messages(platform, post_text)
+        reply = await self._complete("direct", messages, **DIRECT_PARAMS)
+        return {"reply": reply, "analysis": None, "persona": None}
+
+    async def _generate_fused(self, platform: str, post_text: str) -> Dict[str, Any]:
+        """Generate analysis, persona and reply in one structured completion."""
+        messages = self._build_fused_messages(platform, post_text)
+        content = await self._complete("fused", messages, **FUSED_PARAMS)
+        try:
+            output = FusedOutput.model_validate_json(content)
+        except ValidationError as e:
+            raise FusedOutputError(f"Invalid fused output: {str(e)}")
+        return output.model_dump()
+
+    async def generate(self, platform: str, post_text: str, strategy: Optional[str] = None) -> Dict[str, Any]:
+        """Generate a reply with the given strategy, returning the reply and any intermediate results."""
+        strategy = strategy or self.strategy
+        try:
+            post_text = await self._prepare_post(post_text)
+            if strategy == "direct":
+                result = await self._generate_direct(platform, post_text)
+            elif strategy == "fused":
+                try:
+                    result = await self._generate_fused(platform, post_text)
+                except FusedOutputError:
+                    # Keep the analysis fields by falling back to the full chain
+                    self.fused_fallbacks += 1
+                    strategy = "chain"
+                    result = await self._generate_chain(platform, post_text)
+            else:
+                result = await self._generate_chain(platform, post_text)
+        except (RateLimitExceeded, DeadlineExceeded):
+            raise
+        except Exception as e:
+            raise Exception(f"Error generating reply: {str(e)}")
+        result["strategy"] = strategy
+        return result
+
+    async def generate_reply(self, platform: str, post_text: str, strategy: Optional[str] = None) -> str:
+        """Generate a human-like reply using the selected strategy."""
+        result = await self.generate(platform, post_text, strategy)
+        return result["reply"]
+
+    async def generate_variants(
+        self, platform: str, post_text: str, count: int, strategy: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Generate `count` candidate replies in one completion, ranked best first.
+
+        Analysis and persona run once (except with the direct strategy, which
+        skips them); fused is treated like chain so both stages are shared.
         """
+        strategy = strategy or self.strategy
+        try:
+            post_text = await self._prepare_post(post_text)
+            if strategy == "direct":
+                analysis, persona = None, None
+                messages = self._build_direct_messages(platform, post_text)
+            else:
+                strategy = "chain"
+                analysis = await self._analyze_post(post_text)
+                persona = await self._generate_persona(platform, analysis)
+                messages = self._build_reply_messages(platform, post_text, analysis, persona)
+            messages[0] = {
+                "role": "system",
+                "content": messages[0]["content"] + "\n\n" + VARIANTS_FORMAT.render(count=count)
+            }
+            params = {**VARIANTS_PARAMS, "max_tokens": REPLY_PARAMS["max_tokens"] * count + 50}
+            content = await self._complete("variants", messages, **params)
+            try:
+                replies = VariantsOutput.model_validate_json(content).replies
+            except ValidationError as e:
+                raise Exception(f"Invalid variants output: {str(e)}")
+            # Drop empty and repeated candidates
+            unique = {}
+            for reply in replies:
+                if reply.strip():
+                    unique.setdefault(normalize_text(reply).lower(), reply.strip())
+            if not unique:
+                raise Exception("The model returned no usable replies")
+        except (RateLimitExceeded, DeadlineExceeded):
+            raise
+        except Exception as e:
+            raise Exception(f"Error generating reply variants: {str(e)}")
+        return {
+            "variants": rank_replies(platform, post_text, list(unique.values())[:count]),
+            "analysis": analysis["analysis"] if analysis else None,
+            "persona": persona,
+            "strategy": strategy,
+        }
 
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Generate a reply to this {platform} post:\n\n{post_text}"}
-        ]
+    async def adapt_reply(self, platform: str, post_text: str, original_post: str, reply: str) -> str:
+        """Rewrite a reply to a near-duplicate post so it fits this post, in one call."""
+        try:
+            post_text = await self._prepare_post(post_text)
+            messages = [
+                {"role": "system", "content": ADAPT_SYSTEM},
+                {"role": "user", "content": ADAPT_USER.render(
+                    platform=platform, original_post=original_post, reply=reply, post_text=post_text
+                )}
+            ]
+            return await self._complete("adapt", messages, **ADAPT_PARAMS)
+        except (RateLimitExceeded, DeadlineExceeded):
+            raise
+        except Exception as e:
+            raise Exception(f"Error adapting reply: {str(e)}")
 
+    async def stream_reply(
+        self, platform: str, post_text: str, strategy: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Run the selected strategy, yielding stage results and reply tokens as they arrive."""
+        strategy = strategy or self.strategy
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=150,
-                top_p=0.9,
-                frequency_penalty=0.5,
-                presence_penalty=0.5
-            )
-            return response.choices[0].message.content.strip()
+            post_text = await self._prepare_post(post_text)
+            if strategy == "direct":
+                messages = self._build_direct_messages(platform, post_text)
+                async for token in self._stream_complete("direct", messages, **DIRECT_PARAMS):
+                    yield "token", {"token": token}
+                return
+
+            if strategy == "fused":
+                # The structured output cannot be streamed field by field, so emit it whole
+                try:
+                    result = await self._generate_fused(platform, post_text)
+                except FusedOutputError:
+                    self.fused_fallbacks += 1
+                else:
+                    yield "analysis", {"analysis": result["analysis"]}
+                    yield "persona", {"persona": result["persona"]}
+                    yield "token", {"token": result["reply"]}
+                    return
+
+            analysis = await self._analyze_post(post_text)
+            yield "analysis", analysis
+
+            persona = await self._generate_persona(platform, analysis)
+            yield "persona", {"persona": persona}
+
+            messages = self._build_reply_messages(platform, post_text, analysis, persona)
+            async for token in self._stream_complete("reply", messages, **REPLY_PARAMS):
+                yield "token", {"token": token}
+        except (RateLimitExceeded, DeadlineExceeded):
+            raise
         except Exception as e:
             raise Exception(f"Error generating reply: {str(e)}")
 
@@ -267,114 +654,12 @@ except ValueError as e:
     print(f"Warning: {str(e)}")
     llm_service = None
 
-
-
-"""
-This module implements a direct LLM-based approach for generating social media replies.
-The approach uses a single-step generation process with platform-specific prompting.
-
-Key characteristics:
-- Uses Groq's LLM API with the Llama 4 Scout model
-- Implements platform-specific prompting for Twitter, LinkedIn, and Instagram
-- Single-step generation process without intermediate analysis
-- Configurable generation parameters (temperature, tokens, etc.)
-- Simple error handling and singleton pattern
-
-Trade-offs:
-+ Simpler implementation with fewer API calls
-+ Lower latency due to single-step generation
-+ More straightforward error handling
-- Less nuanced responses without intermediate analysis
-- No explicit sentiment or tone analysis
-- Limited context awareness compared to multi-step approaches
-"""
-
-# import os
-# from groq import Groq
-# from dotenv import load_dotenv
-# from typing import Dict, Any
-# import httpx
-
-# load_dotenv()
-
-# my_client = httpx.Client(timeout=60.0)
-
-# class LLMService:
-#     def __init__(self):
-#         api_key = os.getenv("GROQ_API_KEY")
-#         if not api_key:
-#             raise ValueError("GROQ_API_KEY environment variable is not set")
-#         self.client = Groq(api_key=api_key, http_client=my_client)
-#         self.model = "meta-llama/llama-4-scout-17b-16e-instruct"  
-
-#     def _get_platform_prompt(self, platform: str) -> str:
-#         """Get platform-specific prompt instructions."""
-#         prompts = {
-#             "twitter": """You are a Twitter user. Your replies should be:
-#             - Concise (under 280 characters)
-#             - Casual and conversational
-#             - Use emojis naturally
-#             - Include hashtags when relevant
-#             - Match the tone of the original post""",
-            
-#             "linkedin": """You are a LinkedIn professional. Your replies should be:
-#             - Professional and insightful
-#             - Focus on value and expertise
-#             - Use industry-specific terminology
-#             - Maintain a business-appropriate tone
-#             - Include relevant professional context""",
-            
-#             "instagram": """You are an Instagram user. Your replies should be:
-#             - Friendly and engaging
-#             - Use emojis liberally
-#             - Include relevant hashtags
-#             - Match the visual/creative nature of Instagram
-#             - Be authentic and personal"""
-#         }
-#         return prompts.get(platform, prompts["twitter"])
-
-#     async def generate_reply(self, platform: str, post_text: str) -> str:
-#         """Generate a human-like reply using Groq LLM."""
-#         platform_prompt = self._get_platform_prompt(platform)
-        
-#         system_prompt = f"""You are an expert at generating human-like social media replies.
-#         {platform_prompt}
-        
-#         Follow these steps:
-#         1. Analyze the post's content and context
-#         2. Determine the appropriate tone and style
-#         3. Generate a reply that feels natural and authentic
-#         4. Ensure the reply matches the platform's characteristics
-        
-#         Avoid:
-#         - Generic or overly formal language
-#         - Repetitive patterns
-#         - AI-like responses
-#         - Excessive punctuation or emojis
-#         """
-
-#         messages = [
-#             {"role": "system", "content": system_prompt},
-#             {"role": "user", "content": f"Generate a reply to this {platform} post:\n\n{post_text}"}
-#         ]
-
-#         try:
-#             response = self.client.chat.completions.create(
-#                 model=self.model,
-#                 messages=messages,
-#                 temperature=0.7,
-#                 max_tokens=150,
-#                 top_p=0.9,
-#                 frequency_penalty=0.5,
-#                 presence_penalty=0.5
-#             )
-#             return response.choices[0].message.content.strip()
-#         except Exception as e:
-#             raise Exception(f"Error generating reply: {str(e)}")
-
-# # Create a singleton instance
-# try:
-#     llm_service = LLMService()
-# except ValueError as e:
-#     print(f"Warning: {str(e)}")
-#     llm_service = None 
\ No newline at end of file
+def llm_limiters() -> List[RateLimiter]:
+    """The distinct rate limiters of the configured LLM backends."""
+    if llm_service is None:
+        return [rate_limiter]
+    limiters: List[RateLimiter] = []
+    for backend in llm_service.router.backends:
+        if all(backend.limiter is not limiter for limiter in limiters):
+            limiters.append(backend.limiter)
+    return limiters
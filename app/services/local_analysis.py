@@ -0,0 +1,257 @@
+"""
+Local post analysis without an LLM call.
+
+A lexicon-based sentiment scorer (with negation and intensifier handling),
+tone heuristics, keyword, hashtag, mention and emoji extraction and stopword
+based language detection. It approximates the chain's analysis stage in about
+a millisecond and renders its result in the same shape, so the persona stage
+consumes it unchanged.
+
+The scoring is pure CPU work, so LocalAnalyzer runs it in a process pool and
+the event loop never waits on it. The module imports nothing from the app, so
+pool workers start quickly.
+"""
+
+import asyncio
+import os
+import re
+import unicodedata
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+# Processes in the analysis pool; 0 scores on the event loop thread instead
+LOCAL_ANALYSIS_WORKERS = int(os.getenv("LOCAL_ANALYSIS_WORKERS", "2"))
+
+# Word polarity on a -3..3 scale
+LEXICON = {
+    "amazing": 3, "awesome": 3, "best": 3, "brilliant": 3, "excellent": 3, "fantastic": 3, "incredible": 3,
+    "love": 3, "loved": 3, "outstanding": 3, "perfect": 3, "wonderful": 3, "thrilled": 3, "superb": 3,
+    "beautiful": 2, "congrats": 2, "congratulations": 2, "delighted": 2, "enjoy": 2, "enjoyed": 2,
+    "excited": 2, "exciting": 2, "fun": 2, "glad": 2, "grateful": 2, "great": 2, "happy": 2, "impressive": 2,
+    "inspiring": 2, "proud": 2, "thank": 2, "thanks": 2, "win": 2, "won": 2, "success": 2, "successful": 2,
+    "celebrate": 2, "recommend": 2, "helpful": 2, "lovely": 2, "cool": 1, "good": 1, "like": 1, "nice": 1,
+    "interesting": 1, "hope": 1, "hopeful": 1, "useful": 1, "easy": 1, "fine": 1, "ok": 0, "okay": 0,
+    "launch": 1, "launched": 1, "growth": 1, "improved": 1, "agree": 1, "fair": 1, "promising": 1,
+    "awful": -3, "disgusting": -3, "hate": -3, "horrible": -3, "terrible": -3, "worst": -3, "furious": -3,
+    "pathetic": -3, "disaster": -3, "outraged": -3, "angry": -2, "annoyed": -2, "annoying": -2, "bad": -2,
+    "broken": -2, "disappointed": -2, "disappointing": -2, "fail": -2, "failed": -2, "failure": -2,
+    "frustrated": -2, "frustrating": -2, "sad": -2, "scary": -2, "sick": -2, "stupid": -2, "ugly": -2,
+    "upset": -2, "useless": -2, "waste": -2, "worried": -2, "wrong": -2, "lost": -2, "afraid": -2,
+    "boring": -1, "confused": -1, "difficult": -1, "hard": -1, "problem": -1, "slow": -1, "tired": -1,
+    "unfortunately": -1, "issue": -1, "bug": -1, "concern": -1, "miss": -1, "meh": -1, "doubt": -1,
+}
+
+EMOJI_SENTIMENT = {
+    "😀": 2, "😃": 2, "😄": 2, "😁": 2, "😊": 2, "😍": 3, "🥰": 3, "😎": 1, "🙂": 1, "😂": 1, "🤣": 1,
+    "🎉": 2, "🥳": 3, "❤": 3, "💯": 2, "🔥": 2, "👏": 2, "👍": 1, "🙌": 2, "✨": 1, "🚀": 2, "💪": 2,
+    "😢": -2, "😭": -2, "😞": -2, "😔": -2, "😡": -3, "😠": -3, "🤬": -3, "👎": -2, "💔": -2, "😩": -2,
+    "😤": -2, "🙄": -1, "😬": -1, "😕": -1,
+}
+
+EMOTIONS = {
+    "joy": {"happy", "glad", "love", "loved", "fun", "enjoy", "enjoyed", "delighted", "celebrate", "thrilled", "😂", "😊", "😄", "🥳", "🎉"},
+    "excitement": {"excited", "exciting", "amazing", "awesome", "incredible", "launch", "launched", "finally", "🚀", "🔥"},
+    "gratitude": {"thank", "thanks", "grateful", "appreciate", "congrats", "congratulations", "🙏"},
+    "pride": {"proud", "win", "won", "success", "successful", "achievement", "milestone", "💪"},
+    "anger": {"angry", "furious", "hate", "outraged", "annoyed", "annoying", "ridiculous", "😡", "😠", "🤬"},
+    "sadness": {"sad", "disappointed", "disappointing", "miss", "lost", "unfortunately", "😢", "😭", "💔"},
+    "fear": {"afraid", "scary", "worried", "anxious", "nervous", "concern"},
+    "frustration": {"frustrated", "frustrating", "broken", "bug", "issue", "problem", "useless", "🙄", "😤"},
+    "surprise": {"wow", "unexpected", "surprised", "shocked", "unbelievable", "😮", "😲", "🤯"},
+}
+
+NEGATIONS = {"not", "no", "never", "none", "nobody", "nothing", "neither", "nor", "cannot", "cant", "dont",
+             "doesnt", "didnt", "isnt", "wasnt", "arent", "wont", "wouldnt", "shouldnt", "hardly", "without"}
+INTENSIFIERS = {"very": 1.5, "really": 1.5, "so": 1.4, "super": 1.6, "extremely": 1.8, "incredibly": 1.8,
+                "totally": 1.5, "absolutely": 1.7, "truly": 1.4, "quite": 1.2, "pretty": 1.2, "most": 1.3}
+DAMPENERS = {"slightly": 0.5, "somewhat": 0.6, "kinda": 0.6, "barely": 0.4, "little": 0.6}
+
+CASUAL_MARKERS = {"lol", "lmao", "omg", "gonna", "wanna", "gotta", "yeah", "yep", "nope", "hey", "guys", "btw",
+                  "tbh", "imo", "ngl", "kinda", "sorta", "dude", "haha", "y'all", "yall"}
+PROFESSIONAL_MARKERS = {"team", "strategy", "business", "growth", "customers", "clients", "leadership", "industry",
+                        "market", "revenue", "announce", "pleased", "opportunity", "role", "hiring", "career",
+                        "partnership", "insights", "stakeholders", "initiative", "product", "quarter", "solution"}
+FORMAL_MARKERS = {"therefore", "furthermore", "moreover", "however", "regarding", "accordingly", "hereby",
+                  "whereas", "sincerely", "respectfully", "consequently", "nevertheless"}
+
+STOPWORDS = {
+    "en": {"the", "and", "is", "to", "of", "a", "in", "that", "it", "for", "on", "with", "this", "you", "are",
+           "was", "be", "have", "at", "my", "i", "we", "our", "just", "what", "so", "but", "not", "your", "from",
+           "an", "or", "they", "has", "all", "will", "can", "me", "about", "do", "out", "up", "more", "how",
+           "been", "if", "who", "get", "one", "there", "their", "by", "as", "its", "am", "were", "had", "would",
+           "today", "new", "now", "than", "then", "some", "into", "very", "really", "like", "dont", "im", "it's"},
+    "es": {"el", "la", "de", "que", "y", "en", "los", "las", "por", "con", "una", "un", "para", "es", "del",
+           "muy", "pero", "como", "más", "mi", "lo", "se", "al", "este", "esta"},
+    "fr": {"le", "la", "les", "de", "des", "et", "est", "un", "une", "pour", "dans", "que", "qui", "pas",
+           "sur", "avec", "je", "nous", "vous", "très", "mais", "du", "au", "ce", "cette"},
+    "de": {"der", "die", "das", "und", "ist", "nicht", "ich", "wir", "mit", "ein", "eine", "für", "auf",
+           "den", "dem", "sehr", "aber", "auch", "zu", "von", "es", "sie"},
+    "pt": {"o", "os", "as", "de", "que", "e", "em", "um", "uma", "para", "com", "não", "muito", "mas", "do",
+           "da", "no", "na", "meu", "minha", "é"},
+    "it": {"il", "lo", "gli", "di", "che", "e", "è", "un", "una", "per", "con", "non", "molto", "ma", "del",
+           "della", "sono", "questo", "questa", "mi"},
+}
+
+# Common words that say nothing about a post's topic
+FILLER = {"again", "also", "still", "even", "much", "many", "every", "everyone", "something", "anything",
+          "thing", "things", "time", "know", "think", "want", "need", "make", "made", "going", "back", "here",
+          "there", "these", "those", "them", "which", "when", "where", "while", "should", "could", "would",
+          "being", "after", "before", "other", "only", "same", "either", "ever", "over", "through", "first",
+          "last", "year", "week", "days", "look", "looking", "come", "take", "give", "said", "says", "well"}
+
+_WORDS = re.compile(r"[#@]?[\w'’]+")
+_HASHTAGS = re.compile(r"#(\w+)")
+_MENTIONS = re.compile(r"@(\w+)")
+_URLS = re.compile(r"https?://\S+")
+
+# Sentiment words seen before a post counts as clearly positive or negative
+CONFIDENT_HITS = 3
+
+def _is_emoji(char: str) -> bool:
+    return unicodedata.category(char) == "So" or char in EMOJI_SENTIMENT
+
+def find_emojis(text: str) -> List[str]:
+    return [char for char in text if _is_emoji(char)]
+
+def detect_language(words: List[str]) -> str:
+    """Language whose stopwords cover the most words, or "unknown"."""
+    scores = {language: sum(1 for word in words if word in stopwords) for language, stopwords in STOPWORDS.items()}
+    language, hits = max(scores.items(), key=lambda item: item[1])
+    return language if hits >= 2 or (hits == 1 and len(words) <= 4) else "unknown"
+
+def _is_negation(word: str) -> bool:
+    return word.replace("'", "") in NEGATIONS or word.endswith("n't")
+
+def negated(words: List[str], i: int) -> bool:
+    """Whether one of the three words before words[i] negates it."""
+    return any(_is_negation(previous) for previous in words[max(0, i - 3):i])
+
+def score_sentiment(words: List[str], emojis: List[str]) -> Dict[str, float]:
+    """Lexicon sentiment with negation, intensifiers and emoji, normalized to -1..1."""
+    positive, negative, hits = 0.0, 0.0, 0
+    for i, word in enumerate(words):
+        polarity = LEXICON.get(word)
+        if not polarity:
+            continue
+        hits += 1
+        if negated(words, i):
+            polarity *= -0.75
+        if i > 0:
+            polarity *= INTENSIFIERS.get(words[i - 1], 1.0) * DAMPENERS.get(words[i - 1], 1.0)
+        if polarity > 0:
+            positive += polarity
+        else:
+            negative -= polarity
+    for emoji in emojis:
+        polarity = EMOJI_SENTIMENT.get(emoji)
+        if polarity:
+            hits += 1
+            if polarity > 0:
+                positive += polarity
+            else:
+                negative -= polarity
+    total = positive - negative
+    # Same squashing as VADER: approaches ±1 as evidence accumulates
+    score = total / ((total * total + 15) ** 0.5) if total else 0.0
+    agreement = abs(positive - negative) / (positive + negative) if positive + negative else 0.0
+    return {"score": score, "hits": hits, "agreement": agreement}
+
+def _tone(text: str, words: List[str], emojis: List[str], score: float) -> str:
+    casual = sum(1 for word in words if word in CASUAL_MARKERS) + len(emojis) + text.count("!!")
+    professional = sum(1 for word in words if word in PROFESSIONAL_MARKERS)
+    formal = sum(1 for word in words if word in FORMAL_MARKERS)
+    if formal >= 2 and formal >= casual:
+        return "formal"
+    if professional >= 2 and professional > casual:
+        return "professional"
+    if casual >= 2:
+        return "casual"
+    if (emojis or "!" in text) and score >= 0:
+        return "friendly"
+    return "professional" if professional else "casual"
+
+def _topics(words: List[str], hashtags: List[str], limit: int = 5) -> List[str]:
+    stopwords = set().union(*STOPWORDS.values())
+    counts = Counter(
+        word for word in words
+        if len(word) > 3 and word not in stopwords and word not in FILLER and word not in LEXICON
+        and word not in INTENSIFIERS and "'" not in word and not word.startswith(("#", "@")) and not word.isdigit()
+    )
+    topics = [tag.lower() for tag in hashtags]
+    for word, _ in counts.most_common():
+        if len(topics) >= limit:
+            break
+        if word not in topics:
+            topics.append(word)
+    return topics[:limit]
+
+def analyze(post_text: str) -> Dict[str, Any]:
+    """Score a post locally. Runs inside pool workers, so it must stay a plain top-level function."""
+    text = _URLS.sub(" ", post_text)
+    words = [word.lower().replace("’", "'") for word in _WORDS.findall(text)]
+    plain = [word for word in words if not word.startswith(("#", "@"))]
+    emojis = find_emojis(text)
+    hashtags = _HASHTAGS.findall(text)
+    language = detect_language(plain)
+    sentiment = score_sentiment(plain, emojis)
+    score = sentiment["score"]
+    label = "positive" if score >= 0.2 else "negative" if score <= -0.2 else "neutral"
+    # Negated cues ("not happy") do not express their emotion
+    found = {word for i, word in enumerate(plain) if not negated(plain, i)} | set(emojis)
+    emotions = [emotion for emotion, cues in EMOTIONS.items() if found & cues]
+    # The lexicon is English; elsewhere only the extraction is trustworthy
+    confidence = 0.0
+    if language == "en":
+        confidence = min(1.0, sentiment["hits"] / CONFIDENT_HITS) * sentiment["agreement"]
+    return {
+        "sentiment": label,
+        "score": round(score, 3),
+        "confidence": round(confidence, 3),
+        "tone": _tone(text, plain, emojis, score),
+        "topics": _topics(words, hashtags),
+        "emotions": emotions,
+        "hashtags": hashtags,
+        "mentions": _MENTIONS.findall(text),
+        "emojis": list(dict.fromkeys(emojis)),
+        "language": language,
+    }
+
+def format_analysis(result: Dict[str, Any]) -> str:
+    """Render a local analysis as the structured text the analysis stage produces."""
+    lines = [
+        f"1. Sentiment: {result['sentiment']} (score {result['score']:+.2f})",
+        f"2. Tone: {result['tone']}",
+        f"3. Key topics: {', '.join(result['topics']) or 'none detected'}",
+        f"4. Emotions: {', '.join(result['emotions']) or 'none detected'}",
+        f"Language: {result['language']}",
+    ]
+    if result["hashtags"]:
+        lines.append("Hashtags: " + " ".join("#" + tag for tag in result["hashtags"]))
+    if result["mentions"]:
+        lines.append("Mentions: " + " ".join("@" + name for name in result["mentions"]))
+    if result["emojis"]:
+        lines.append("Emojis: " + "".join(result["emojis"]))
+    return "\n".join(lines)
+
+class LocalAnalyzer:
+    """Runs analyze() in a lazily started process pool."""
+
+    def __init__(self, workers: int = LOCAL_ANALYSIS_WORKERS):
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def analyze(self, post_text: str) -> Dict[str, Any]:
+        if self.workers <= 0:
+            return analyze(post_text)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return await asyncio.get_running_loop().run_in_executor(self._pool, analyze, post_text)
+
+    def close(self):
+        """Stop the pool's processes; the next call starts new ones."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+local_analyzer = LocalAnalyzer()
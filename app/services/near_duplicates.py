@@ -0,0 +1,190 @@
+"""
+Near-duplicate post detection.
+
+The exact reply cache misses lightly edited reposts: different hashtags, a
+trailing emoji, a new shortened URL. This index finds them with MinHash and
+locality-sensitive hashing over the normalized post text. URLs, hashtags,
+emojis, punctuation and case are dropped before shingling, so those edits do
+not count against similarity.
+
+Each post gets a MinHash signature over its word shingles. The signature is
+split into bands, and posts that share a band on the same platform become
+candidates. Candidates are verified against the estimated Jaccard similarity
+and the best one above NEAR_DUPLICATE_THRESHOLD is returned. The index lives in
+memory, is seeded from the most recent stored replies at startup and is
+updated each time a reply is stored.
+"""
+
+import hashlib
+import os
+import random
+import re
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from ..database import find_recent_replies
+
+NEAR_DUPLICATE_ENABLED = os.getenv("NEAR_DUPLICATE_ENABLED", "false").lower() == "true"
+# Minimum estimated Jaccard similarity of the posts' word shingles
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+# What to do with a match: reuse its reply as is, or adapt it with one LLM call
+NEAR_DUPLICATE_MODE = os.getenv("NEAR_DUPLICATE_MODE", "reuse")
+NEAR_DUPLICATE_MAX_ENTRIES = int(os.getenv("NEAR_DUPLICATE_MAX_ENTRIES", "100000"))
+# Posts with fewer words are too short to match safely
+NEAR_DUPLICATE_MIN_WORDS = int(os.getenv("NEAR_DUPLICATE_MIN_WORDS", "5"))
+
+# 16 bands of 4 rows: posts with Jaccard 0.8 share a band with probability
+# above 0.999, while posts below 0.3 rarely become candidates
+NUM_PERMUTATIONS = 64
+BANDS = 16
+ROWS = NUM_PERMUTATIONS // BANDS
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(0x5EED)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)
+]
+
+_URLS = re.compile(r"https?://\S+|www\.\S+")
+_TAGS = re.compile(r"#\w+")
+_WORDS = re.compile(r"[^\W_]+(?:'[^\W_]+)?")
+
+def similarity_words(post_text: str) -> List[str]:
+    """The post's words without URLs, hashtags, emojis, punctuation or case."""
+    text = unicodedata.normalize("NFKC", post_text).lower()
+    text = _TAGS.sub(" ", _URLS.sub(" ", text))
+    return _WORDS.findall(text)
+
+def shingles(words: List[str]) -> set:
+    """Word bigrams, plus the words themselves so reordering still overlaps."""
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+def _hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+
+def minhash(features: set) -> Tuple[int, ...]:
+    hashes = [_hash(feature) for feature in features]
+    return tuple(
+        min((a * value + b) % _MERSENNE_PRIME for value in hashes) for a, b in _PERMUTATIONS
+    )
+
+def estimate_similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+class Match:
+    def __init__(self, post_text: str, reply: str, similarity: float):
+        self.post_text = post_text
+        self.reply = reply
+        self.similarity = similarity
+
+class NearDuplicateIndex:
+    def __init__(
+        self,
+        enabled: bool = NEAR_DUPLICATE_ENABLED,
+        threshold: float = NEAR_DUPLICATE_THRESHOLD,
+        max_entries: int = NEAR_DUPLICATE_MAX_ENTRIES,
+        min_words: int = NEAR_DUPLICATE_MIN_WORDS
+    ):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.min_words = min_words
+        # (platform, normalized words) -> (signature, post_text, reply), oldest first
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Tuple[int, ...], str, str]]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, int, Tuple[int, ...]], set] = {}
+        self.hits = 0
+        self.misses = 0
+        self.adapted = 0
+
+    def _signature(self, post_text: str) -> Optional[Tuple[str, Tuple[int, ...]]]:
+        words = similarity_words(post_text)
+        if len(words) < self.min_words:
+            return None
+        return " ".join(words), minhash(shingles(words))
+
+    def _bands(self, platform: str, signature: Tuple[int, ...]):
+        for band in range(BANDS):
+            yield platform, band, signature[band * ROWS:(band + 1) * ROWS]
+
+    def add(self, platform: str, post_text: str, reply: str):
+        """Index a stored reply; a newer reply to the same post replaces the older one."""
+        if not self.enabled:
+            return
+        signed = self._signature(post_text)
+        if signed is None:
+            return
+        text, signature = signed
+        key = (platform, text)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self._entries[key] = (signature, post_text, reply)
+            return
+        self._entries[key] = (signature, post_text, reply)
+        for bucket in self._bands(platform, signature):
+            self._buckets.setdefault(bucket, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._evict()
+
+    def _evict(self):
+        key, (signature, _, _) = self._entries.popitem(last=False)
+        for bucket in self._bands(key[0], signature):
+            keys = self._buckets.get(bucket)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._buckets[bucket]
+
+    def find(self, platform: str, post_text: str) -> Optional[Match]:
+        """The most similar indexed post on the platform above the threshold, if any."""
+        if not self.enabled:
+            return None
+        signed = self._signature(post_text)
+        if signed is None:
+            self.misses += 1
+            return None
+        _, signature = signed
+        candidates = set()
+        for bucket in self._bands(platform, signature):
+            candidates |= self._buckets.get(bucket, set())
+        best: Optional[Match] = None
+        for key in candidates:
+            other, other_text, reply = self._entries[key]
+            similarity = estimate_similarity(signature, other)
+            if similarity >= self.threshold and (best is None or similarity > best.similarity):
+                best = Match(other_text, reply, similarity)
+        if best is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return best
+
+    async def load(self, limit: Optional[int] = None):
+        """Seed the index from the most recent stored replies."""
+        if not self.enabled:
+            return
+        docs = await find_recent_replies(limit or self.max_entries)
+        # Oldest first, so the newest replies are the last to be evicted
+        for doc in reversed(docs):
+            if doc.get("post_text") and doc.get("generated_reply"):
+                self.add(doc.get("platform", ""), doc["post_text"], doc["generated_reply"])
+
+    def clear(self):
+        self._entries.clear()
+        self._buckets.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "adapted": self.adapted,
+        }
+
+# Create a singleton instance
+near_duplicate_index = NearDuplicateIndex()
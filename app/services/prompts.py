@@ -0,0 +1,254 @@
+"""
+Prompt registry and token budgeting for LLM calls.
+
+Every template is compacted once at import time: indentation and trailing
+whitespace are stripped and blank-line runs collapsed, so no call pays for the
+source file's indentation in billed input tokens. Prompts that depend only on
+the platform (the direct and fused system prompts) are rendered once per
+platform up front; the rest are plain str.format templates.
+
+Token counts come from a local approximation of a BPE tokenizer (words cost one
+token per five characters, punctuation and emoji one each), so budgets can be
+enforced without a network call or a model-specific vocabulary. It errs on the
+high side for English text, which keeps the caps safe.
+"""
+
+import hashlib
+import math
+import re
+import textwrap
+from typing import Dict, List, Tuple
+
+_BLANK_LINES = re.compile(r"\n{3,}")
+_TOKEN_PIECES = re.compile(r"\w+|[^\w\s]|\n+|[ \t]{2,}")
+
+# Approximate chat-format overhead of each message (role and separators)
+MESSAGE_OVERHEAD = 4
+
+TRUNCATION_MARKER = " … "
+
+def compact(template: str) -> str:
+    """Strip indentation and trailing whitespace and collapse blank-line runs."""
+    lines = [line.strip() for line in textwrap.dedent(template).strip().splitlines()]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines))
+
+def _cost(piece: str) -> int:
+    if piece[0].isalnum() or piece[0] == "_":
+        return max(1, math.ceil(len(piece) / 5))
+    return 1
+
+def _pieces(text: str) -> List[Tuple[int, int, int]]:
+    """(start, end, tokens) for every token-bearing piece of the text."""
+    return [(match.start(), match.end(), _cost(match.group())) for match in _TOKEN_PIECES.finditer(text)]
+
+def count_tokens(text: str) -> int:
+    """Approximate number of tokens in the text."""
+    return sum(cost for _, _, cost in _pieces(text))
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD for message in messages)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut the text to about `max_tokens`, keeping its beginning and its end.
+
+    Two thirds of the budget go to the head, where posts set their context,
+    and the rest to the tail, where they usually ask their question.
+    """
+    pieces = _pieces(text)
+    if sum(cost for _, _, cost in pieces) <= max_tokens:
+        return text
+    budget = max(max_tokens - count_tokens(TRUNCATION_MARKER), 2)
+    head_budget = budget * 2 // 3
+    tail_budget = budget - head_budget
+
+    head_end, used = 0, 0
+    for start, end, cost in pieces:
+        if used + cost > head_budget:
+            break
+        head_end, used = end, used + cost
+    tail_start, used = len(text), 0
+    for start, end, cost in reversed(pieces):
+        if used + cost > tail_budget or start < head_end:
+            break
+        tail_start, used = start, used + cost
+    return text[:head_end].rstrip() + TRUNCATION_MARKER + text[tail_start:].lstrip()
+
+def fit_messages(messages: List[Dict[str, str]], max_tokens: int) -> Tuple[List[Dict[str, str]], bool]:
+    """Trim the longest messages until the whole prompt fits in `max_tokens`.
+
+    Returns the (possibly new) message list and whether anything was cut.
+    """
+    total = count_message_tokens(messages)
+    if total <= max_tokens:
+        return messages, False
+    messages = list(messages)
+    for _ in range(len(messages)):
+        if total <= max_tokens:
+            break
+        index = max(range(len(messages)), key=lambda i: count_tokens(messages[i]["content"]))
+        content = messages[index]["content"]
+        tokens = count_tokens(content)
+        messages[index] = {**messages[index], "content": truncate_to_tokens(content, max(tokens - (total - max_tokens), 1))}
+        total = count_message_tokens(messages)
+    return messages, True
+
+class PromptTemplate:
+    """A compacted str.format template."""
+
+    def __init__(self, template: str):
+        self.template = compact(template)
+
+    def render(self, **values: str) -> str:
+        return self.template.format(**values)
+
+# Hard reply length limit of each platform, in characters
+PLATFORM_MAX_CHARS = {"twitter": 280, "linkedin": 1250, "instagram": 2200}
+
+PLATFORM_PROMPTS = {
+    "twitter": compact(f"""
+        You are a Twitter user. Your replies should be:
+        - Concise (under {PLATFORM_MAX_CHARS["twitter"]} characters)
+        - Casual and conversational
+        - Use emojis naturally
+        - Include hashtags when relevant
+        - Match the tone of the original post
+    """),
+    "linkedin": compact("""
+        You are a LinkedIn professional. Your replies should be:
+        - Professional and insightful
+        - Focus on value and expertise
+        - Use industry-specific terminology
+        - Maintain a business-appropriate tone
+        - Include relevant professional context
+    """),
+    "instagram": compact("""
+        You are an Instagram user. Your replies should be:
+        - Friendly and engaging
+        - Use emojis liberally
+        - Include relevant hashtags
+        - Match the visual/creative nature of Instagram
+        - Be authentic and personal
+    """),
+}
+
+_AVOID = """
+    Avoid:
+    - Generic or overly formal language
+    - Repetitive patterns
+    - AI-like responses
+    - Excessive punctuation or emojis
+"""
+
+ANALYSIS_SYSTEM = "You are an expert at analyzing social media content."
+ANALYSIS_USER = PromptTemplate("""
+    Analyze this social media post and provide:
+    1. Sentiment (positive/negative/neutral)
+    2. Tone (formal/casual/professional/friendly)
+    3. Key topics or themes
+    4. Any specific emotions expressed
+
+    Post: {post_text}
+
+    Provide the analysis in a structured format.
+""")
+
+PERSONA_SYSTEM = "You are an expert at creating authentic social media personas."
+PERSONA_USER = PromptTemplate("""
+    Based on the following analysis and platform, create a detailed persona:
+    Platform: {platform}
+    Analysis: {analysis}
+
+    Include:
+    1. Personality traits
+    2. Communication style
+    3. Typical interests
+    4. Response patterns
+""")
+
+REPLY_SYSTEM = PromptTemplate("""
+    You are an expert at generating human-like social media replies.
+    {platform_prompt}
+
+    Use this persona to guide your response:
+    {persona}
+
+    Post analysis:
+    {analysis}
+
+    Follow these steps:
+    1. Ensure the reply matches the analyzed sentiment and tone
+    2. Incorporate relevant topics from the analysis
+    3. Maintain the persona's characteristics
+    4. Generate a reply that feels natural and authentic
+""" + _AVOID)
+
+REPLY_USER = PromptTemplate("""
+    Generate a reply to this {platform} post:
+
+    {post_text}
+""")
+
+_DIRECT_SYSTEM = PromptTemplate("""
+    You are an expert at generating human-like social media replies.
+    {platform_prompt}
+
+    Follow these steps:
+    1. Analyze the post's content and context
+    2. Determine the appropriate tone and style
+    3. Generate a reply that feels natural and authentic
+    4. Ensure the reply matches the platform's characteristics
+""" + _AVOID)
+
+_FUSED_SYSTEM = PromptTemplate("""
+    You are an expert at generating human-like social media replies.
+    {platform_prompt}
+
+    Work through three steps and return them as one JSON object:
+    1. "analysis": the post's sentiment (positive/negative/neutral), tone
+    (formal/casual/professional/friendly), key topics and emotions
+    2. "persona": a responder persona for this platform with personality traits,
+    communication style, typical interests and response patterns
+    3. "reply": a reply written by that persona which matches the analyzed
+    sentiment and tone and feels natural and authentic
+""" + _AVOID.replace("Avoid:", "Avoid in the reply:") + """
+    Respond with only a JSON object with the string keys "analysis", "persona" and "reply".
+""")
+
+# Rendered once per platform, since they depend on nothing else
+DIRECT_SYSTEM = {platform: _DIRECT_SYSTEM.render(platform_prompt=prompt) for platform, prompt in PLATFORM_PROMPTS.items()}
+FUSED_SYSTEM = {platform: _FUSED_SYSTEM.render(platform_prompt=prompt) for platform, prompt in PLATFORM_PROMPTS.items()}
+
+CONDENSE_SYSTEM = "You shorten social media posts without changing their meaning, tone or voice."
+CONDENSE_USER = PromptTemplate("""
+    Rewrite this post in at most {max_words} words. Keep its key points, names,
+    questions and calls to action, and keep the author's tone. Return only the
+    rewritten post.
+
+    Post: {post_text}
+""")
+
+ADAPT_SYSTEM = "You adapt existing social media replies to closely related posts."
+ADAPT_USER = PromptTemplate("""
+    This {platform} reply was written for an earlier version of a post:
+
+    Earlier post: {original_post}
+    Reply: {reply}
+
+    Adjust the reply so it fits the new post below. Change only what the
+    differences require (hashtags, names, details) and keep its length, tone
+    and voice. Return only the reply.
+
+    New post: {post_text}
+""")
+
+VARIANTS_FORMAT = PromptTemplate("""
+    Write {count} distinct replies that differ in angle and wording.
+    Respond with only a JSON object whose "replies" key holds the {count} replies as strings.
+""")
+
+# Changes whenever a template changes, so cached replies and stage results are not reused across prompt versions
+PROMPT_VERSION = hashlib.sha256("\x00".join([
+    *PLATFORM_PROMPTS.values(), ANALYSIS_SYSTEM, ANALYSIS_USER.template, PERSONA_SYSTEM, PERSONA_USER.template,
+    REPLY_SYSTEM.template, REPLY_USER.template, _DIRECT_SYSTEM.template, _FUSED_SYSTEM.template,
+    CONDENSE_SYSTEM, CONDENSE_USER.template, ADAPT_SYSTEM, ADAPT_USER.template, VARIANTS_FORMAT.template
+]).encode("utf-8")).hexdigest()[:12]
@@ -0,0 +1,77 @@
+"""
+Local ranking of candidate replies.
+
+Scores each candidate between 0 and 1 without an LLM call. Replies lose
+points for breaking the platform's length limit or drifting from its usual
+length, for emoji and hashtag counts outside what the platform prompt asks
+for, for repeating phrases, for parroting the post and for repeating a
+better-ranked candidate.
+"""
+
+import re
+from typing import Any, Dict, List, Set, Tuple
+from .local_analysis import find_emojis
+from .prompts import PLATFORM_MAX_CHARS
+
+# Usual reply length range in characters
+PLATFORM_TARGET_CHARS = {"twitter": (40, 240), "linkedin": (80, 700), "instagram": (20, 300)}
+# Emoji and hashtag counts in line with each platform prompt
+PLATFORM_EMOJI_RANGE = {"twitter": (0, 2), "linkedin": (0, 1), "instagram": (1, 5)}
+PLATFORM_HASHTAG_RANGE = {"twitter": (0, 2), "linkedin": (0, 3), "instagram": (0, 5)}
+
+_WORDS = re.compile(r"[\w']+")
+_HASHTAGS = re.compile(r"#\w+")
+
+def _trigrams(text: str) -> List[Tuple[str, ...]]:
+    words = _WORDS.findall(text.lower())
+    return [tuple(words[i:i + 3]) for i in range(len(words) - 2)]
+
+def _outside(count: int, bounds: Tuple[int, int]) -> int:
+    low, high = bounds
+    return low - count if count < low else max(0, count - high)
+
+def _overlap(trigrams: Set[Tuple[str, ...]], other: Set[Tuple[str, ...]]) -> float:
+    return len(trigrams & other) / len(trigrams) if trigrams else 0.0
+
+def score_reply(platform: str, reply: str, post_text: str = "") -> float:
+    """Score one reply on its own, between 0 and 1."""
+    platform = platform if platform in PLATFORM_MAX_CHARS else "twitter"
+    score = 1.0
+    length = len(reply)
+    limit = PLATFORM_MAX_CHARS[platform]
+    if length > limit:
+        score -= 0.5 + min(0.5, (length - limit) / limit)
+    low, high = PLATFORM_TARGET_CHARS[platform]
+    if length < low:
+        score -= 0.2 * (low - length) / low
+    elif length > high:
+        score -= 0.2 * min(1.0, (length - high) / high)
+
+    score -= min(0.3, 0.1 * _outside(len(find_emojis(reply)), PLATFORM_EMOJI_RANGE[platform]))
+    score -= min(0.3, 0.1 * _outside(len(_HASHTAGS.findall(reply)), PLATFORM_HASHTAG_RANGE[platform]))
+
+    trigrams = _trigrams(reply)
+    repeats = len(trigrams) - len(set(trigrams))
+    score -= min(0.3, 0.1 * repeats)
+    if post_text:
+        score -= 0.3 * _overlap(set(trigrams), set(_trigrams(post_text)))
+    return max(0.0, score)
+
+def rank_replies(platform: str, post_text: str, replies: List[str]) -> List[Dict[str, Any]]:
+    """Rank candidates best first as {"reply", "score"} dicts.
+
+    Candidates are picked greedily, and each one is penalized by how much it
+    repeats the candidates already picked, so near-copies sink to the bottom.
+    """
+    remaining = [(reply, score_reply(platform, reply, post_text), set(_trigrams(reply))) for reply in replies]
+    ranked: List[Dict[str, Any]] = []
+    picked: List[Set[Tuple[str, ...]]] = []
+    while remaining:
+        def adjusted(candidate) -> float:
+            _, score, trigrams = candidate
+            return score - 0.3 * max((_overlap(trigrams, other) for other in picked), default=0.0)
+        best = max(remaining, key=adjusted)
+        remaining.remove(best)
+        ranked.append({"reply": best[0], "score": round(max(0.0, adjusted(best)), 3)})
+        picked.append(best[2])
+    return ranked
@@ -0,0 +1,309 @@
+"""
+Adaptive rate limiting and retry scheduling for LLM calls.
+
+A shared limiter keeps every completion within the provider quota with two
+token buckets: one for requests and one for tokens per minute. Calls wait for
+budget in priority order, so stages of chains that are already in flight are
+admitted before the first call of a new chain.
+
+The buckets adapt to the provider: x-ratelimit-* response headers shrink the
+local budget to what the server reports as remaining, and a 429 pauses all
+callers until its Retry-After has passed. Rate-limited and transient failures
+are retried with capped exponential backoff and full jitter. Once retries are
+exhausted, RateLimitExceeded is raised so the API can answer 429 with a
+Retry-After header instead of a generic 500.
+
+When several processes share one provider quota, each limiter is given a share
+of it (see app/coordination.py). The share scales both buckets, and the
+provider's remaining budget, so the processes together stay within the quota.
+
+Calls made for a request with a deadline (see app/admission.py) do not wait
+for budget, or back off before a retry, past that deadline: they raise
+DeadlineExceeded as soon as the wait is known to be too long.
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import groq
+import httpx
+from ..admission import DeadlineExceeded, remaining_time
+
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "30000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", "0.5"))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", "20"))
+
+# Priorities: lower runs first
+PRIORITY_IN_FLIGHT = 0
+PRIORITY_NEW = 1
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_UNIT_SECONDS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Parse durations such as '7.66s', '2m59.56s', '250ms' or a plain number of seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * _UNIT_SECONDS[unit] for amount, unit in parts)
+
+def rate_limit_headers(error: Exception) -> Optional[Any]:
+    """Response headers of a 429 from either the Groq SDK or a plain HTTP backend."""
+    if isinstance(error, groq.RateLimitError):
+        return error.response.headers
+    if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 429:
+        return error.response.headers
+    return None
+
+def is_transient(error: Exception) -> bool:
+    """Connection failures and 5xx responses, which are worth retrying."""
+    if isinstance(error, (groq.APIConnectionError, groq.InternalServerError, httpx.TransportError)):
+        return True
+    return isinstance(error, httpx.HTTPStatusError) and error.response.status_code >= 500
+
+class RateLimitExceeded(Exception):
+    """Raised when a call is still rate limited after all retries."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Continuously refilled budget; a non-positive rate disables the bucket.
+
+    `limit` is the whole quota per minute and `share` the fraction this process
+    may use of it.
+    """
+
+    def __init__(self, per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.limit = per_minute
+        self.share = 1.0
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.tokens = per_minute
+        self.clock = clock
+        self.updated = clock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until `amount` can be consumed (0 if available now)."""
+        if not self.enabled:
+            return 0.0
+        self._refill()
+        # Never wait for more than a full bucket, so oversized calls still get through
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        if self.enabled:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+    def _resize(self):
+        self.capacity = self.limit * self.share
+        self.rate = self.capacity / 60
+        self.tokens = min(self.tokens, self.capacity)
+
+    def set_share(self, share: float):
+        """Use only `share` of the quota, e.g. 1/N with N processes."""
+        self._refill()
+        self.share = share
+        self._resize()
+
+    def sync(self, remaining: Optional[float], limit: Optional[float] = None):
+        """Adopt the provider's view of the budget when it is tighter than ours."""
+        if not self.enabled:
+            return
+        self._refill()
+        if limit:
+            self.limit = limit
+            self._resize()
+        # The provider reports what is left of the whole quota
+        if remaining is not None and remaining * self.share < self.tokens:
+            self.tokens = remaining * self.share
+
+class RateLimiter:
+    def __init__(
+        self,
+        requests_per_minute: float = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: float = LLM_TOKENS_PER_MINUTE,
+        max_retries: int = LLM_MAX_RETRIES,
+        base_delay: float = LLM_RETRY_BASE_DELAY,
+        max_delay: float = LLM_RETRY_MAX_DELAY,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.requests = TokenBucket(requests_per_minute, clock)
+        self.tokens = TokenBucket(tokens_per_minute, clock)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.paused_until = 0.0
+        self._waiters: List[list] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.throttled = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.exhausted = 0
+        self.shed = 0
+
+    def _wait_time(self, tokens: float) -> float:
+        return max(
+            self.paused_until - self.clock(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(tokens)
+        )
+
+    def _dispatch(self):
+        """Admit waiters in priority order while budget is available."""
+        self._timer = None
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._wait_time(tokens)
+            if wait > 0:
+                self._timer = asyncio.get_running_loop().call_later(wait, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            future.set_result(None)
+
+    async def acquire(self, tokens: float, priority: int = PRIORITY_NEW):
+        """Wait until one request and `tokens` tokens fit in the budget, or the request's deadline."""
+        wait = self._wait_time(tokens)
+        if not self._waiters and wait <= 0:
+            self.requests.consume(1)
+            self.tokens.consume(tokens)
+            return
+        budget = remaining_time()
+        if budget is not None and wait >= budget:
+            self.shed += 1
+            raise DeadlineExceeded("LLM rate limit budget will not free up before the request deadline", wait)
+        self.throttled += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [priority, next(self._sequence), tokens, future])
+        if self._timer is not None:
+            self._timer.cancel()
+        self._dispatch()
+        try:
+            # A cancelled waiter is skipped by _dispatch
+            await asyncio.wait_for(future, budget)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            raise DeadlineExceeded("LLM rate limit budget did not free up before the request deadline")
+
+    def set_share(self, share: float):
+        """Scale both buckets to `share` of the quota and re-admit waiters at the new rate."""
+        self.requests.set_share(share)
+        self.tokens.set_share(share)
+        if self._waiters:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._dispatch()
+
+    @property
+    def share(self) -> float:
+        return self.requests.share
+
+    def settle(self, estimated: float, actual: Optional[float]):
+        """Correct the token budget once the real usage of a call is known."""
+        if actual is not None and self.tokens.enabled:
+            self.tokens.tokens += estimated - actual
+
+    def update_from_headers(self, headers: Any):
+        """Adapt the buckets to the x-ratelimit-* headers of a response."""
+        def number(name: str) -> Optional[float]:
+            value = headers.get(name)
+            try:
+                return float(value) if value is not None else None
+            except ValueError:
+                return None
+
+        self.tokens.sync(number("x-ratelimit-remaining-tokens"), number("x-ratelimit-limit-tokens"))
+        if number("x-ratelimit-remaining-requests") == 0:
+            reset = parse_duration(headers.get("x-ratelimit-reset-requests"))
+            if reset:
+                self.pause(reset)
+
+    def pause(self, seconds: float):
+        """Hold back every caller for `seconds`, e.g. after a 429."""
+        self.paused_until = max(self.paused_until, self.clock() + seconds)
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Capped exponential backoff with full jitter, never shorter than Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    async def run(self, call: Callable[[], Awaitable[Any]], tokens: float, priority: int = PRIORITY_NEW) -> Any:
+        """Run a raw-response API call under the budget, retrying 429s and transient errors."""
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(tokens, priority)
+            try:
+                response = await call()
+            except Exception as e:
+                headers = rate_limit_headers(e)
+                if headers is not None:
+                    self.rate_limited += 1
+                    self.update_from_headers(headers)
+                    retry_after = parse_duration(headers.get("retry-after")) or self.backoff(attempt)
+                    self.pause(retry_after)
+                    if attempt == self.max_retries:
+                        self.exhausted += 1
+                        raise RateLimitExceeded(f"LLM provider rate limit exceeded: {str(e)}", retry_after)
+                    error_delay = retry_after
+                elif is_transient(e) and attempt < self.max_retries:
+                    error_delay = None
+                else:
+                    raise
+                delay = self.backoff(attempt, error_delay)
+                budget = remaining_time()
+                if budget is not None and delay >= budget:
+                    self.shed += 1
+                    raise DeadlineExceeded(f"No time left before the request deadline to retry: {str(e)}", delay)
+            else:
+                self.update_from_headers(response.headers)
+                return response
+            self.retries += 1
+            # Retries keep their place ahead of new chains
+            priority = PRIORITY_IN_FLIGHT
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "waiting": sum(1 for waiter in self._waiters if not waiter[3].done()),
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "exhausted": self.exhausted,
+            "shed": self.shed,
+            "request_budget": self.requests.tokens if self.requests.enabled else None,
+            "token_budget": self.tokens.tokens if self.tokens.enabled else None,
+        }
+
+# Create a singleton instance shared by every LLM call in the process
+rate_limiter = RateLimiter()
@@ -1,16 +1,123 @@
+import asyncio
+import os
+from contextlib import nullcontext
 from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from ..models import ReplyRequest
 from ..services.llm_service import llm_service
-from ..database import store_reply
+from ..services.cache_service import normalize_text, reply_cache
+from ..services.rate_limiter import RateLimitExceeded
+from ..admission import DeadlineExceeded, admission
+from ..services.near_duplicates import NEAR_DUPLICATE_MODE, NearDuplicateIndex, near_duplicate_index
+from ..database import build_reply_doc, store_reply, store_replies
+from ..single_flight import SingleFlight
+
+# Default and maximum number of batch items generated concurrently
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+
+# Share one in-flight generation between concurrent identical requests
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+
+NEAR_DUPLICATE_MODES = ("reuse", "adapt")
 
 class ReplyService:
-    async def generate_and_store_reply(self, platform: str, post_text: str):
-        """Generate a reply and store it in the database."""
-        try:
-            if llm_service is None:
-                raise Exception("LLM service is not initialized. Please check your GROQ_API_KEY environment variable.")
+    def __init__(
+        self,
+        single_flight: bool = SINGLE_FLIGHT_ENABLED,
+        near_duplicates: Optional[NearDuplicateIndex] = None,
+        near_duplicate_mode: str = NEAR_DUPLICATE_MODE
+    ):
+        if near_duplicate_mode not in NEAR_DUPLICATE_MODES:
+            raise ValueError(
+                f"Unknown NEAR_DUPLICATE_MODE '{near_duplicate_mode}', expected one of {', '.join(NEAR_DUPLICATE_MODES)}"
+            )
+        self.flights = SingleFlight("reply") if single_flight else None
+        self.near_duplicates = near_duplicate_index if near_duplicates is None else near_duplicates
+        self.near_duplicate_mode = near_duplicate_mode
+
+    async def _near_duplicate_reply(self, platform: str, post_text: str) -> Tuple[Optional[str], bool]:
+        """Reply to a near-duplicate of this post, and whether it is reused unchanged."""
+        match = self.near_duplicates.find(platform, post_text)
+        if match is None:
+            return None, False
+        if self.near_duplicate_mode == "adapt":
+            self.near_duplicates.adapted += 1
+            return await llm_service.adapt_reply(platform, post_text, match.post_text, match.reply), False
+        return match.reply, True
+
+    async def _generate(
+        self, platform: str, post_text: str, bypass_cache: bool = False, strategy: Optional[str] = None
+    ) -> Tuple[str, bool]:
+        """Generate a reply, serving it from the cache when possible."""
+        if llm_service is None:
+            raise Exception("LLM service is not initialized. Please check your GROQ_API_KEY environment variable.")
+
+        # Serve repeated posts from the cache unless the caller asked for a fresh reply
+        cache_key = reply_cache.key(platform, post_text, llm_service.generation_config(strategy))
+        generated_reply = None if bypass_cache else await reply_cache.get(cache_key)
+        cached = generated_reply is not None
+
+        if not cached:
+            async def generate() -> Tuple[str, bool]:
+                # A lightly edited repost can reuse the reply to its earlier version
+                reply, reused = (None, False) if bypass_cache else await self._near_duplicate_reply(platform, post_text)
+                if reply is None:
+                    # Generate reply using LLM
+                    reply = await llm_service.generate_reply(platform, post_text, strategy)
+                await reply_cache.set(cache_key, reply)
+                return reply, reused
+
+            if self.flights is None:
+                generated_reply, cached = await generate()
+            else:
+                # Identical posts arriving while this one is generating wait for it
+                # instead of starting their own chain; fresh requests only join fresh ones
+                generated_reply, cached = await self.flights.do((cache_key, bypass_cache), generate)
+        return generated_reply, cached
+
+    async def _generate_variants(
+        self, platform: str, post_text: str, count: int, bypass_cache: bool = False, strategy: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], bool]:
+        """Generate `count` ranked candidate replies, serving them from the cache when possible."""
+        if llm_service is None:
+            raise Exception("LLM service is not initialized. Please check your GROQ_API_KEY environment variable.")
 
-            # Generate reply using LLM
-            generated_reply = await llm_service.generate_reply(platform, post_text)
+        cache_key = reply_cache.key(platform, post_text, llm_service.generation_config(strategy, count))
+        variants = None if bypass_cache else await reply_cache.get(cache_key)
+        cached = variants is not None
+
+        if not cached:
+            async def generate() -> List[Dict[str, Any]]:
+                result = await llm_service.generate_variants(platform, post_text, count, strategy)
+                await reply_cache.set(cache_key, result["variants"])
+                return result["variants"]
+
+            if self.flights is None:
+                variants = await generate()
+            else:
+                variants = await self.flights.do((cache_key, bypass_cache), generate)
+        return variants, cached
+
+    async def _generate_item(
+        self, platform: str, post_text: str, bypass_cache: bool, strategy: Optional[str], variants: int
+    ) -> Tuple[str, bool, Optional[List[Dict[str, Any]]]]:
+        """The reply, whether it was cached, and the ranked candidates when several were requested."""
+        if variants > 1:
+            ranked, cached = await self._generate_variants(platform, post_text, variants, bypass_cache, strategy)
+            return ranked[0]["reply"], cached, ranked
+        generated_reply, cached = await self._generate(platform, post_text, bypass_cache, strategy)
+        return generated_reply, cached, None
+
+    async def generate_and_store_reply(
+        self, platform: str, post_text: str, bypass_cache: bool = False, strategy: Optional[str] = None,
+        variants: int = 1
+    ):
+        """Generate a reply (or several ranked candidates) and store it in the database."""
+        try:
+            generated_reply, cached, ranked = await self._generate_item(
+                platform, post_text, bypass_cache, strategy, variants
+            )
             
             # Store in database
             timestamp = datetime.utcnow().isoformat()
@@ -18,17 +125,144 @@ class ReplyService:
                 platform=platform,
                 post_text=post_text,
                 generated_reply=generated_reply,
-                timestamp=timestamp
+                timestamp=timestamp,
+                variants=ranked
             )
+            self.near_duplicates.add(platform, post_text, generated_reply)
             
-            return {
+            result = {
                 "reply": generated_reply,
                 "platform": platform,
                 "post_text": post_text,
-                "timestamp": timestamp
+                "timestamp": timestamp,
+                "cached": cached
             }
+            if ranked is not None:
+                result["variants"] = ranked
+            return result
+        except (RateLimitExceeded, DeadlineExceeded):
+            raise
         except Exception as e:
             raise Exception(f"Error in reply generation process: {str(e)}")
 
+    async def stream_and_store_reply(
+        self, platform: str, post_text: str, bypass_cache: bool = False, strategy: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Stream chain progress and reply tokens, then store the completed reply.
+
+        Yields (event, data) pairs: analysis, persona and token events while
+        generating, followed by a single done event carrying the stored result,
+        or an error event if generation fails.
+        """
+        try:
+            if llm_service is None:
+                raise Exception("LLM service is not initialized. Please check your GROQ_API_KEY environment variable.")
+
+            cache_key = reply_cache.key(platform, post_text, llm_service.generation_config(strategy))
+            generated_reply = None if bypass_cache else await reply_cache.get(cache_key)
+            cached = generated_reply is not None
+
+            if not cached and not bypass_cache:
+                generated_reply, cached = await self._near_duplicate_reply(platform, post_text)
+                if generated_reply is not None:
+                    yield "token", {"token": generated_reply}
+                    await reply_cache.set(cache_key, generated_reply)
+
+            if generated_reply is None:
+                tokens = []
+                async for event, data in llm_service.stream_reply(platform, post_text, strategy):
+                    if event == "token":
+                        tokens.append(data["token"])
+                    yield event, data
+                generated_reply = "".join(tokens).strip()
+                await reply_cache.set(cache_key, generated_reply)
+
+            # Persist once the stream has completed
+            timestamp = datetime.utcnow().isoformat()
+            await store_reply(
+                platform=platform,
+                post_text=post_text,
+                generated_reply=generated_reply,
+                timestamp=timestamp
+            )
+            self.near_duplicates.add(platform, post_text, generated_reply)
+            yield "done", {
+                "reply": generated_reply,
+                "platform": platform,
+                "post_text": post_text,
+                "timestamp": timestamp,
+                "cached": cached
+            }
+        except (RateLimitExceeded, DeadlineExceeded) as e:
+            yield "error", {"detail": str(e), "retry_after": e.retry_after}
+        except Exception as e:
+            yield "error", {"detail": f"Error in reply generation process: {str(e)}"}
+
+    async def generate_and_store_replies(
+        self, items: List[ReplyRequest], concurrency: Optional[int] = None, client: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Generate replies for a batch of posts and store them with one bulk write.
+
+        Identical posts are generated once, at most `concurrency` generations run
+        at a time, and results are returned in input order with per-item errors.
+        With a `client`, each generation is admitted like a /reply request from it.
+        """
+        limit = min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY)
+        quota = admission.client_quota(client) if client is not None else 0
+        if quota > 0:
+            # More would only have the batch's own items shed for the client's quota
+            limit = min(limit, quota)
+        semaphore = asyncio.Semaphore(limit)
+
+        # Group identical (platform, post, bypass, strategy, variants) items so each is generated once
+        groups: Dict[Tuple[str, str, bool, Optional[str], int], List[int]] = {}
+        for index, item in enumerate(items):
+            key = (item.platform, normalize_text(item.post_text), item.bypass_cache, item.strategy, item.variants)
+            groups.setdefault(key, []).append(index)
+
+        async def run(index: int):
+            async with semaphore:
+                item = items[index]
+                async with admission.admit(client) if client is not None else nullcontext():
+                    return await self._generate_item(
+                        item.platform, item.post_text, item.bypass_cache, item.strategy, item.variants
+                    )
+
+        leaders = [indexes[0] for indexes in groups.values()]
+        outcomes = await asyncio.gather(*(run(index) for index in leaders), return_exceptions=True)
+
+        results: List[Dict[str, Any]] = [{"index": index} for index in range(len(items))]
+        reply_docs = []
+        for indexes, outcome in zip(groups.values(), outcomes):
+            for index in indexes:
+                if isinstance(outcome, Exception):
+                    results[index]["error"] = f"Error in reply generation process: {str(outcome)}"
+                    continue
+                item = items[index]
+                generated_reply, cached, ranked = outcome
+                timestamp = datetime.utcnow().isoformat()
+                reply_docs.append(build_reply_doc(item.platform, item.post_text, generated_reply, timestamp, ranked))
+                results[index]["result"] = {
+                    "reply": generated_reply,
+                    "platform": item.platform,
+                    "post_text": item.post_text,
+                    "timestamp": timestamp,
+                    "cached": cached
+                }
+                if ranked is not None:
+                    results[index]["result"]["variants"] = ranked
+
+        # Store every successful reply in a single round-trip
+        try:
+            await store_replies(reply_docs)
+        except Exception as e:
+            for result in results:
+                if result.pop("result", None) is not None:
+                    result["error"] = f"Error storing reply: {str(e)}"
+        else:
+            for doc in reply_docs:
+                self.near_duplicates.add(doc["platform"], doc["post_text"], doc["generated_reply"])
+        return results
+
 # Create a singleton instance
-reply_service = ReplyService() 
\ No newline at end of file
+reply_service = ReplyService()
@@ -0,0 +1,76 @@
+"""
+Request coalescing (single-flight) for identical concurrent work.
+
+The first caller for a key starts the work as a task. Callers arriving with the
+same key while it is still running wait for that task instead of starting
+their own, and all of them receive its result or its exception. The key is
+forgotten as soon as the task finishes, so this only deduplicates concurrent
+work; caching completed results is left to the caller.
+
+The shared task is shielded from its callers: if one of them is cancelled (for
+example because its client disconnected), the others still get the result.
+For the same reason it runs under the latest deadline of its callers, extended
+as callers join, while each caller stops waiting at its own deadline with
+DeadlineExceeded. Work past every caller's deadline is cut short like any
+other request's, so nothing keeps running once all of them have given up.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from .admission import Deadline, DeadlineExceeded, current_deadline, remaining_time, shared_deadline
+from .metrics import single_flight_fan_in
+
+class SingleFlight:
+    def __init__(self, name: str = "default"):
+        self.name = name
+        self._flights: Dict[Hashable, asyncio.Future] = {}
+        self._fan_in: Dict[Hashable, int] = {}
+        self._deadlines: Dict[Hashable, Deadline] = {}
+        self.leaders = 0
+        self.joined = 0
+        self.max_fan_in = 0
+
+    def _finish(self, key: Hashable, task: asyncio.Future):
+        self._flights.pop(key, None)
+        self._deadlines.pop(key, None)
+        fan_in = self._fan_in.pop(key, 1)
+        self.max_fan_in = max(self.max_fan_in, fan_in)
+        single_flight_fan_in.observe(fan_in, flight=self.name)
+        # Mark the exception as retrieved in case every caller was cancelled
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `fn` once for all concurrent callers with the same key."""
+        task = self._flights.get(key)
+        if task is None:
+            # The task copies the context it is created in, so it sees the shared deadline
+            context, deadline = shared_deadline()
+            task = context.run(asyncio.ensure_future, fn())
+            self._flights[key] = task
+            self._deadlines[key] = deadline
+            self._fan_in[key] = 1
+            self.leaders += 1
+            task.add_done_callback(lambda finished: self._finish(key, finished))
+        else:
+            self._fan_in[key] += 1
+            self.joined += 1
+            self._deadlines[key].extend(current_deadline())
+        budget = remaining_time()
+        if budget is None:
+            return await asyncio.shield(task)
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), max(budget, 0))
+        except asyncio.TimeoutError:
+            if task.done():
+                raise
+            raise DeadlineExceeded("Request deadline expired while waiting for an identical request")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._flights),
+            "waiting": sum(self._fan_in.values()),
+            "leaders": self.leaders,
+            "joined": self.joined,
+            "max_fan_in": self.max_fan_in,
+        }
@@ -0,0 +1,15 @@
+"""Text normalization shared by the caches and stored reply documents."""
+
+import hashlib
+import re
+import unicodedata
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_text(text: str) -> str:
+    """Normalize post text so trivially different copies share a cache key."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFC", text)).strip()
+
+def post_hash(text: str) -> str:
+    """Stable hash of the normalized post text, used to find replies to the same post."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
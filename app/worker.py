@@ -0,0 +1,60 @@
+"""
+Standalone job worker process.
+
+Drains the reply job queue outside the API process, so job throughput can be
+scaled independently of request handling. Run as many of these as needed
+against the same MONGODB_URI, and set JOB_WORKERS=0 on the API if it should
+only accept jobs. SIGINT or SIGTERM lets running jobs finish before exiting.
+
+Usage:
+    python -m app.worker --workers 8
+"""
+
+import argparse
+import asyncio
+import signal
+import sys
+from .services.llm_service import llm_limiters, llm_service
+from .services.job_service import JOB_WORKERS, job_queue
+from .services.near_duplicates import near_duplicate_index
+from .coordination import coordination_enabled, coordinator
+from .metrics import registry
+
+# A standalone worker runs beside the API, so it takes its share of the quota
+# unless WORKER_COORDINATION=false; WEB_CONCURRENCY is usually unset here
+WORKER_COORDINATION = coordination_enabled(True)
+
+async def run_worker(workers: int):
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await near_duplicate_index.load()
+    except Exception as e:
+        print(f"Warning: could not load the near-duplicate index: {str(e)}")
+    # Job workers spend the same provider quota as the API workers
+    if WORKER_COORDINATION:
+        await coordinator.start(llm_limiters(), registry.render)
+    await job_queue.start(workers)
+    print(f"Job worker started with {workers} workers")
+    try:
+        await stop.wait()
+    finally:
+        await job_queue.stop()
+        await coordinator.stop()
+        if llm_service is not None:
+            await llm_service.aclose()
+    stats = job_queue.stats()
+    print(f"Job worker stopped: {stats['succeeded']} succeeded, {stats['failed']} failed, {stats['retried']} retried")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Process queued reply jobs")
+    parser.add_argument("--workers", type=int, default=max(JOB_WORKERS, 1), help="Jobs processed at the same time")
+    args = parser.parse_args(argv)
+    asyncio.run(run_worker(args.workers))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,231 @@
+"""
+Write-behind buffering for Mongo inserts.
+
+Documents are queued in memory and written by a background task with
+insert_many(ordered=False), in batches bounded by size and by a flush window.
+The queue is bounded, so producers wait (backpressure) instead of growing memory
+without limit when Mongo falls behind.
+
+If a batch cannot be written it is appended to a local JSON-lines spill file and
+replayed on the next start or after the next successful flush. Every document is
+given an _id before it is queued, so replaying a partially written batch only
+produces duplicate-key errors for the documents that already made it. A replay
+first renames the spill file to a name of its own, so documents spilled while
+it runs start a new file instead of being deleted with the old one.
+
+Processes sharing a spill directory (gunicorn workers, app.worker) never share
+a file: each spills to `<spill_path stem>.<pid><ext>`. On start, a process also
+claims, by renaming them, the files of processes that are no longer running and
+the plain `spill_path` file of earlier versions, and replays them. The spill
+directory must be local to the machine, since pids are only checked there.
+"""
+
+import asyncio
+import glob
+import os
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError
+
+# Mongo error code for duplicate keys
+DUPLICATE_KEY_ERROR = 11000
+
+def _process_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # os.kill would terminate the process on Windows
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def raise_unless_duplicates(error: BulkWriteError):
+    """Re-raise a bulk write error unless every failed write was a duplicate key."""
+    errors = error.details.get("writeErrors", [])
+    if any(item.get("code") != DUPLICATE_KEY_ERROR for item in errors):
+        raise error
+
+async def insert_ignoring_duplicates(collection: Any, docs: List[Dict[str, Any]]):
+    """Insert documents, treating those that already exist as written."""
+    try:
+        await collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        raise_unless_duplicates(e)
+
+class WriteBehindBuffer:
+    def __init__(
+        self,
+        collection: Any,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        max_queue: int = 10000,
+        spill_path: str = "spill/replies.jsonl",
+        write: Callable[[Any, List[Dict[str, Any]]], Awaitable[None]] = insert_ignoring_duplicates
+    ):
+        self.collection = collection
+        # Writes one batch; it must be safe to repeat, since spilled batches are replayed
+        self.write = write
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.spill_path = spill_path
+        self.queue: Optional[asyncio.Queue] = None
+        self.running = False
+        self._worker: Optional[asyncio.Task] = None
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+
+    async def start(self):
+        """Replay any spilled documents and start the background writer."""
+        if self.running:
+            return
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.running = True
+        await self.replay_spill(leftovers=True)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting documents and flush everything still queued."""
+        if not self.running:
+            return
+        self.running = False
+        await self.queue.put(None)
+        await self._worker
+        self._worker = None
+
+    async def put(self, doc: Dict[str, Any]):
+        """Queue a document, waiting while the queue is full."""
+        doc.setdefault("_id", ObjectId())
+        await self.queue.put(doc)
+
+    async def put_many(self, docs: List[Dict[str, Any]]):
+        for doc in docs:
+            await self.put(doc)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            doc = await self.queue.get()
+            if doc is None:
+                break
+            batch = [doc]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    doc = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if doc is None:
+                    stopping = True
+                    break
+                batch.append(doc)
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                # Keep the writer alive; producers would block on a full queue without it
+                print(f"Warning: write-behind flush failed: {str(e)}")
+
+    async def _insert(self, batch: List[Dict[str, Any]]):
+        await self.write(self.collection, batch)
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        try:
+            await self._insert(batch)
+        except Exception:
+            # Keep the documents on disk so they are never lost
+            await asyncio.to_thread(self._append_spill, batch)
+            self.spilled += len(batch)
+            return
+        self.written += len(batch)
+        self.batches += 1
+        if os.path.exists(self.own_spill_path):
+            await self.replay_spill()
+
+    @property
+    def own_spill_path(self) -> str:
+        """The spill file of this process, named after its pid (read on use, so it follows forks)."""
+        stem, ext = os.path.splitext(self.spill_path)
+        return f"{stem}.{os.getpid()}{ext}"
+
+    def _append_spill(self, batch: List[Dict[str, Any]]):
+        os.makedirs(os.path.dirname(self.spill_path) or ".", exist_ok=True)
+        with open(self.own_spill_path, "a", encoding="utf-8") as f:
+            for doc in batch:
+                f.write(json_util.dumps(doc) + "\n")
+
+    def _read_spill(self, path: str) -> List[Dict[str, Any]]:
+        with open(path, encoding="utf-8") as f:
+            return [json_util.loads(line) for line in f if line.strip()]
+
+    def _claim_spill(self, path: str) -> Optional[str]:
+        """Rename a spill file for replay by this process; None when it is gone or taken."""
+        stem = os.path.splitext(self.spill_path)[0]
+        claimed = f"{stem}.{os.getpid()}.{uuid.uuid4().hex}.replay"
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            return None
+        return claimed
+
+    def _orphaned_spills(self) -> List[str]:
+        """Spill files no running process owns: those of exited processes and the shared file of earlier versions."""
+        stem, ext = os.path.splitext(self.spill_path)
+        orphans = [self.spill_path] if os.path.exists(self.spill_path) else []
+        for path in sorted(glob.glob(f"{glob.escape(stem)}.*")):
+            # <stem>.<pid><ext> while spilling, <stem>.<pid>.<id>.replay once claimed
+            owner, dot, rest = path[len(stem) + 1:].partition(".")
+            kind = dot + rest
+            if not owner.isdigit() or not (kind == ext or kind.endswith(".replay")):
+                continue
+            if int(owner) == os.getpid() or not _process_alive(int(owner)):
+                orphans.append(path)
+        return orphans
+
+    async def replay_spill(self, leftovers: bool = False):
+        """Write spilled documents back to Mongo.
+
+        With `leftovers`, the spill files of processes that exited, including
+        files claimed by a replay that never finished, are replayed as well.
+        """
+        paths = self._orphaned_spills() if leftovers else [self.own_spill_path]
+        for path in dict.fromkeys(paths):
+            claimed = self._claim_spill(path)
+            if claimed is not None:
+                await self._replay_file(claimed)
+
+    async def _replay_file(self, path: str):
+        try:
+            docs = await asyncio.to_thread(self._read_spill, path)
+            for start in range(0, len(docs), self.batch_size):
+                batch = docs[start:start + self.batch_size]
+                try:
+                    await self._insert(batch)
+                except Exception:
+                    # Still failing: spill the rest again for the next replay
+                    await asyncio.to_thread(self._append_spill, docs[start:])
+                    break
+                self.replayed += len(batch)
+            os.remove(path)
+        except Exception as e:
+            # The claimed file is kept and replayed on the next start
+            print(f"Warning: could not replay spill file {path}: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "queued": self.queue.qsize() if self.queue is not None else 0,
+            "written": self.written,
+            "batches": self.batches,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+        }
@@ -0,0 +1,72 @@
+"""
+Cold-start measurement for the API process.
+
+Starts fresh interpreters and times the phases a new worker goes through before
+it can answer traffic: importing app.main, running the lifespan startup and
+serving the first request. Each run is a separate process so nothing is already
+imported or connected. Mongo is replaced by the in-memory stand-in and in-process
+job workers are disabled, so only the app's own startup cost is measured.
+
+Usage:
+    python -m benchmarks.cold_start --runs 5
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PHASES = ("import", "startup", "first_request", "total")
+
+# Runs inside each fresh interpreter
+PROBE = """
+import asyncio, json, time
+start = time.perf_counter()
+import httpx
+from app import main
+from benchmarks.load_test import use_mongo_stand_in
+imported = time.perf_counter()
+use_mongo_stand_in()
+
+async def run():
+    async with main.app.router.lifespan_context(main.app):
+        started = time.perf_counter()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://cold") as client:
+            response = await client.get("/health/live")
+            assert response.status_code == 200
+        return started, time.perf_counter()
+
+started, served = asyncio.run(run())
+print(json.dumps({
+    "import": imported - start,
+    "startup": started - imported,
+    "first_request": served - started,
+    "total": served - start,
+}))
+"""
+
+def measure(runs: int):
+    env = {**os.environ, "GROQ_API_KEY": os.getenv("GROQ_API_KEY", "cold-start"), "JOB_WORKERS": "0"}
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE], env=env, capture_output=True, text=True, check=True
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {phase: statistics.median(sample[phase] for sample in samples) for phase in PHASES}
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure API cold-start time")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes to start")
+    args = parser.parse_args(argv)
+    result = measure(args.runs)
+    print("median over", args.runs, "runs")
+    for phase in PHASES:
+        print(f"{phase:14s}{result[phase] * 1000:9.1f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""
+Offline load test for the reply API.
+
+Starts the mock Groq server in a subprocess, runs the real FastAPI app in
+process against it with a Mongo stand-in, and replays posts from
+datasets/posts - Sheet1.csv at several concurrency levels for each generation
+strategy. Reports p50/p95/p99 latency, requests/s and resident memory.
+
+Examples:
+    python -m benchmarks.load_test
+    python -m benchmarks.load_test --strategies chain,fused --concurrency 1,16,64 --requests 300
+    python -m benchmarks.load_test --save baseline.json
+    python -m benchmarks.load_test --compare baseline.json --tolerance 0.2
+
+With --compare the process exits non-zero when p95 latency or throughput
+regresses by more than the tolerance, so it can gate a deploy.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List
+
+DATASET = "datasets/posts - Sheet1.csv"
+
+def percentile(values: List[float], q: float) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[int(q) - 1]
+
+def rss_mb() -> float:
+    """Current resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def start_mock_server(port: int, latency: float, jitter: float) -> subprocess.Popen:
+    process = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.mock_groq",
+        "--port", str(port), "--latency", str(latency), "--jitter", str(jitter)
+    ])
+    deadline = time.time() + 15
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("Mock Groq server did not start")
+
+def load_posts() -> List[Dict[str, str]]:
+    import pandas as pd
+    df = pd.read_csv(DATASET)
+    return [{"platform": row.platform, "post_text": row.post_text} for row in df.itertuples()]
+
+def use_mongo_stand_in():
+    """Back every collection of the app with an in-memory mongomock client."""
+    from mongomock_motor import AsyncMongoMockClient
+    from app import database
+    database.set_client(AsyncMongoMockClient())
+
+async def run_level(client, posts: List[Dict[str, str]], strategy: str, concurrency: int, total: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            post = posts[i % len(posts)]
+            payload = {**post, "strategy": strategy, "bypass_cache": True}
+            start = time.perf_counter()
+            response = await client.post("/reply", json=payload)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    return {
+        "strategy": strategy,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "rps": total / elapsed,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "rss_mb": rss_mb(),
+    }
+
+async def run_benchmark(args) -> List[Dict[str, Any]]:
+    import httpx
+    from app.main import app
+    if args.mongo == "mongomock":
+        use_mongo_stand_in()
+
+    posts = load_posts()
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            # Warm up connection pools before measuring
+            await run_level(client, posts, args.strategies[0], 4, 8)
+            for strategy in args.strategies:
+                for concurrency in args.concurrency:
+                    results.append(await run_level(client, posts, strategy, concurrency, args.requests))
+                    print_row(results[-1])
+    return results
+
+def print_header():
+    print(f"{'strategy':<8} {'conc':>5} {'reqs':>6} {'errs':>5} {'req/s':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rss MB':>8}")
+
+def print_row(r: Dict[str, Any]):
+    print(f"{r['strategy']:<8} {r['concurrency']:>5} {r['requests']:>6} {r['errors']:>5} {r['rps']:>8.1f} "
+          f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['rss_mb']:>8.1f}")
+
+def compare(results: List[Dict[str, Any]], baseline_path: str, tolerance: float) -> List[str]:
+    """List regressions against a saved baseline."""
+    with open(baseline_path) as f:
+        baseline = {(r["strategy"], r["concurrency"]): r for r in json.load(f)}
+    regressions = []
+    for r in results:
+        base = baseline.get((r["strategy"], r["concurrency"]))
+        if base is None:
+            continue
+        label = f"{r['strategy']}@{r['concurrency']}"
+        if r["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{label}: p95 {r['p95_ms']:.1f}ms vs baseline {base['p95_ms']:.1f}ms")
+        if r["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{label}: {r['rps']:.1f} req/s vs baseline {base['rps']:.1f} req/s")
+        if r["errors"] > base["errors"]:
+            regressions.append(f"{label}: {r['errors']} errors vs baseline {base['errors']}")
+    return regressions
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the reply API against a mock Groq server")
+    parser.add_argument("--strategies", default="chain,direct,fused", type=lambda v: v.split(","))
+    parser.add_argument("--concurrency", default="1,8,32", type=lambda v: [int(c) for c in v.split(",")])
+    parser.add_argument("--requests", type=int, default=100, help="Requests per strategy and concurrency level")
+    parser.add_argument("--latency", type=float, default=0.3, help="Mean mock completion latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Standard deviation of the mock latency")
+    parser.add_argument("--port", type=int, default=8001, help="Port for the mock Groq server")
+    parser.add_argument("--mongo", choices=["mongomock", "uri"], default="mongomock",
+                        help="Use an in-memory Mongo stand-in, or the database at MONGODB_URI")
+    parser.add_argument("--cache", action="store_true", help="Keep reply and stage caches enabled")
+    parser.add_argument("--analysis-mode", choices=["llm", "local", "hybrid"], default="llm",
+                        help="Where the chain's analysis comes from")
+    parser.add_argument("--rpm", type=float, default=0, help="LLM request budget per minute (0 disables)")
+    parser.add_argument("--tpm", type=float, default=0, help="LLM token budget per minute (0 disables)")
+    parser.add_argument("--save", help="Write results as JSON to this path")
+    parser.add_argument("--compare", help="Baseline JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    mock = start_mock_server(args.port, args.latency, args.jitter)
+    try:
+        # The app reads its configuration at import time, so set it up first
+        os.environ["GROQ_API_KEY"] = "benchmark"
+        os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{args.port}"
+        # Measure the app itself rather than the provider quota unless asked to
+        os.environ["LLM_REQUESTS_PER_MINUTE"] = str(args.rpm)
+        os.environ["LLM_TOKENS_PER_MINUTE"] = str(args.tpm)
+        os.environ["LLM_ANALYSIS_MODE"] = args.analysis_mode
+        if not args.cache:
+            os.environ["REPLY_CACHE_ENABLED"] = "false"
+            os.environ["STAGE_CACHE_ENABLED"] = "false"
+        print_header()
+        results = asyncio.run(run_benchmark(args))
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""
+Local stand-in for the Groq chat completions endpoint.
+
+Serves POST /openai/v1/chat/completions with a configurable latency and jitter
+so the real application can be load-tested without network access or API
+quota. Plain, JSON-mode (fused strategy) and streaming completions are
+supported, and token usage is reported like the real API.
+
+Run standalone:
+    python -m benchmarks.mock_groq --port 8001 --latency 0.3 --jitter 0.1
+and point the app at it with GROQ_BASE_URL=http://127.0.0.1:8001. The load
+test starts it in a subprocess so it does not share the app's event loop or GIL.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+REPLY_TEXT = "Totally agree with this, thanks for sharing! Curious to see where it goes next."
+
+def create_app(latency: float = 0.3, jitter: float = 0.1, stream_chunk_delay: float = 0.01) -> FastAPI:
+    app = FastAPI(title="Mock Groq")
+
+    async def simulate_latency():
+        await asyncio.sleep(max(0.0, random.gauss(latency, jitter) if jitter else latency))
+
+    @app.get("/openai/v1/models")
+    async def models():
+        return {"object": "list", "data": [{"id": "mock-model", "object": "model", "created": 0, "owned_by": "mock"}]}
+
+    @app.post("/openai/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in body.get("messages", []))
+        if body.get("response_format", {}).get("type") == "json_object":
+            content = json.dumps({"analysis": "Positive, casual tone about a product launch.",
+                                  "persona": "An upbeat early adopter.", "reply": REPLY_TEXT})
+        else:
+            content = REPLY_TEXT
+        created = int(time.time())
+        await simulate_latency()
+
+        if body.get("stream"):
+            async def chunks():
+                for word in content.split(" "):
+                    chunk = {"id": "mock", "object": "chat.completion.chunk", "created": created,
+                             "model": body.get("model"),
+                             "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+                    yield f"data: {json.dumps(chunk)}\n\n"
+                    await asyncio.sleep(stream_chunk_delay)
+                yield "data: [DONE]\n\n"
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+
+        completion_tokens = len(content.split())
+        return JSONResponse({
+            "id": "mock",
+            "object": "chat.completion",
+            "created": created,
+            "model": body.get("model"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}
+        })
+
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Groq chat completions server")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.3, help="Mean completion latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Standard deviation of the latency")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.latency, args.jitter), host="127.0.0.1", port=args.port,
+                log_level="warning", access_log=False)
@@ -0,0 +1,23 @@
+"""
+gunicorn settings for running several API worker processes.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Each worker is a full uvicorn event loop with its own copy of the app. The
+worker count is exported as WEB_CONCURRENCY before the workers import the app,
+which switches on cross-process coordination (see app/coordination.py).
+"""
+
+import multiprocessing
+import os
+
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+os.environ.setdefault("WEB_CONCURRENCY", str(workers))
+
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("BIND", "0.0.0.0:8000")
+# Long enough for a full prompt chain under rate limiting
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# Time to drain in-flight requests, running jobs and the write buffer on shutdown
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
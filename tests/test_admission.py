@@ -0,0 +1,181 @@
+import asyncio
+import time
+import pytest
+from fastapi.testclient import TestClient
+from app import admission as admission_module, main
+from app.admission import (
+    AdmissionController, DeadlineExceeded, Overloaded, call_timeout, client_key, deadline_scope
+)
+from app.main import app
+from app.services.llm_backends import Completion, StubBackend
+from app.services.llm_service import LLMService
+from app.services.rate_limiter import RateLimiter
+
+client = TestClient(app)
+
+class TimeoutRecordingBackend(StubBackend):
+    def __init__(self, latency: float = 0):
+        super().__init__(latency=latency)
+        self.timeouts = []
+
+    async def complete(self, messages, timeout, **params) -> Completion:
+        self.timeouts.append(timeout)
+        return await super().complete(messages, timeout, **params)
+
+def test_queue_hands_over_slots_and_sheds_beyond_it():
+    controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=5, client_limit=0)
+
+    async def run():
+        first = await controller.acquire("a")
+        queued = asyncio.ensure_future(controller.acquire("b"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as shed:
+            await controller.acquire("c")
+        first()
+        second = await queued
+        assert controller.in_flight == 1
+        second()
+        return shed.value
+
+    shed = asyncio.run(run())
+    assert shed.status_code == 503
+    assert shed.retry_after >= 1
+    assert controller.in_flight == 0
+    assert controller.rejected["queue_full"] == 1
+
+def test_queue_wait_is_bounded_by_the_deadline():
+    controller = AdmissionController(max_in_flight=1, max_queue=10, queue_timeout=5, client_limit=0)
+
+    async def run():
+        held = await controller.acquire("a")
+        with deadline_scope(0.05):
+            with pytest.raises(Overloaded):
+                await controller.acquire("b")
+        held()
+        # The timed-out waiter does not keep the slot
+        (await controller.acquire("c"))()
+
+    asyncio.run(run())
+    assert controller.rejected["queue_timeout"] == 1
+    assert controller.in_flight == 0
+
+def test_client_quota_answers_429():
+    controller = AdmissionController(max_in_flight=10, client_limit=1, client_limits={"partner": 2})
+
+    async def run():
+        await controller.acquire("trial")
+        await controller.acquire("partner")
+        await controller.acquire("partner")
+        for key in ("trial", "partner"):
+            with pytest.raises(Overloaded) as shed:
+                await controller.acquire(key)
+            assert shed.value.status_code == 429
+
+    asyncio.run(run())
+    assert controller.rejected["client_quota"] == 2
+
+def test_only_configured_api_keys_identify_clients(monkeypatch):
+    monkeypatch.setattr(admission_module, "API_KEYS", {"app-key"})
+    monkeypatch.setattr(admission_module, "CLIENT_QUOTAS", {"partner": 4})
+    assert client_key({"x-api-key": "app-key"}, "10.0.0.1") == "app-key"
+    assert client_key({"x-api-key": "partner"}, "10.0.0.1") == "partner"
+    # A made-up key does not escape the address's quota
+    assert client_key({"x-api-key": "fresh-key-123"}, "10.0.0.1") == "10.0.0.1"
+    assert client_key({}, None) == "unknown"
+
+def test_deadline_cuts_llm_timeouts_and_rate_limit_waits():
+    backend = TimeoutRecordingBackend()
+    service = LLMService(backends=[backend])
+    limiter = RateLimiter(requests_per_minute=1, tokens_per_minute=0)
+
+    async def run():
+        with deadline_scope(2):
+            await service.generate("twitter", "Shipping day!", strategy="direct")
+            await limiter.acquire(0)
+            # The next request slot is a minute away, so waiting would only time out
+            with pytest.raises(DeadlineExceeded):
+                await limiter.acquire(0)
+        with deadline_scope(0):
+            with pytest.raises(DeadlineExceeded):
+                call_timeout(30)
+        assert call_timeout(30) == 30
+
+    asyncio.run(run())
+    assert 0 < backend.timeouts[0] <= 2
+    assert limiter.shed == 1
+
+def test_reply_is_shed_with_retry_after(monkeypatch):
+    full = AdmissionController(max_in_flight=1, max_queue=0, client_limit=0)
+    full.in_flight = 1
+    monkeypatch.setattr(main, "admission", full)
+    response = client.post("/reply", json={"platform": "twitter", "post_text": "Hello"})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+
+    quota = AdmissionController(max_in_flight=10, client_limit=1)
+    quota._clients["key-1"] = 1
+    monkeypatch.setattr(main, "admission", quota)
+    monkeypatch.setattr(admission_module, "API_KEYS", {"key-1"})
+    response = client.post("/reply/stream", json={"platform": "twitter", "post_text": "Hello"}, headers={"X-API-Key": "key-1"})
+    assert response.status_code == 429
+    assert "Retry-After" in response.headers
+
+def test_reply_deadline_expiring_mid_chain_answers_503(monkeypatch):
+    from app.services import reply_service as reply_module
+    from app.services.cache_service import ReplyCache
+    backend = TimeoutRecordingBackend(latency=0.3)
+    service = reply_module.ReplyService(single_flight=True)
+    monkeypatch.setattr(reply_module, "llm_service", LLMService(backends=[backend]))
+    monkeypatch.setattr(reply_module, "reply_cache", ReplyCache())
+    monkeypatch.setattr(main, "reply_service", service)
+    monkeypatch.setattr(main, "admission", AdmissionController(client_limit=0))
+
+    # The analysis call fits in the deadline, the persona call is cut off by it
+    response = client.post(
+        "/reply",
+        json={"platform": "twitter", "post_text": "Shipping day!", "strategy": "chain", "bypass_cache": True},
+        headers={"X-Request-Timeout": "0.5"}
+    )
+    assert response.status_code == 503
+    assert "deadline" in response.json()["detail"]
+    assert int(response.headers["Retry-After"]) >= 1
+    # The shared generation ran under the request's deadline and stopped with it
+    assert len(backend.timeouts) == 2
+    assert all(timeout <= 0.5 for timeout in backend.timeouts)
+    assert backend.timeouts[-1] < 0.3
+    time.sleep(0.1)
+    assert service.flights.stats()["in_flight"] == 0
+    assert len(backend.timeouts) == 2
+
+def test_batch_items_take_admission_slots(monkeypatch):
+    from app.models import ReplyRequest
+    from app.services import reply_service as reply_module
+    controller = AdmissionController(max_in_flight=10, client_limit=2)
+    monkeypatch.setattr(reply_module, "admission", controller)
+    in_flight = []
+
+    async def generate_item(self, platform, post_text, *args):
+        in_flight.append(controller.in_flight)
+        await asyncio.sleep(0.01)
+        return f"reply to {post_text}", False, None
+
+    async def store_replies(docs):
+        pass
+
+    monkeypatch.setattr(reply_module.ReplyService, "_generate_item", generate_item)
+    monkeypatch.setattr(reply_module, "store_replies", store_replies)
+    items = [ReplyRequest(platform="twitter", post_text=f"post {n}") for n in range(6)]
+    service = reply_module.ReplyService(single_flight=False)
+    results = asyncio.run(service.generate_and_store_replies(items, concurrency=8, client="key-1"))
+    assert all("result" in result for result in results)
+    # Concurrency is capped at the client's quota, so no item is shed by its own batch
+    assert max(in_flight) == 2
+    assert controller.admitted == 6 and controller.in_flight == 0
+
+    full = AdmissionController(max_in_flight=1, max_queue=0, client_limit=0)
+    full.in_flight = 1
+    monkeypatch.setattr(reply_module, "admission", full)
+    response = client.post("/reply/batch", json={"items": [{"platform": "twitter", "post_text": "Hello"}]})
+    assert response.status_code == 200
+    assert response.json()["failed"] == 1
+    assert "overloaded" in response.json()["results"][0]["error"]
@@ -1,4 +1,5 @@
 from fastapi.testclient import TestClient
+from app import main
 from app.main import app
 import pandas as pd
 import json
@@ -6,10 +7,28 @@ import os
 
 client = TestClient(app)
 
-def test_health_check():
+def test_health_check(monkeypatch):
+    async def reachable():
+        return None
+
+    async def unreachable():
+        raise Exception("connection refused")
+
+    monkeypatch.setattr(main, "_health_results", {})
+    monkeypatch.setattr(main, "mongo_ping", reachable)
+    monkeypatch.setattr(main, "_llm_ping", reachable)
     response = client.get("/health")
     assert response.status_code == 200
-    assert response.json() == {"status": "healthy"}
+    assert response.json()["status"] == "healthy"
+    assert response.json()["checks"]["mongo"]["ok"] is True
+
+    monkeypatch.setattr(main, "_health_results", {})
+    monkeypatch.setattr(main, "mongo_ping", unreachable)
+    response = client.get("/health")
+    assert response.status_code == 503
+    assert response.json()["checks"]["mongo"] == {"ok": False, "error": "connection refused"}
+
+    assert client.get("/health/live").json() == {"status": "alive"}
 
 def test_generate_reply_with_dataset():
     # Load the dataset
@@ -0,0 +1,62 @@
+import asyncio
+from app.services.cache_service import ReplyCache, TTLCache, make_cache_key, normalize_text
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+def test_normalize_text_collapses_whitespace():
+    assert normalize_text("  Big   news\n\ttoday  ") == "Big news today"
+
+def test_cache_key_depends_on_all_parts():
+    base = make_cache_key("twitter", "hello", {"model": "m"})
+    assert base == make_cache_key("twitter", "hello", {"model": "m"})
+    assert base != make_cache_key("linkedin", "hello", {"model": "m"})
+    assert base != make_cache_key("twitter", "hello", {"model": "other"})
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.evictions == 1
+
+def test_ttl_cache_expires_entries():
+    clock = FakeClock()
+    cache = TTLCache(max_size=10, ttl=5, clock=clock)
+    cache.set("a", 1)
+    clock.now = 4.9
+    assert cache.get("a") == 1
+    clock.now = 5.0
+    assert cache.get("a") is None
+    assert cache.expirations == 1
+
+def test_reply_cache_counts_hits_and_misses():
+    cache = ReplyCache(max_size=10, ttl=60)
+    config = {"model": "m"}
+    key = cache.key("twitter", "Same  post", config)
+
+    async def run():
+        assert await cache.get(key) is None
+        await cache.set(key, "reply")
+        return await cache.get(cache.key("twitter", "Same post", config))
+
+    assert asyncio.run(run()) == "reply"
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_disabled_reply_cache_never_stores():
+    cache = ReplyCache(enabled=False)
+
+    async def run():
+        await cache.set("k", "reply")
+        return await cache.get("k")
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from app.coordination import WorkerCoordinator, coordination_enabled
+from app.metrics import merge_expositions
+from app.services.rate_limiter import RateLimiter
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+def make_collection():
+    return mongomock_motor.AsyncMongoMockClient().db.coordination
+
+def test_workers_split_the_quota_and_rebalance_on_exit():
+    collection = make_collection()
+    first, second = RateLimiter(60, 6000), RateLimiter(60, 6000)
+    a, b = WorkerCoordinator(collection, interval=60), WorkerCoordinator(collection, interval=60)
+
+    async def run():
+        await a.start([first])
+        await b.start([second])
+        await a.beat()
+        shares = (first.share, second.share, first.requests.capacity)
+        await b.stop()
+        await a.beat()
+        await a.stop()
+        return shares
+
+    share_a, share_b, capacity = asyncio.run(run())
+    assert share_a == share_b == 0.5
+    assert capacity == 30
+    assert first.share == 1.0
+    assert first.requests.capacity == 60
+
+def test_pause_is_broadcast_to_other_workers():
+    collection = make_collection()
+    first, second = RateLimiter(60, 0), RateLimiter(60, 0)
+    a, b = WorkerCoordinator(collection, interval=60), WorkerCoordinator(collection, interval=60)
+
+    async def run():
+        await a.start([first])
+        await b.start([second])
+        first.pause(30)
+        await a.beat()
+        await b.beat()
+        await a.stop()
+        await b.stop()
+
+    asyncio.run(run())
+    assert second.paused_until - second.clock() > 25
+
+def test_cluster_metrics_merge_every_live_worker():
+    collection = make_collection()
+    exposition = (
+        "# HELP socialpilot_requests_total Requests\n"
+        "# TYPE socialpilot_requests_total counter\n"
+        'socialpilot_requests_total{status="200"} 3\n'
+        "# HELP socialpilot_jobs_queued Jobs waiting\n"
+        "# TYPE socialpilot_jobs_queued gauge\n"
+        "socialpilot_jobs_queued 4\n"
+    )
+    a, b = WorkerCoordinator(collection, interval=60), WorkerCoordinator(collection, interval=60)
+
+    async def run():
+        await a.start([], lambda: exposition)
+        await b.start([], lambda: exposition)
+        merged = await a.cluster_metrics(exposition)
+        await a.stop()
+        await b.stop()
+        return merged
+
+    merged = asyncio.run(run())
+    assert 'socialpilot_requests_total{status="200"} 6' in merged
+    assert "socialpilot_cluster_workers 2" in merged
+    assert merged.count("# TYPE socialpilot_requests_total counter") == 1
+    assert merge_expositions([exposition]) == exposition
+
+def test_standalone_workers_coordinate_unless_disabled(monkeypatch):
+    monkeypatch.delenv("WORKER_COORDINATION", raising=False)
+    # app.worker passes True, API processes pass whether gunicorn runs several of them
+    assert coordination_enabled(True)
+    assert not coordination_enabled(False)
+    monkeypatch.setenv("WORKER_COORDINATION", "false")
+    assert not coordination_enabled(True)
@@ -0,0 +1,64 @@
+import asyncio
+import csv
+import pytest
+from openpyxl import Workbook
+from app import ingest
+
+class FakeReplyService:
+    """Generates predictable replies and can crash after a number of chunks."""
+
+    def __init__(self, fail_after_chunks=None):
+        self.chunks = 0
+        self.fail_after_chunks = fail_after_chunks
+
+    async def generate_and_store_replies(self, items, concurrency=None):
+        if self.fail_after_chunks is not None and self.chunks >= self.fail_after_chunks:
+            raise RuntimeError("worker crashed")
+        self.chunks += 1
+        return [
+            {"index": i, "result": {"reply": f"re: {item.post_text}", "timestamp": "2024-01-01T00:00:00"}}
+            for i, item in enumerate(items)
+        ]
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=["platform", "post_text"])
+        writer.writeheader()
+        writer.writerows(rows)
+
+def read_output(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+def test_ingestion_resumes_after_crash(tmp_path, monkeypatch):
+    rows = [{"platform": "twitter", "post_text": f"post {i}"} for i in range(7)]
+    rows[3]["platform"] = "myspace"
+    input_path, output_path = tmp_path / "posts.csv", tmp_path / "out.csv"
+    write_csv(input_path, rows)
+
+    monkeypatch.setattr(ingest, "reply_service", FakeReplyService(fail_after_chunks=1))
+    with pytest.raises(RuntimeError):
+        asyncio.run(ingest.run_ingestion(str(input_path), str(output_path), chunk_size=3))
+    assert len(read_output(output_path)) == 3
+
+    monkeypatch.setattr(ingest, "reply_service", FakeReplyService())
+    stats = asyncio.run(ingest.run_ingestion(str(input_path), str(output_path), chunk_size=3))
+
+    output = read_output(output_path)
+    assert [row["post_text"] for row in output] == [f"post {i}" for i in range(7)]
+    assert output[0]["reply"] == "re: post 0"
+    assert output[3]["reply"] == "" and output[3]["error"].startswith("Invalid row")
+    assert stats["rows"] == 7
+
+def test_xlsx_rows_are_streamed_in_chunks(tmp_path):
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(["platform", "post_text"])
+    for i in range(5):
+        sheet.append(["linkedin", f"update {i}"])
+    path = tmp_path / "posts.xlsx"
+    workbook.save(path)
+
+    chunks = list(ingest.iter_chunks(str(path), chunk_size=2, skip_rows=1))
+    assert [len(chunk) for chunk in chunks] == [2, 2]
+    assert chunks[0][0] == {"platform": "linkedin", "post_text": "update 1"}
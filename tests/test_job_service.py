@@ -0,0 +1,227 @@
+import asyncio
+from datetime import datetime, timedelta
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from app.admission import AdmissionController
+from app.main import app
+from app.models import ReplyRequest
+from app.services import job_service as job_module
+from app.services.job_service import JobQueue, JobQueueFull
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+class FakeReplyService:
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.calls = []
+
+    async def generate_and_store_reply(self, platform, post_text, bypass_cache=False, strategy=None, variants=1):
+        self.calls.append(post_text)
+        if len(self.calls) <= self.failures:
+            raise Exception("upstream error")
+        return {
+            "reply": f"reply to {post_text}",
+            "platform": platform,
+            "post_text": post_text,
+            "timestamp": datetime.utcnow().isoformat(),
+            "cached": False
+        }
+
+def make_queue(monkeypatch, failures=0, **kwargs):
+    service = FakeReplyService(failures)
+    monkeypatch.setattr(job_module, "reply_service", service)
+    collection = mongomock_motor.AsyncMongoMockClient().db.jobs
+    return JobQueue(collection, retry_delay=0, **kwargs), service
+
+class OutageCollection:
+    """A collection whose index creation fails until `down` is cleared."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.down = True
+
+    async def create_index(self, *args, **kwargs):
+        if self.down:
+            raise ConnectionError("mongo is down")
+        return await self.collection.create_index(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+def request(text: str) -> ReplyRequest:
+    return ReplyRequest(platform="twitter", post_text=text)
+
+def test_jobs_are_claimed_by_priority_and_completed(monkeypatch):
+    queue, service = make_queue(monkeypatch)
+
+    async def run():
+        await queue.submit(request("low"), priority="low")
+        await queue.submit(request("normal"))
+        high = await queue.submit(request("high"), priority="high")
+        for _ in range(3):
+            await queue.process(await queue.claim("worker-1"))
+        assert await queue.claim("worker-1") is None
+        return await queue.get(high["_id"])
+
+    job = asyncio.run(run())
+    assert service.calls == ["high", "normal", "low"]
+    assert job["status"] == "succeeded"
+    assert job["result"]["reply"] == "reply to high"
+    assert queue.stats()["succeeded"] == 3
+
+def test_failed_jobs_are_retried_then_marked_failed(monkeypatch):
+    queue, service = make_queue(monkeypatch, failures=10, max_attempts=2)
+
+    async def run():
+        job = await queue.submit(request("flaky"))
+        await queue.process(await queue.claim("worker-1"))
+        assert (await queue.get(job["_id"]))["status"] == "queued"
+        await queue.process(await queue.claim("worker-1"))
+        return await queue.get(job["_id"])
+
+    job = asyncio.run(run())
+    assert job["status"] == "failed"
+    assert job["attempts"] == 2
+    assert "upstream error" in job["error"]
+
+def test_expired_lease_is_reclaimed(monkeypatch):
+    queue, service = make_queue(monkeypatch, lease_seconds=60)
+
+    async def run():
+        job = await queue.submit(request("orphaned"))
+        await queue.claim("dead-worker")
+        assert await queue.claim("worker-2") is None
+        # The first worker died; its lease runs out
+        await queue.collection.update_one(
+            {"_id": job["_id"]}, {"$set": {"lease_expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+        )
+        claimed = await queue.claim("worker-2")
+        await queue.process(claimed)
+        return await queue.get(job["_id"])
+
+    job = asyncio.run(run())
+    assert job["status"] == "succeeded"
+    assert job["worker"] == "worker-2"
+    assert job["attempts"] == 2
+
+def test_callback_receives_final_status(monkeypatch):
+    received = []
+
+    def handler(http_request):
+        received.append(http_request)
+        return httpx.Response(200)
+
+    queue, service = make_queue(monkeypatch, http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+
+    async def run():
+        job = await queue.submit(request("notify me"), callback_url="http://client.test/hook")
+        await queue.process(await queue.claim("worker-1"))
+        return await queue.get(job["_id"])
+
+    job = asyncio.run(run())
+    assert job["callback_status"] == "delivered"
+    assert str(received[0].url) == "http://client.test/hook"
+    assert b'"status":"succeeded"' in received[0].content.replace(b" ", b"")
+
+def test_workers_drain_the_queue(monkeypatch):
+    queue, service = make_queue(monkeypatch, workers=3, poll_interval=0.05)
+
+    async def run():
+        await queue.start()
+        jobs = [await queue.submit(request(f"post {n}")) for n in range(6)]
+        for _ in range(100):
+            if queue.stats()["succeeded"] == 6:
+                break
+            await asyncio.sleep(0.02)
+        await queue.stop()
+        return [await queue.get(job["_id"]) for job in jobs]
+
+    jobs = asyncio.run(run())
+    assert all(job["status"] == "succeeded" for job in jobs)
+    assert sorted(service.calls) == sorted(f"post {n}" for n in range(6))
+
+def test_workers_start_while_mongo_is_unreachable(monkeypatch):
+    queue, service = make_queue(monkeypatch, workers=1, poll_interval=0.02)
+    queue.collection = OutageCollection(queue.collection)
+
+    async def run():
+        await queue.start()
+        await asyncio.sleep(0.05)
+        queue.collection.down = False
+        job = await queue.submit(request("after the outage"))
+        for _ in range(100):
+            if queue.stats()["succeeded"] == 1:
+                break
+            await asyncio.sleep(0.02)
+        await queue.stop()
+        return await queue.get(job["_id"])
+
+    assert asyncio.run(run())["status"] == "succeeded"
+
+def test_jobs_are_admitted_as_their_client(monkeypatch):
+    queue, service = make_queue(monkeypatch)
+    controller = AdmissionController(max_in_flight=10, client_limit=1)
+    # The client already has a /reply request running
+    controller._clients["key-1"] = 1
+    monkeypatch.setattr(job_module, "admission", controller)
+
+    async def run():
+        job = await queue.submit(request("busy client"), client="key-1")
+        await queue.process(await queue.claim("worker-1"))
+        return await queue.get(job["_id"])
+
+    job = asyncio.run(run())
+    assert job["status"] == "queued"
+    assert "per client" in job["error"]
+    assert job["available_at"] > datetime.utcnow()
+    assert service.calls == []
+
+def test_shed_jobs_keep_their_attempts(monkeypatch):
+    queue, service = make_queue(monkeypatch, max_attempts=2)
+    controller = AdmissionController(max_in_flight=10, client_limit=1)
+    controller._clients["key-1"] = 1
+    monkeypatch.setattr(job_module, "admission", controller)
+
+    async def run():
+        job = await queue.submit(request("spike"), client="key-1")
+        # A spike longer than max_attempts sheds the job every time it is claimed
+        for _ in range(3):
+            await queue.collection.update_one({"_id": job["_id"]}, {"$set": {"available_at": datetime.utcnow()}})
+            await queue.process(await queue.claim("worker-1"))
+        shed = await queue.get(job["_id"])
+        controller._clients.clear()
+        await queue.collection.update_one({"_id": job["_id"]}, {"$set": {"available_at": datetime.utcnow()}})
+        await queue.process(await queue.claim("worker-1"))
+        return shed, await queue.get(job["_id"])
+
+    shed, job = asyncio.run(run())
+    assert shed["status"] == "queued" and shed["attempts"] == 0
+    assert job["status"] == "succeeded" and job["attempts"] == 1
+    assert queue.stats()["deferred"] == 3 and queue.stats()["failed"] == 0
+
+def test_full_queue_rejects_submissions(monkeypatch):
+    queue, service = make_queue(monkeypatch, max_queued=1)
+
+    async def run():
+        await queue.submit(request("first"))
+        await queue.submit(request("second"))
+
+    with pytest.raises(JobQueueFull):
+        asyncio.run(run())
+
+def test_job_endpoints(monkeypatch):
+    queue, service = make_queue(monkeypatch)
+    monkeypatch.setattr(job_module.job_queue, "collection", queue.collection)
+    client = TestClient(app)
+
+    response = client.post("/jobs", json={"platform": "linkedin", "post_text": "We are hiring", "priority": "high"})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "queued" and job["priority"] == "high"
+
+    response = client.get(f"/jobs/{job['job_id']}")
+    assert response.status_code == 200
+    assert response.json()["job_id"] == job["job_id"]
+
+    assert client.get("/jobs/missing").status_code == 404
@@ -0,0 +1,114 @@
+import asyncio
+import json
+import httpx
+import pytest
+from app.services.llm_backends import Completion, OpenAICompatibleBackend, StubBackend
+from app.services.llm_router import LLMRouter
+from app.services.llm_service import LLMService
+from app.services.rate_limiter import RateLimiter
+
+class FailingBackend(StubBackend):
+    def __init__(self, name: str):
+        super().__init__(latency=0)
+        self.limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0, max_retries=0)
+        self.name = name
+        self.calls = 0
+
+    async def complete(self, messages, timeout, **params) -> Completion:
+        self.calls += 1
+        raise httpx.ConnectError("backend down")
+
+def named_stub(name: str, latency: float, content: str) -> StubBackend:
+    backend = StubBackend(latency=latency, content=content)
+    backend.name = name
+    return backend
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+def test_router_prefers_the_fastest_backend():
+    slow, fast = named_stub("slow", 0.03, "slow"), named_stub("fast", 0.0, "fast")
+    router = LLMRouter([slow, fast], min_samples=1)
+
+    async def run():
+        # Unmeasured backends rank first, so both get sampled before latency decides
+        first = await router.complete("direct", MESSAGES, 10, 0, 5)
+        second = await router.complete("direct", MESSAGES, 10, 0, 5)
+        third = await router.complete("direct", MESSAGES, 10, 0, 5)
+        return [first.content, second.content, third.content]
+
+    assert asyncio.run(run()) == ["slow", "fast", "fast"]
+    assert [backend.name for backend in router.rank("direct")] == ["fast", "slow"]
+
+def test_router_fails_over_and_demotes_unhealthy_backend():
+    broken = FailingBackend("broken")
+    router = LLMRouter([broken, named_stub("spare", 0, "spare")], min_samples=1)
+
+    async def run():
+        return [(await router.complete("direct", MESSAGES, 10, 0, 5)).content for _ in range(3)]
+
+    assert asyncio.run(run()) == ["spare", "spare", "spare"]
+    # Only the first call tried the broken backend; afterwards it ranks last
+    assert broken.calls == 1
+    assert router.failovers == 1
+    assert router.healthy(broken, "direct") is False
+
+def test_router_raises_when_every_backend_fails():
+    router = LLMRouter([FailingBackend("a"), FailingBackend("b")])
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(router.complete("direct", MESSAGES, 10, 0, 5))
+
+def test_hedge_wins_when_primary_is_slow():
+    primary, secondary = named_stub("primary", 0.0, "primary"), named_stub("secondary", 0.01, "secondary")
+    router = LLMRouter([primary, secondary], hedge=True, min_samples=2, hedge_min_delay=0.02)
+
+    async def run():
+        # Learn latencies that rank the primary first, then make it stall
+        for _ in range(2):
+            await router._attempt(primary, "direct", MESSAGES, 10, 0, 5, {})
+            await router._attempt(secondary, "direct", MESSAGES, 10, 0, 5, {})
+        primary.latency = 1.0
+        return await router.complete("direct", MESSAGES, 10, 0, 5)
+
+    assert asyncio.run(run()).content == "secondary"
+    assert router.hedges == 1
+    assert router.hedge_wins == 1
+
+def test_openai_compatible_backend_complete_and_stream():
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        requests.append((request.url.path, request.headers.get("authorization"), body))
+        if body.get("stream"):
+            chunks = [{"choices": [{"delta": {"content": part}}]} for part in ("Hello", " there")]
+            text = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+            return httpx.Response(200, text=text, headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json={
+            "choices": [{"message": {"role": "assistant", "content": "Hi!"}}],
+            "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5}
+        })
+
+    backend = OpenAICompatibleBackend(
+        "http://vllm.local/v1/", "secret", "llama-3", RateLimiter(requests_per_minute=0, tokens_per_minute=0),
+        httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    )
+
+    async def run():
+        completion = await backend.complete(MESSAGES, 5, temperature=0.7)
+        stream = await backend.open_stream(MESSAGES, 5)
+        deltas = [delta async for delta in stream]
+        await stream.aclose()
+        await backend.aclose()
+        return completion, deltas
+
+    completion, deltas = asyncio.run(run())
+    assert completion.content == "Hi!"
+    assert completion.usage.total_tokens == 5
+    assert deltas == ["Hello", " there"]
+    assert requests[0] == ("/v1/chat/completions", "Bearer secret", {"model": "llama-3", "messages": MESSAGES, "temperature": 0.7})
+
+def test_service_generates_through_stub_backend():
+    service = LLMService(backends=[StubBackend(latency=0)], strategy="fused")
+    reply = asyncio.run(service.generate_reply("twitter", "Shipping our new release today!"))
+    assert reply == "Thanks for sharing this, really interesting take!"
+    assert service.model == "stub:stub"
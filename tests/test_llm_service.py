@@ -0,0 +1,156 @@
+import asyncio
+import json
+import time
+import httpx
+from app.services.llm_service import LLMService
+from app.services.rate_limiter import RateLimiter
+
+# Simulated latency of a single Groq completion
+STUB_LATENCY = 0.2
+
+# Number of completions served by the stub, per test
+stub_calls = []
+
+# Content returned for JSON-mode (fused) completions
+fused_content = {"value": ""}
+
+async def stub_groq(request: httpx.Request) -> httpx.Response:
+    """Local stand-in for the Groq chat completions endpoint."""
+    stub_calls.append(request)
+    await asyncio.sleep(STUB_LATENCY)
+    if json.loads(request.content).get("stream"):
+        chunks = [
+            {"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": "stub-model",
+             "choices": [{"index": 0, "delta": {"role": "assistant", "content": token}, "finish_reason": None}]}
+            for token in ("stub ", "streamed ", "reply")
+        ]
+        body = "".join(f"data: {json.dumps(chunk)}\n\n" for chunk in chunks) + "data: [DONE]\n\n"
+        return httpx.Response(200, text=body, headers={"content-type": "text/event-stream"})
+    content = "stub completion"
+    if json.loads(request.content).get("response_format"):
+        content = fused_content["value"]
+    return httpx.Response(200, json={
+        "id": "stub",
+        "object": "chat.completion",
+        "model": "stub-model",
+        "choices": [{
+            "index": 0,
+            "finish_reason": "stop",
+            "message": {"role": "assistant", "content": content}
+        }],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+    })
+
+def make_service(monkeypatch) -> LLMService:
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    stub_calls.clear()
+    return LLMService(
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(stub_groq)),
+        limiter=RateLimiter(requests_per_minute=0, tokens_per_minute=0)
+    )
+
+def test_generate_reply_uses_stub(monkeypatch):
+    service = make_service(monkeypatch)
+
+    async def run():
+        try:
+            return await service.generate_reply("twitter", "Just shipped a new release!")
+        finally:
+            await service.aclose()
+
+    assert asyncio.run(run()) == "stub completion"
+
+def test_concurrent_replies_do_not_block_each_other(monkeypatch):
+    service = make_service(monkeypatch)
+    concurrency = 10
+
+    async def run():
+        try:
+            start = time.perf_counter()
+            replies = await asyncio.gather(*(
+                service.generate_reply("linkedin", f"Post number {i}") for i in range(concurrency)
+            ))
+            return replies, time.perf_counter() - start
+        finally:
+            await service.aclose()
+
+    replies, elapsed = asyncio.run(run())
+    assert len(replies) == concurrency
+    # Each reply is three sequential calls; a blocking client would need concurrency times as long
+    chain_latency = 3 * STUB_LATENCY
+    assert elapsed < chain_latency * 3
+
+def test_analysis_and_persona_are_reused(monkeypatch):
+    service = make_service(monkeypatch)
+    post = "We just crossed 10k users!"
+
+    async def run():
+        try:
+            for platform in ("twitter", "linkedin", "instagram"):
+                await service.generate_reply(platform, post)
+            # Regenerating for variety only repeats the final reply call
+            await service.generate_reply("twitter", post)
+        finally:
+            await service.aclose()
+
+    asyncio.run(run())
+    # 1 analysis + 3 personas + 4 replies instead of 12 calls
+    assert len(stub_calls) == 8
+    stats = service.stage_cache_stats()
+    assert stats["analysis"]["hits"] == 3
+    assert stats["persona"]["hits"] == 1
+
+def test_stream_reply_yields_stages_then_tokens(monkeypatch):
+    service = make_service(monkeypatch)
+
+    async def run():
+        try:
+            return [event async for event in service.stream_reply("twitter", "Streaming is live")]
+        finally:
+            await service.aclose()
+
+    events = asyncio.run(run())
+    assert [name for name, _ in events[:2]] == ["analysis", "persona"]
+    assert "".join(data["token"] for name, data in events if name == "token") == "stub streamed reply"
+
+def test_fused_strategy_uses_one_call(monkeypatch):
+    service = make_service(monkeypatch)
+    fused_content["value"] = json.dumps({"analysis": "upbeat", "persona": "fan", "reply": "Love it!"})
+
+    async def run():
+        try:
+            return await service.generate("instagram", "New collection drops today", strategy="fused")
+        finally:
+            await service.aclose()
+
+    result = asyncio.run(run())
+    assert len(stub_calls) == 1
+    assert result == {"reply": "Love it!", "analysis": "upbeat", "persona": "fan", "strategy": "fused"}
+
+def test_invalid_fused_output_falls_back_to_chain(monkeypatch):
+    service = make_service(monkeypatch)
+    fused_content["value"] = '{"reply": "missing fields"}'
+
+    async def run():
+        try:
+            return await service.generate("instagram", "New collection drops today", strategy="fused")
+        finally:
+            await service.aclose()
+
+    result = asyncio.run(run())
+    assert result["strategy"] == "chain"
+    assert result["analysis"] == "stub completion"
+    assert len(stub_calls) == 4
+    assert service.fused_fallbacks == 1
+
+def test_direct_strategy_skips_analysis(monkeypatch):
+    service = make_service(monkeypatch)
+
+    async def run():
+        try:
+            return await service.generate_reply("twitter", "Coffee first", strategy="direct")
+        finally:
+            await service.aclose()
+
+    assert asyncio.run(run()) == "stub completion"
+    assert len(stub_calls) == 1
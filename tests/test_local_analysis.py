@@ -0,0 +1,70 @@
+import asyncio
+from app.services.llm_backends import Completion, StubBackend
+from app.services.llm_service import LLMService
+from app.services.local_analysis import LocalAnalyzer, analyze, format_analysis
+
+class CountingBackend(StubBackend):
+    def __init__(self):
+        super().__init__(latency=0)
+        self.prompts = []
+
+    async def complete(self, messages, timeout, **params) -> Completion:
+        self.prompts.append(messages[-1]["content"])
+        return await super().complete(messages, timeout, **params)
+
+def test_analyze_scores_sentiment_with_negation():
+    positive = analyze("Just launched our new product! So excited, the team did amazing work 🚀 #startup @acme")
+    assert positive["sentiment"] == "positive"
+    assert positive["confidence"] == 1.0
+    assert positive["hashtags"] == ["startup"]
+    assert positive["mentions"] == ["acme"]
+    assert positive["emojis"] == ["🚀"]
+    assert "excitement" in positive["emotions"]
+    assert positive["topics"][0] == "startup"
+    assert positive["language"] == "en"
+
+    negated = analyze("This release is not good and the app is broken again")
+    assert negated["sentiment"] == "negative"
+    assert analyze("I am not happy about this")["emotions"] == []
+
+def test_analyze_is_not_confident_outside_its_lexicon():
+    assert analyze("Reading about the history of the printing press today.")["confidence"] == 0.0
+    spanish = analyze("Estoy muy feliz con el nuevo proyecto de la empresa")
+    assert spanish["language"] == "es"
+    assert spanish["confidence"] == 0.0
+
+def test_pool_matches_inline_analysis():
+    post = "Congrats to the whole team on the launch, really proud of you all! 🎉"
+    analyzer = LocalAnalyzer(workers=1)
+
+    async def run():
+        try:
+            return await analyzer.analyze(post)
+        finally:
+            analyzer.close()
+
+    assert asyncio.run(run()) == analyze(post)
+
+def test_local_mode_skips_the_analysis_call():
+    backend = CountingBackend()
+    service = LLMService(backends=[backend], analysis_mode="local", analyzer=LocalAnalyzer(workers=0))
+    result = asyncio.run(service.generate("twitter", "Reading about the history of the printing press today."))
+    # Only persona and reply reach the LLM, with the local analysis in the persona prompt
+    assert len(backend.prompts) == 2
+    assert result["analysis"] == format_analysis(analyze("Reading about the history of the printing press today."))
+    assert result["analysis"] in backend.prompts[0]
+    assert service.analysis_sources == {"llm": 0, "local": 1}
+
+def test_hybrid_mode_falls_back_to_llm_when_unsure():
+    backend = CountingBackend()
+    service = LLMService(backends=[backend], analysis_mode="hybrid", analyzer=LocalAnalyzer(workers=0))
+
+    async def run():
+        await service.generate("twitter", "We won! Huge thanks to everyone, this is amazing 🎉")
+        await service.generate("twitter", "Reading about the history of the printing press today.")
+
+    asyncio.run(run())
+    assert service.analysis_sources == {"llm": 1, "local": 1}
+    assert len(backend.prompts) == 5
+    assert service.generation_config("chain")["analysis_mode"] == ["hybrid", 0.6]
+    assert "analysis_mode" not in service.generation_config("direct")
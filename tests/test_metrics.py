@@ -0,0 +1,39 @@
+from fastapi.testclient import TestClient
+from app.main import app
+from app.metrics import MetricsRegistry, stage_timer, stage_seconds
+
+client = TestClient(app)
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    counter = registry.counter("demo_total", "A demo counter", ("stage",))
+    histogram = registry.histogram("demo_seconds", "A demo histogram")
+    counter.inc(stage="analysis")
+    counter.inc(2, stage="analysis")
+    histogram.observe(0.2)
+
+    text = registry.render()
+    assert "# TYPE demo_total counter" in text
+    assert 'demo_total{stage="analysis"} 3' in text
+    assert 'demo_seconds_bucket{le="0.25"} 1' in text
+    assert 'demo_seconds_bucket{le="0.1"} 0' in text
+    assert "demo_seconds_count 1" in text
+
+def test_stage_timer_records_latency():
+    with stage_timer("unit_test_stage"):
+        pass
+    assert stage_seconds.counts[("unit_test_stage",)][-1] >= 1
+
+def test_metrics_endpoint_exports_request_counters():
+    client.get("/health/live")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'socialpilot_requests_total{path="/health/live",status="200"}' in response.text
+    assert "socialpilot_reply_cache_total" in response.text
+
+def test_debug_timing_headers_on_request():
+    response = client.get("/health/live", headers={"X-Debug-Timing": "1"})
+    assert "total;dur=" in response.headers["server-timing"]
+    assert response.headers["x-llm-tokens"] == "prompt=0;completion=0"
+    assert "server-timing" not in client.get("/health/live").headers
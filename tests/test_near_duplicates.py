@@ -0,0 +1,62 @@
+import asyncio
+from app.services import reply_service as reply_module
+from app.services.cache_service import ReplyCache
+from app.services.near_duplicates import NearDuplicateIndex
+
+POST = "Just launched our new AI writing assistant! Check it out and let us know what you think https://bit.ly/abc #AI"
+REPOST = "Just launched our new AI writing assistant!! Check it out and let us know what you think 🚀 https://t.co/xyz #tech"
+
+def test_index_matches_lightly_edited_repost():
+    index = NearDuplicateIndex(enabled=True)
+    index.add("twitter", POST, "Congrats on the launch!")
+    match = index.find("twitter", REPOST)
+    assert match is not None
+    assert match.reply == "Congrats on the launch!"
+    assert match.similarity == 1.0
+    # Other platforms and unrelated posts do not match
+    assert index.find("linkedin", REPOST) is None
+    assert index.find("twitter", "Our quarterly revenue grew twenty percent thanks to the sales team") is None
+    assert index.stats()["hits"] == 1
+
+def test_index_respects_threshold_and_limits():
+    index = NearDuplicateIndex(enabled=True, threshold=0.9, max_entries=2)
+    index.add("twitter", POST, "first")
+    # A real wording change falls below the threshold
+    assert index.find("twitter", "Just launched our new AI coding assistant! Check it out and tell us what you think") is None
+    # Too short to match safely
+    index.add("twitter", "gm", "gm!")
+    assert len(index) == 1
+    index.add("twitter", "Second post about something else entirely here", "second")
+    index.add("twitter", "Third post about yet another unrelated topic today", "third")
+    assert len(index) == 2
+    assert index.find("twitter", REPOST) is None
+
+def test_repost_reuses_stored_reply(monkeypatch):
+    calls = []
+
+    class FakeLLM:
+        def generation_config(self, strategy=None):
+            return {"model": "fake"}
+
+        async def generate_reply(self, platform, post_text, strategy=None):
+            calls.append(post_text)
+            return "Congrats on the launch!"
+
+    async def fake_store_reply(**doc):
+        return doc
+
+    monkeypatch.setattr(reply_module, "llm_service", FakeLLM())
+    monkeypatch.setattr(reply_module, "reply_cache", ReplyCache())
+    monkeypatch.setattr(reply_module, "store_reply", fake_store_reply)
+    service = reply_module.ReplyService(near_duplicates=NearDuplicateIndex(enabled=True))
+
+    async def run():
+        first = await service.generate_and_store_reply("twitter", POST)
+        second = await service.generate_and_store_reply("twitter", REPOST)
+        fresh = await service.generate_and_store_reply("twitter", REPOST + " again", bypass_cache=True)
+        return first, second, fresh
+
+    first, second, fresh = asyncio.run(run())
+    assert (first["cached"], second["cached"], fresh["cached"]) == (False, True, False)
+    assert second["reply"] == "Congrats on the launch!"
+    assert calls == [POST, REPOST + " again"]
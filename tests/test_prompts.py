@@ -0,0 +1,72 @@
+import asyncio
+import json
+import httpx
+from app.services import llm_service as llm_module
+from app.services.llm_service import LLMService
+from app.services.prompts import (
+    DIRECT_SYSTEM, PLATFORM_PROMPTS, compact, count_message_tokens, count_tokens, fit_messages, truncate_to_tokens
+)
+from app.services.rate_limiter import RateLimiter
+
+LONG_POST = " ".join(f"Sentence {n} about our quarterly hiring plans and team growth." for n in range(200)) + " What do you think?"
+
+def test_templates_are_compacted():
+    assert compact("""
+        First line
+            indented   
+
+        
+
+        Last line
+    """) == "First line\nindented\n\nLast line"
+    assert "  " not in DIRECT_SYSTEM["linkedin"]
+    assert PLATFORM_PROMPTS["linkedin"] in DIRECT_SYSTEM["linkedin"]
+
+def test_truncation_keeps_head_and_tail_within_budget():
+    assert truncate_to_tokens("short post", 50) == "short post"
+    truncated = truncate_to_tokens(LONG_POST, 100)
+    assert count_tokens(truncated) <= 100
+    assert truncated.startswith("Sentence 0 about")
+    assert truncated.endswith("What do you think?")
+
+def test_fit_messages_enforces_cap():
+    messages = [
+        {"role": "system", "content": "You are helpful."},
+        {"role": "user", "content": LONG_POST},
+    ]
+    fitted, truncated = fit_messages(messages, 200)
+    assert truncated
+    assert count_message_tokens(fitted) <= 200
+    assert fitted[0] == messages[0]
+    assert fit_messages(messages[:1], 200) == (messages[:1], False)
+
+def test_long_post_is_truncated_once_and_reused(monkeypatch):
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    prompts = []
+
+    def handler(request):
+        messages = json.loads(request.content)["messages"]
+        prompts.append(messages[-1]["content"])
+        return httpx.Response(200, json={
+            "id": "stub", "object": "chat.completion", "model": "stub-model",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+        })
+
+    service = LLMService(
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)),
+        limiter=RateLimiter(requests_per_minute=0, tokens_per_minute=0)
+    )
+
+    async def run():
+        try:
+            return await service.generate("linkedin", LONG_POST, strategy="chain")
+        finally:
+            await service.aclose()
+
+    asyncio.run(run())
+    analysis_prompt, persona_prompt, reply_prompt = prompts
+    shortened = truncate_to_tokens(LONG_POST, llm_module.LLM_POST_MAX_TOKENS)
+    assert shortened in analysis_prompt and shortened in reply_prompt
+    assert LONG_POST not in analysis_prompt
+    assert service.prompt_truncations == {"post": 1}
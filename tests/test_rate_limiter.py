@@ -0,0 +1,95 @@
+import asyncio
+import time
+import httpx
+import pytest
+from app.services.llm_service import LLMService
+from app.services.rate_limiter import (
+    PRIORITY_IN_FLIGHT, PRIORITY_NEW, RateLimiter, RateLimitExceeded, TokenBucket, parse_duration
+)
+
+def completion(content: str = "ok") -> dict:
+    return {
+        "id": "stub", "object": "chat.completion", "model": "stub-model",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15}
+    }
+
+def test_parse_duration_formats():
+    assert parse_duration("7.66s") == pytest.approx(7.66)
+    assert parse_duration("2m59.56s") == pytest.approx(179.56)
+    assert parse_duration("250ms") == pytest.approx(0.25)
+    assert parse_duration("3") == 3
+    assert parse_duration(None) is None
+
+def test_token_bucket_wait_time():
+    now = [0.0]
+    bucket = TokenBucket(60, clock=lambda: now[0])
+    bucket.consume(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    now[0] = 1.0
+    assert bucket.wait_time(1) == 0
+    bucket.sync(remaining=0)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+
+def test_in_flight_calls_are_admitted_first():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=0)
+    order = []
+
+    async def call(name: str, priority: int):
+        await limiter.acquire(0, priority)
+        order.append(name)
+
+    async def run():
+        # Drain the burst so later callers have to queue
+        limiter.requests.tokens = 0
+        await asyncio.gather(
+            call("new-1", PRIORITY_NEW),
+            call("new-2", PRIORITY_NEW),
+            call("in-flight", PRIORITY_IN_FLIGHT),
+        )
+
+    asyncio.run(run())
+    assert order == ["in-flight", "new-1", "new-2"]
+
+def make_service(monkeypatch, handler, max_retries=3) -> LLMService:
+    monkeypatch.setenv("GROQ_API_KEY", "test-key")
+    limiter = RateLimiter(requests_per_minute=0, tokens_per_minute=0, max_retries=max_retries, base_delay=0.01)
+    return LLMService(http_client=httpx.AsyncClient(transport=httpx.MockTransport(handler)), limiter=limiter)
+
+def test_429_is_retried_after_retry_after(monkeypatch):
+    attempts = []
+
+    def handler(request):
+        attempts.append(time.perf_counter())
+        if len(attempts) == 1:
+            return httpx.Response(429, json={"error": {"message": "slow down"}}, headers={"retry-after": "0.1"})
+        return httpx.Response(200, json=completion("after retry"), headers={"x-ratelimit-remaining-tokens": "500"})
+
+    service = make_service(monkeypatch, handler)
+
+    async def run():
+        try:
+            return await service.generate_reply("twitter", "hello", strategy="direct")
+        finally:
+            await service.aclose()
+
+    assert asyncio.run(run()) == "after retry"
+    assert attempts[1] - attempts[0] >= 0.1
+    assert service.router.backends[0].limiter.rate_limited == 1
+    assert service.router.backends[0].limiter.tokens.enabled is False
+
+def test_exhausted_retries_raise_rate_limit_exceeded(monkeypatch):
+    def handler(request):
+        return httpx.Response(429, json={"error": {"message": "slow down"}}, headers={"retry-after": "0.01"})
+
+    service = make_service(monkeypatch, handler, max_retries=1)
+
+    async def run():
+        try:
+            return await service.generate_reply("twitter", "hello", strategy="direct")
+        finally:
+            await service.aclose()
+
+    with pytest.raises(RateLimitExceeded) as error:
+        asyncio.run(run())
+    assert error.value.retry_after == pytest.approx(0.01)
@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from app import database
+from app.database import build_reply_doc
+from app.main import app
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+client = TestClient(app)
+
+@pytest.fixture
+def stored_replies(monkeypatch):
+    collection = mongomock_motor.AsyncMongoMockClient().db.replies
+    monkeypatch.setattr(database, "replies_collection", collection)
+    start = datetime(2024, 1, 1, 12, 0, 0)
+    platforms = ["twitter", "linkedin", "instagram"]
+    docs = [
+        build_reply_doc(platforms[n % 3], f"post {n}", f"reply {n}", (start + timedelta(minutes=n)).isoformat())
+        for n in range(10)
+    ]
+    # Two replies generated in the same instant must still page deterministically
+    docs.append(build_reply_doc("twitter", "post 9 again", "reply 9b", docs[9]["timestamp"]))
+    asyncio.run(collection.insert_many(docs))
+    return docs
+
+def fetch_all(**params):
+    items, cursor = [], None
+    while True:
+        response = client.get("/replies", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        page = response.json()
+        items += page["items"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return items
+
+def test_keyset_pagination_returns_every_reply_once_newest_first(stored_replies):
+    items = fetch_all(limit=3)
+    assert len(items) == 11
+    assert len({item["id"] for item in items}) == 11
+    timestamps = [item["timestamp"] for item in items]
+    assert timestamps == sorted(timestamps, reverse=True)
+
+def test_filters_and_projection(stored_replies):
+    items = fetch_all(platform="twitter", since="2024-01-01T12:03:00", fields="generated_reply", limit=2)
+    assert [item["generated_reply"] for item in items] == ["reply 9b", "reply 9", "reply 6", "reply 3"]
+    assert all(item["post_text"] is None for item in items)
+
+    response = client.get("/replies", params={"post_text": "  post   4 "})
+    assert [item["generated_reply"] for item in response.json()["items"]] == ["reply 4"]
+
+def test_rejects_unknown_fields_and_bad_cursor(stored_replies):
+    assert client.get("/replies", params={"fields": "password"}).status_code == 400
+    assert client.get("/replies", params={"cursor": "not-a-cursor"}).status_code == 400
@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.services import reply_service as reply_module
+from app.services.cache_service import ReplyCache
+
+client = TestClient(app)
+
+class FakeLLM:
+    """Stand-in for LLMService that records calls and can fail on demand."""
+
+    def __init__(self):
+        self.calls = []
+
+    def generation_config(self, strategy=None):
+        return {"model": "fake", "strategy": strategy}
+
+    async def generate_reply(self, platform: str, post_text: str, strategy=None) -> str:
+        self.calls.append((platform, post_text))
+        await asyncio.sleep(0.01)
+        if "fail" in post_text:
+            raise Exception("upstream error")
+        return f"{platform} reply to {post_text}"
+
+    async def stream_reply(self, platform: str, post_text: str, strategy=None):
+        yield "analysis", {"analysis": "positive"}
+        yield "persona", {"persona": "friendly"}
+        for token in ("Nice ", "post!"):
+            yield "token", {"token": token}
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    llm = FakeLLM()
+    writes = []
+
+    async def fake_store_replies(docs):
+        writes.append(list(docs))
+        return docs
+
+    async def fake_store_reply(**doc):
+        writes.append([doc])
+        return doc
+
+    monkeypatch.setattr(reply_module, "llm_service", llm)
+    monkeypatch.setattr(reply_module, "reply_cache", ReplyCache())
+    monkeypatch.setattr(reply_module, "store_replies", fake_store_replies)
+    monkeypatch.setattr(reply_module, "store_reply", fake_store_reply)
+    return llm, writes
+
+def test_batch_dedupes_and_keeps_order(fake_backend):
+    llm, writes = fake_backend
+    items = [
+        {"platform": "twitter", "post_text": "Hello world"},
+        {"platform": "linkedin", "post_text": "Quarterly results are in"},
+        {"platform": "twitter", "post_text": "Hello   world"},
+        {"platform": "instagram", "post_text": "please fail"},
+    ]
+    response = client.post("/reply/batch", json={"items": items, "concurrency": 2})
+    assert response.status_code == 200
+    data = response.json()
+
+    assert [r["index"] for r in data["results"]] == [0, 1, 2, 3]
+    assert data["succeeded"] == 3 and data["failed"] == 1
+    assert data["results"][0]["result"]["reply"] == data["results"][2]["result"]["reply"]
+    assert data["results"][1]["result"]["platform"] == "linkedin"
+    assert "upstream error" in data["results"][3]["error"]
+
+    # The duplicate post is generated once and all successes are written together
+    assert len(llm.calls) == 3
+    assert len(writes) == 1 and len(writes[0]) == 3
+
+def test_batch_rejects_empty_list():
+    response = client.post("/reply/batch", json={"items": []})
+    assert response.status_code == 422
+
+def test_stream_emits_events_and_stores_result(fake_backend):
+    llm, writes = fake_backend
+    response = client.post("/reply/stream", json={"platform": "twitter", "post_text": "Launch day"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = [line[len("event: "):] for line in response.text.splitlines() if line.startswith("event: ")]
+    assert events == ["start", "analysis", "persona", "token", "token", "done"]
+    assert writes == [[{
+        "platform": "twitter",
+        "post_text": "Launch day",
+        "generated_reply": "Nice post!",
+        "timestamp": writes[0][0]["timestamp"]
+    }]]
+
+def test_concurrent_identical_requests_share_one_generation(fake_backend):
+    llm, writes = fake_backend
+    service = reply_module.ReplyService(single_flight=True)
+
+    async def run():
+        return await asyncio.gather(
+            *(service.generate_and_store_reply("twitter", "Same post") for _ in range(4)),
+            service.generate_and_store_reply("linkedin", "Same post")
+        )
+
+    results = asyncio.run(run())
+    assert [r["reply"] for r in results] == ["twitter reply to Same post"] * 4 + ["linkedin reply to Same post"]
+    assert sorted(llm.calls) == [("linkedin", "Same post"), ("twitter", "Same post")]
+    # Every request is still stored
+    assert len(writes) == 5
+    assert service.flights.stats()["joined"] == 3
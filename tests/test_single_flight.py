@@ -0,0 +1,100 @@
+import asyncio
+import pytest
+from app.admission import DeadlineExceeded, deadline_scope, remaining_time
+from app.single_flight import SingleFlight
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight("test")
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.05)
+        return f"result for {key}"
+
+    async def run():
+        return await asyncio.gather(
+            *(flights.do("a", lambda: work("a")) for _ in range(5)),
+            flights.do("b", lambda: work("b"))
+        )
+
+    results = asyncio.run(run())
+    assert results == ["result for a"] * 5 + ["result for b"]
+    assert calls == ["a", "b"]
+    assert flights.stats() == {"in_flight": 0, "waiting": 0, "leaders": 2, "joined": 4, "max_fan_in": 5}
+
+def test_errors_reach_every_caller_and_key_is_released():
+    flights = SingleFlight("test")
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def run():
+        outcomes = await asyncio.gather(*(flights.do("k", failing) for _ in range(3)), return_exceptions=True)
+        # A later call starts a new flight rather than reusing the failed one
+        with pytest.raises(ValueError):
+            await flights.do("k", failing)
+        return outcomes
+
+    outcomes = asyncio.run(run())
+    assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+    assert len(calls) == 2
+
+def test_cancelled_caller_does_not_cancel_shared_work():
+    flights = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    async def run():
+        first = asyncio.ensure_future(flights.do("k", work))
+        second = asyncio.ensure_future(flights.do("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "done"
+
+def test_shared_work_outlives_the_first_callers_deadline():
+    flights = SingleFlight("test")
+    budgets = []
+
+    async def work():
+        budgets.append(remaining_time())
+        await asyncio.sleep(0.1)
+        return "shared"
+
+    async def leader():
+        with deadline_scope(0.02):
+            return await flights.do("k", work)
+
+    async def run():
+        return await asyncio.gather(leader(), flights.do("k", work), return_exceptions=True)
+
+    first, second = asyncio.run(run())
+    assert isinstance(first, DeadlineExceeded)
+    assert second == "shared"
+    assert budgets == [None]
+
+def test_shared_work_runs_until_the_latest_callers_deadline():
+    flights = SingleFlight("test")
+    budgets = []
+
+    async def work():
+        await asyncio.sleep(0.02)
+        budgets.append(remaining_time())
+        return "shared"
+
+    async def call(seconds):
+        with deadline_scope(seconds):
+            return await flights.do("k", work)
+
+    async def run():
+        return await asyncio.gather(call(0.1), call(1))
+
+    assert asyncio.run(run()) == ["shared", "shared"]
+    assert budgets[0] > 0.5
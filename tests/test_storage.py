@@ -0,0 +1,131 @@
+import asyncio
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import pytest
+from app import database
+from app.archive import archive_replies, compact_replies
+from app.database import build_reply_doc, ensure_reply_indexes, find_replies, store_replies, store_reply
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+
+POST = "Excited to share that our team just shipped the new analytics dashboard after months of work!"
+
+@pytest.fixture
+def mongo(monkeypatch):
+    client = mongomock_motor.AsyncMongoMockClient()
+    monkeypatch.setattr(database, "_client", client)
+    monkeypatch.setattr(database, "_stored_posts", OrderedDict())
+    return client[database.DATABASE_NAME]
+
+@pytest.fixture
+def compact(monkeypatch, mongo):
+    monkeypatch.setattr(database, "REPLY_STORAGE_FORMAT", "compact")
+    return mongo
+
+def test_compact_replies_share_one_post_body(compact):
+    variants = [{"reply": "Congrats!", "score": 0.9}, {"reply": "Well done", "score": 0.7}]
+
+    async def run():
+        await store_reply("linkedin", POST, "Congrats!", "2024-01-01T12:00:00", variants=variants)
+        await store_replies([
+            build_reply_doc("linkedin", "  " + POST, "Great work", "2024-01-01T12:01:00"),
+            build_reply_doc("twitter", "Short post", "Nice", "2024-01-01T12:02:00"),
+        ])
+        first = await find_replies(limit=2)
+        second = await find_replies(limit=2, cursor=first["next_cursor"])
+        same_post = await find_replies(post_text=POST, fields=["generated_reply"])
+        since = await find_replies(since=datetime(2024, 1, 1, 12, 1))
+        stored = await compact.replies.find_one({"r": "Congrats!"})
+        return first, second, same_post, since, stored, await compact.posts.count_documents({})
+
+    first, second, same_post, since, stored, posts = asyncio.run(run())
+    assert posts == 2
+    assert set(stored) == {"_id", "p", "h", "r", "t", "v"}
+    assert isinstance(stored["t"], datetime)
+    assert [item["generated_reply"] for item in first["items"] + second["items"]] == ["Nice", "Great work", "Congrats!"]
+    assert second["next_cursor"] is None
+    oldest = second["items"][-1]
+    assert oldest["post_text"] == POST
+    assert oldest["timestamp"] == "2024-01-01T12:00:00"
+    assert oldest["variants"] == variants
+    assert [item["generated_reply"] for item in same_post["items"]] == ["Great work", "Congrats!"]
+    assert set(same_post["items"][0]) == {"id", "generated_reply"}
+    assert len(since["items"]) == 2
+
+def test_posts_expire_after_their_newest_reply(compact, monkeypatch):
+    monkeypatch.setattr(database, "REPLY_TTL_DAYS", 30)
+    monkeypatch.setattr(database, "STORED_POSTS_TTL", 0)
+    later = datetime.utcnow().replace(microsecond=0)
+    earlier = later - timedelta(days=2)
+
+    async def run():
+        await ensure_reply_indexes()
+        await store_reply("linkedin", POST, "Later", later.isoformat())
+        await store_reply("linkedin", POST, "Earlier", earlier.isoformat())
+        post = await compact.posts.find_one({})
+        indexes = await compact.posts.index_information()
+        return post, indexes
+
+    post, indexes = asyncio.run(run())
+    assert post["x"] == POST
+    assert post["t"] == later
+    assert indexes["post_ttl"]["expireAfterSeconds"] == 30 * 86400
+
+def test_archive_moves_aged_replies_to_parquet(compact, tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    old = datetime.utcnow() - timedelta(days=40)
+    recent = datetime.utcnow() - timedelta(days=1)
+
+    async def run():
+        await store_replies([
+            build_reply_doc("twitter", "Old post about nothing in particular", "Old reply", old.isoformat()),
+            build_reply_doc("linkedin", POST, "Old congrats", (old + timedelta(minutes=1)).isoformat()),
+            build_reply_doc("linkedin", POST, "New congrats", recent.isoformat()),
+        ])
+        stats = await archive_replies(str(tmp_path), timedelta(days=30), chunk_size=1)
+        remaining = await find_replies()
+        return stats, remaining, await compact.posts.count_documents({})
+
+    stats, remaining, posts = asyncio.run(run())
+    assert stats == {"replies": 2, "files": 2}
+    assert [item["generated_reply"] for item in remaining["items"]] == ["New congrats"]
+    # The old post is gone, the post still referenced by a recent reply is kept
+    assert posts == 1
+    frame = pd.concat(pd.read_parquet(path) for path in sorted(tmp_path.glob("*.parquet")))
+    assert list(frame["generated_reply"]) == ["Old reply", "Old congrats"]
+    assert list(frame["post_text"]) == ["Old post about nothing in particular", POST]
+
+def test_archive_chunk_with_mixed_timestamp_precision(compact, tmp_path):
+    pd = pytest.importorskip("pandas")
+    pytest.importorskip("pyarrow")
+    old = (datetime.utcnow() - timedelta(days=40)).replace(microsecond=123000)
+    whole_second = (old + timedelta(minutes=1)).replace(microsecond=0)
+
+    async def run():
+        await store_replies([
+            build_reply_doc("twitter", "Post with microseconds", "First", old.isoformat()),
+            build_reply_doc("twitter", "Post without them", "Second", whole_second.isoformat()),
+        ])
+        return await archive_replies(str(tmp_path), timedelta(days=30), chunk_size=10)
+
+    assert asyncio.run(run()) == {"replies": 2, "files": 1}
+    frame = pd.read_parquet(next(tmp_path.glob("*.parquet")))
+    assert list(frame["timestamp"]) == [pd.Timestamp(old), pd.Timestamp(whole_second)]
+
+def test_compact_migration_keeps_every_reply(mongo, monkeypatch):
+    docs = [
+        build_reply_doc("twitter", f"post {n}", f"reply {n}", f"2024-01-01T12:0{n}:00")
+        for n in range(5)
+    ]
+
+    async def run():
+        await mongo.replies.insert_many(docs)
+        before = await find_replies()
+        converted = await compact_replies(chunk_size=2)
+        monkeypatch.setattr(database, "REPLY_STORAGE_FORMAT", "compact")
+        return before, converted, await find_replies()
+
+    before, converted, after = asyncio.run(run())
+    assert converted == 5
+    assert after == before
@@ -0,0 +1,88 @@
+import asyncio
+import json
+from app.services import reply_service as reply_module
+from app.services.cache_service import ReplyCache
+from app.services.llm_backends import Completion, StubBackend, Usage
+from app.services.llm_service import LLMService
+from app.services.local_analysis import LocalAnalyzer
+from app.services.ranking import rank_replies, score_reply
+
+POST = "We just opened our second office in Berlin!"
+
+class VariantsBackend(StubBackend):
+    def __init__(self, replies):
+        super().__init__(latency=0)
+        self.replies = replies
+        self.calls = []
+
+    async def complete(self, messages, timeout, **params) -> Completion:
+        self.calls.append(params)
+        if params.get("response_format"):
+            return Completion(json.dumps({"replies": self.replies}), Usage(10, 10))
+        return Completion("stage output", Usage(10, 2))
+
+def test_score_penalizes_length_density_and_repetition():
+    good = "Congrats on the Berlin office, what a milestone for the team 🎉"
+    assert score_reply("twitter", good, POST) > 0.9
+    assert score_reply("twitter", "x" * 300, POST) < 0.5
+    assert score_reply("twitter", good + " 🎉🎉🎉🎉", POST) < score_reply("twitter", good, POST)
+    assert score_reply("twitter", good + " #a #b #c #d", POST) < score_reply("twitter", good, POST)
+    assert score_reply("twitter", "so happy for you, so happy for you, so happy for you", POST) < 0.8
+    assert score_reply("twitter", "We just opened our second office in Berlin too", POST) < score_reply("twitter", good, POST)
+
+def test_rank_sinks_near_copies():
+    first = "Huge congrats on the Berlin office, the team earned it"
+    copy = "Huge congrats on the Berlin office, the team earned it!"
+    other = "Berlin is a great pick, looking forward to visiting the new space"
+    ranked = rank_replies("twitter", POST, [first, copy, other])
+    assert [item["reply"] for item in ranked] == [first, other, copy]
+    assert ranked[0]["score"] >= ranked[1]["score"] >= ranked[2]["score"]
+
+def test_variants_share_analysis_and_persona():
+    backend = VariantsBackend([
+        "Congrats on the new Berlin office! 🎉",
+        "x" * 400,
+        "",
+        "congrats on the new berlin office! 🎉",
+        "Berlin is a great choice, enjoy the new space",
+    ])
+    service = LLMService(backends=[backend], analyzer=LocalAnalyzer(workers=0), analysis_mode="llm")
+    result = asyncio.run(service.generate_variants("twitter", POST, 4, "chain"))
+    # analysis, persona and a single variants completion
+    assert len(backend.calls) == 3
+    assert backend.calls[-1]["max_tokens"] == 4 * 150 + 50
+    replies = [item["reply"] for item in result["variants"]]
+    assert len(replies) == 3
+    assert replies[-1] == "x" * 400
+    assert result["analysis"] == "stage output"
+
+def test_reply_endpoint_stores_all_variants_in_one_document(monkeypatch):
+    stored = []
+
+    class FakeLLM:
+        def generation_config(self, strategy=None, variants=1):
+            return {"model": "fake", "variants": variants}
+
+        async def generate_variants(self, platform, post_text, count, strategy=None):
+            return {"variants": [{"reply": f"reply {i}", "score": 1 - i / 10} for i in range(count)]}
+
+    async def fake_store_reply(**doc):
+        stored.append(doc)
+        return doc
+
+    monkeypatch.setattr(reply_module, "llm_service", FakeLLM())
+    monkeypatch.setattr(reply_module, "reply_cache", ReplyCache())
+    monkeypatch.setattr(reply_module, "store_reply", fake_store_reply)
+    service = reply_module.ReplyService()
+
+    async def run():
+        first = await service.generate_and_store_reply("twitter", POST, variants=3)
+        second = await service.generate_and_store_reply("twitter", POST, variants=3)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first["reply"] == "reply 0"
+    assert [item["reply"] for item in first["variants"]] == ["reply 0", "reply 1", "reply 2"]
+    assert second["cached"] is True
+    assert len(stored) == 2
+    assert stored[0]["variants"] == first["variants"]
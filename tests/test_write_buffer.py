@@ -0,0 +1,127 @@
+import asyncio
+import os
+import subprocess
+import sys
+from bson import json_util
+from app import write_buffer
+from app.write_buffer import WriteBehindBuffer
+
+class FakeCollection:
+    """In-memory collection that can be switched to fail like an unreachable Mongo."""
+
+    def __init__(self):
+        self.batches = []
+        self.available = True
+
+    async def insert_many(self, docs, ordered=True):
+        if not self.available:
+            raise ConnectionError("Mongo unreachable")
+        self.batches.append(list(docs))
+
+    @property
+    def docs(self):
+        return [doc for batch in self.batches for doc in batch]
+
+def test_buffer_batches_by_size_and_flushes_on_stop(tmp_path):
+    collection = FakeCollection()
+    buffer = WriteBehindBuffer(collection, batch_size=10, flush_interval=5, spill_path=str(tmp_path / "spill.jsonl"))
+
+    async def run():
+        await buffer.start()
+        await buffer.put_many([{"n": i} for i in range(25)])
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert [len(batch) for batch in collection.batches] == [10, 10, 5]
+    assert [doc["n"] for doc in collection.docs] == list(range(25))
+
+def test_buffer_flushes_after_interval(tmp_path):
+    collection = FakeCollection()
+    buffer = WriteBehindBuffer(collection, batch_size=100, flush_interval=0.05, spill_path=str(tmp_path / "spill.jsonl"))
+
+    async def run():
+        await buffer.start()
+        await buffer.put({"n": 1})
+        await asyncio.sleep(0.2)
+        flushed = len(collection.docs)
+        await buffer.stop()
+        return flushed
+
+    assert asyncio.run(run()) == 1
+
+def test_buffer_spills_when_mongo_is_down_and_replays(tmp_path):
+    spill_path = tmp_path / "spill.jsonl"
+    collection = FakeCollection()
+    collection.available = False
+    buffer = WriteBehindBuffer(collection, batch_size=10, flush_interval=0.01, spill_path=str(spill_path))
+
+    async def outage():
+        await buffer.start()
+        await buffer.put_many([{"n": i} for i in range(3)])
+        await buffer.stop()
+
+    asyncio.run(outage())
+    assert collection.docs == []
+    assert buffer.spilled == 3
+    # Each process spills to a file of its own
+    assert os.path.exists(buffer.own_spill_path)
+
+    # Once Mongo is back, the next start writes the spilled documents
+    collection.available = True
+    restarted = WriteBehindBuffer(collection, batch_size=10, flush_interval=0.01, spill_path=str(spill_path))
+
+    async def recovery():
+        await restarted.start()
+        await restarted.stop()
+
+    asyncio.run(recovery())
+    assert sorted(doc["n"] for doc in collection.docs) == [0, 1, 2]
+    assert list(tmp_path.iterdir()) == []
+
+def test_writer_survives_spill_file_vanishing_before_replay(tmp_path, monkeypatch):
+    spill_path = tmp_path / "spill.jsonl"
+    collection = FakeCollection()
+    buffer = WriteBehindBuffer(collection, batch_size=1, flush_interval=0.01, max_queue=1, spill_path=str(spill_path))
+
+    def vanishing_open(path, mode="r", **kwargs):
+        if mode == "r":
+            # Another replay took the file just before it was read
+            os.remove(path)
+        return open(path, mode, **kwargs)
+
+    monkeypatch.setattr(write_buffer, "open", vanishing_open, raising=False)
+
+    async def run():
+        await buffer.start()
+        with open(buffer.own_spill_path, "w") as f:
+            f.write(json_util.dumps({"n": -1}) + "\n")
+        await buffer.put_many([{"n": i} for i in range(5)])
+        await buffer.stop()
+
+    asyncio.run(asyncio.wait_for(run(), 2))
+    assert [doc["n"] for doc in collection.docs] == list(range(5))
+
+def test_start_replays_only_files_of_exited_processes(tmp_path):
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    running = os.getppid()
+    files = {
+        "spill.jsonl": 1,  # shared file of earlier versions
+        f"spill.{exited.pid}.jsonl": 2,
+        f"spill.{exited.pid}.0a1b.replay": 3,  # its replay was interrupted
+        f"spill.{running}.jsonl": 4,
+    }
+    for name, n in files.items():
+        (tmp_path / name).write_text(json_util.dumps({"n": n}) + "\n")
+    collection = FakeCollection()
+    buffer = WriteBehindBuffer(collection, spill_path=str(tmp_path / "spill.jsonl"))
+
+    async def run():
+        await buffer.start()
+        await buffer.stop()
+
+    asyncio.run(run())
+    assert sorted(doc["n"] for doc in collection.docs) == [1, 2, 3]
+    assert buffer.replayed == 3
+    # The running process replays its own file
+    assert [path.name for path in tmp_path.iterdir()] == [f"spill.{running}.jsonl"]